@@ -0,0 +1,73 @@
+"""Compare the exact kernel OneClassSVM with the approximate (kernel map + SGD) backend.
+
+Usage: python -m benchmarks.one_class_svm --sizes 1000 10000 100000
+"""
+import argparse
+import json
+import time
+import numpy as np
+from sklearn.metrics import precision_score, recall_score
+from src.data_generator import SyntheticDataGenerator
+from src.anomaly_detector import AnomalyDetector
+from src.detectors.one_class_svm import OneClassSVMDetector
+from config import settings
+
+def run_backend(backend, data, truth):
+    settings.ONE_CLASS_SVM_BACKEND = backend
+    processed = AnomalyDetector(ensemble=[]).preprocess_data(data, fit=True)
+
+    start = time.perf_counter()
+    model = OneClassSVMDetector().fit(processed, data).model
+    fit_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    flags = model.predict(processed) == -1
+    score_seconds = time.perf_counter() - start
+
+    return flags, {
+        'backend': backend,
+        'rows': len(data),
+        'fit_seconds': round(fit_seconds, 4),
+        'score_seconds': round(score_seconds, 4),
+        'flagged': int(flags.sum()),
+        'precision': round(precision_score(truth, flags, zero_division=0), 4),
+        'recall': round(recall_score(truth, flags, zero_division=0), 4)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--exact-max-rows', type=int, default=100000,
+                        help='Skip the exact backend above this size (it is super-linear)')
+    parser.add_argument('--output', help='Optional JSON file for the results')
+    args = parser.parse_args()
+
+    backend = settings.ONE_CLASS_SVM_BACKEND
+    results = []
+    try:
+        for size in args.sizes:
+            generator = SyntheticDataGenerator()
+            generator.size = size
+            data = generator.generate_data()
+            # Ground truth for the metric detectors: the injected cpu/latency spikes
+            truth = ((data['cpu_usage'] > 90) | (data['latency'] > 500)).to_numpy()
+
+            approx_flags, approx = run_backend('approximate', data, truth)
+            if size <= args.exact_max_rows:
+                exact_flags, exact = run_backend('exact', data, truth)
+                approx['agreement_with_exact'] = round(float(np.mean(approx_flags == exact_flags)), 4)
+                results.append(exact)
+            results.append(approx)
+    finally:
+        settings.ONE_CLASS_SVM_BACKEND = backend
+
+    for row in results:
+        print(json.dumps(row))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=4)
+
+
+if __name__ == '__main__':
+    main()
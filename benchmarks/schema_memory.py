@@ -0,0 +1,61 @@
+"""Compare the memory of the compact MELT schema with the previous object-column layout.
+
+Usage: python -m benchmarks.schema_memory --sizes 1000 100000 1000000
+"""
+import argparse
+import json
+import pandas as pd
+from src.data_generator import SyntheticDataGenerator
+from src import schema
+
+
+def legacy_layout(df):
+    # The layout before the compact schema: object strings, float64 metrics,
+    # "trace_{i}"/"span_{i}" ids and a rendered message on every row
+    return pd.DataFrame({
+        'timestamp': df['timestamp'].astype(str),
+        'service': df['service'].astype(str).astype(object),
+        'log_level': df['log_level'].astype(str).astype(object),
+        'message': schema.render_messages(df),
+        'cpu_usage': df['cpu_usage'].astype('float64'),
+        'latency': df['latency'].astype('float64'),
+        'trace_id': 'trace_' + df['trace_id'].astype(str),
+        'span_id': ('span_' + df['span_id'].astype(str)).where(df['span_id'].notna(), None),
+        'event_type': df['event_type'].astype(str).astype(object)
+    })
+
+
+def measure(size, seed):
+    generator = SyntheticDataGenerator(seed=seed)
+    generator.size = size
+    compact = generator.generate_data()
+    legacy = legacy_layout(compact)
+    compact_bytes = int(compact.memory_usage(deep=True, index=False).sum())
+    legacy_bytes = int(legacy.memory_usage(deep=True, index=False).sum())
+    return {
+        'rows': size,
+        'legacy_mb': round(legacy_bytes / 2 ** 20, 2),
+        'compact_mb': round(compact_bytes / 2 ** 20, 2),
+        'legacy_bytes_per_row': round(legacy_bytes / size, 1),
+        'compact_bytes_per_row': round(compact_bytes / size, 1),
+        'reduction': round(legacy_bytes / compact_bytes, 1)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 100000, 1000000])
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='Optional JSON file for the results')
+    args = parser.parse_args()
+
+    results = [measure(size, args.seed) for size in args.sizes]
+    for row in results:
+        print(json.dumps(row))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=4)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,331 @@
+"""Benchmark each pipeline stage in isolation and compare against a stored baseline.
+
+Every (stage, size) pair runs in a fresh spawned process with fixed seeds, so import
+costs, caches and peak RSS of one stage never leak into another. Stages:
+
+  generate  SyntheticDataGenerator chunks
+  sqs       enqueue/dequeue through SQSHandler (in-memory queue unless --sqs-queue is given)
+  detector  each AnomalyDetector plugin, fit and score measured separately
+  executor  the fitted ensemble scored under each DETECTOR_EXECUTOR (serial, thread, process)
+  shards    the ensemble scored by a ShardedDetector with 1, 2 and one shard per core (--shards)
+  llm       LLMCandidateGenerator in mock mode on the rows with injected anomalies
+
+Usage: python -m benchmarks.suite --sizes 1000 100000 1000000 --output results.json
+       python -m benchmarks.suite --baseline benchmarks/baseline.json --update-baseline
+"""
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import random
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+import numpy as np
+import psutil
+from config import settings
+
+STAGES = ('generate', 'sqs', 'detector', 'executor', 'shards', 'llm')
+# Lower is better for these metrics; throughput is higher-is-better
+LOWER_IS_BETTER = ('latency_p95_ms', 'peak_rss_delta_mb')
+
+class PeakRSS:
+    # Samples this process's RSS on a background thread; the peak is taken over the
+    # measured section only, unlike a single sample after the work has finished
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.process = psutil.Process()
+        self.start = self.peak = self.process.memory_info().rss
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+
+    def _sample(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, self.process.memory_info().rss)
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self.start = self.peak = self.process.memory_info().rss
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, self.process.memory_info().rss)
+
+class Measurement:
+    # Wall time, per-operation latencies and peak RSS of one benchmarked step
+    def __init__(self, stage, name, rows):
+        self.stage, self.name, self.rows = stage, name, rows
+        self.latencies = []
+        self.seconds = 0.0
+        self.memory = None
+
+    @contextmanager
+    def run(self):
+        with PeakRSS() as memory:
+            start = time.perf_counter()
+            yield self
+            self.seconds = time.perf_counter() - start
+        self.memory = memory
+
+    @contextmanager
+    def op(self):
+        start = time.perf_counter()
+        yield
+        self.latencies.append(time.perf_counter() - start)
+
+    def record(self):
+        latencies = np.array(self.latencies or [self.seconds]) * 1000
+        return {
+            'stage': self.stage,
+            'name': self.name,
+            'rows': self.rows,
+            'ops': len(self.latencies),
+            'seconds': round(self.seconds, 4),
+            'throughput_rows_per_s': round(self.rows / self.seconds, 1) if self.seconds > 0 else None,
+            'latency_p50_ms': round(float(np.percentile(latencies, 50)), 3),
+            'latency_p95_ms': round(float(np.percentile(latencies, 95)), 3),
+            'latency_p99_ms': round(float(np.percentile(latencies, 99)), 3),
+            'peak_rss_mb': round(self.memory.peak / 2 ** 20, 1),
+            'peak_rss_delta_mb': round((self.memory.peak - self.memory.start) / 2 ** 20, 1)
+        }
+
+def seed_everything(seed):
+    random.seed(seed)
+    np.random.seed(seed)
+    if 'tensorflow' in sys.modules:
+        sys.modules['tensorflow'].keras.utils.set_random_seed(seed)
+
+def make_data(rows, seed):
+    from src.data_generator import SyntheticDataGenerator
+    generator = SyntheticDataGenerator(seed=seed)
+    generator.size = rows
+    return generator
+
+def bench_generate(rows, options):
+    generator = make_data(rows, options['seed'])
+    measurement = Measurement('generate', 'generate', rows)
+    with measurement.run():
+        chunks = generator.generate_chunks()
+        for _ in range(math.ceil(rows / settings.CHUNK_SIZE)):
+            with measurement.op():
+                next(chunks)
+    return [measurement.record()]
+
+def bench_sqs(rows, options):
+    from src.sqs_handler import SQSHandler
+    chunks = list(make_data(rows, options['seed']).generate_chunks())
+    sqs = SQSHandler()
+    if options['sqs_queue']:
+        sqs.create_queue(options['sqs_queue'])
+    else:
+        # In-memory fallback queue: measures the handler, not the network
+        sqs.queue_url, sqs.messages = None, deque()
+
+    enqueue = Measurement('sqs', 'sqs.enqueue', rows)
+    with enqueue.run():
+        for chunk in chunks:
+            with enqueue.op():
+                sqs.send_frame(chunk)
+
+    dequeue = Measurement('sqs', 'sqs.dequeue', rows)
+    received = 0
+    with dequeue.run():
+        while received < rows:
+            with dequeue.op():
+                messages = sqs.receive_messages(max_messages=settings.SQS_MAX_MESSAGES, wait_time_seconds=0)
+                sqs.delete_messages_batch(messages)
+                # Decoding is part of dequeuing; packed messages carry many records each
+                records = len(sqs.to_frame(messages))
+            if not messages:
+                break
+            received += records
+    return [enqueue.record(), dequeue.record()]
+
+def bench_detector(rows, options):
+    from src.anomaly_detector import AnomalyDetector
+    from src.detectors import get_detector_class
+    data = make_data(rows, options['seed']).generate_data()
+    reference = data.iloc[:settings.FIT_WINDOW_SIZE]
+    scaler = AnomalyDetector(ensemble=[])
+    processed_reference = scaler.preprocess_data(reference, fit=True)
+    processed = scaler.preprocess_data(data)
+
+    records = []
+    for name in options['detectors']:
+        plugin = get_detector_class(name)
+        seed_everything(options['seed'])
+
+        fit = Measurement('detector', f'{name}.fit', len(reference))
+        with fit.run():
+            with fit.op():
+                detector = plugin().fit(processed_reference, reference)
+
+        score = Measurement('detector', f'{name}.score', rows)
+        with score.run():
+            for start in range(0, rows, settings.CHUNK_SIZE):
+                with score.op():
+                    detector.score(processed[start:start + settings.CHUNK_SIZE], data.iloc[start:start + settings.CHUNK_SIZE])
+        records.extend([fit.record(), score.record()])
+    return records
+
+def bench_executor(rows, options):
+    # The whole ensemble, fitted once, scored chunk by chunk under each DETECTOR_EXECUTOR
+    from src.anomaly_detector import AnomalyDetector
+    data = make_data(rows, options['seed']).generate_data()
+    detector = AnomalyDetector(ensemble=options['detectors'], min_votes=1).fit(data.iloc[:settings.FIT_WINDOW_SIZE])
+    records = []
+    try:
+        for mode in ('serial', 'thread', 'process'):
+            settings.DETECTOR_EXECUTOR = mode
+            # Worker start-up is paid once per run, not per batch, so it is kept out of the timing
+            detector.score(data.iloc[:10])
+            measurement = Measurement('executor', f'ensemble.score.{mode}', rows)
+            with measurement.run():
+                for start in range(0, rows, settings.CHUNK_SIZE):
+                    with measurement.op():
+                        detector.score(data.iloc[start:start + settings.CHUNK_SIZE])
+            detector.close()
+            records.append(measurement.record())
+    finally:
+        detector.close()
+    return records
+
+def bench_shards(rows, options):
+    # Throughput of the sharded detector as shard processes are added, keyed by service
+    from src.sharding import ShardedDetector
+    data = make_data(rows, options['seed']).generate_data()
+    records = []
+    for n_shards in options['shards']:
+        detector = ShardedDetector(n_shards, key='service', ensemble=options['detectors'], min_votes=1)
+        try:
+            detector.fit(data.iloc[:settings.FIT_WINDOW_SIZE])
+            # Shard processes import and warm up their detectors outside the timing
+            detector.score(data.iloc[:10])
+            measurement = Measurement('shards', f'sharded.score.{n_shards}', rows)
+            with measurement.run():
+                for start in range(0, rows, settings.CHUNK_SIZE):
+                    with measurement.op():
+                        detector.score(data.iloc[start:start + settings.CHUNK_SIZE])
+            records.append(measurement.record())
+        finally:
+            detector.close()
+    return records
+
+def bench_llm(rows, options):
+    from src import schema
+    from src.llm_candidate import LLMCandidateGenerator
+    # Mock provider and no persistent cache, so runs are offline and independent of each other
+    settings.LLM_PROVIDER = 'mock'
+    settings.LLM_CACHE_PATH = None
+    generator = LLMCandidateGenerator()
+    batches = []
+    for chunk in make_data(rows, options['seed']).generate_chunks():
+        anomalous = (
+            chunk['log_level'].isin(['ERROR', 'FATAL'])
+            | (chunk['cpu_usage'] > 90)
+            | (chunk['latency'] > 500)
+            | chunk['span_id'].isna()
+        )
+        batches.append(schema.to_records(chunk[anomalous].assign(id=chunk.index[anomalous.to_numpy()])))
+
+    measurement = Measurement('llm', 'llm.generate_candidates', sum(len(batch) for batch in batches))
+    try:
+        with measurement.run():
+            for batch in batches:
+                with measurement.op():
+                    generator.generate_candidates(batch)
+    finally:
+        generator.close()
+    return [measurement.record()]
+
+BENCHMARKS = {
+    'generate': bench_generate,
+    'sqs': bench_sqs,
+    'detector': bench_detector,
+    'executor': bench_executor,
+    'shards': bench_shards,
+    'llm': bench_llm
+}
+
+def run_stage(stage, rows, options):
+    seed_everything(options['seed'])
+    return BENCHMARKS[stage](rows, options)
+
+def run_isolated(stage, rows, options):
+    # A fresh interpreter per stage and size; spawn, not fork, so nothing is inherited
+    # (not a multiprocessing.Pool: its daemonic workers cannot start the detector process pool)
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as pool:
+        return pool.submit(run_stage, stage, rows, options).result()
+
+def compare(results, baseline, tolerance):
+    # A metric regresses when it is worse than the baseline by more than tolerance (a fraction)
+    previous = {(r['stage'], r['name'], r['rows']): r for r in baseline}
+    regressions = []
+    for record in results:
+        base = previous.get((record['stage'], record['name'], record['rows']))
+        if base is None:
+            continue
+        for metric in ('throughput_rows_per_s',) + LOWER_IS_BETTER:
+            old, new = base.get(metric), record.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            if (metric in LOWER_IS_BETTER and change > tolerance) or (metric not in LOWER_IS_BETTER and -change > tolerance):
+                regressions.append({
+                    'stage': record['stage'], 'name': record['name'], 'rows': record['rows'],
+                    'metric': metric, 'baseline': old, 'current': new, 'change': round(change, 4)
+                })
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 100000, 1000000])
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=list(STAGES))
+    parser.add_argument('--detectors', nargs='+', default=list(settings.DETECTOR_ENSEMBLE),
+                        help='Detector plugins to fit and score (default: DETECTOR_ENSEMBLE)')
+    parser.add_argument('--shards', type=int, nargs='+', default=sorted({1, 2, os.cpu_count() or 1}),
+                        help='Shard counts for the shards stage (default: 1, 2 and one per core)')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--sqs-queue', help='Benchmark a real SQS queue instead of the in-memory fallback')
+    parser.add_argument('--in-process', action='store_true', help='Run stages in this process (no isolation)')
+    parser.add_argument('--output', help='Optional JSON file for the results')
+    parser.add_argument('--baseline', default=os.path.join(os.path.dirname(__file__), 'baseline.json'))
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Allowed fractional slowdown before flagging')
+    parser.add_argument('--update-baseline', action='store_true', help='Store these results as the new baseline')
+    args = parser.parse_args()
+
+    options = {'seed': args.seed, 'detectors': args.detectors, 'sqs_queue': args.sqs_queue, 'shards': args.shards}
+    run = run_stage if args.in_process else run_isolated
+    results = []
+    for size in args.sizes:
+        for stage in args.stages:
+            for record in run(stage, size, options):
+                print(json.dumps(record))
+                results.append(record)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=4)
+    if args.update_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=4)
+        return 0
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}; run with --update-baseline to record one")
+        return 0
+
+    with open(args.baseline) as f:
+        regressions = compare(results, json.load(f), args.tolerance)
+    for regression in regressions:
+        print(f"REGRESSION {json.dumps(regression)}")
+    return 1 if regressions else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -4,18 +4,71 @@ import os
 DATA_SIZE = 1000  # Number of records to generate
 ERROR_RATE = 0.1   # Rate of error logs
 ANOMALY_RATE = 0.1 # Rate of metric anomalies
+SPANS_PER_TRACE = 4  # Consecutive records (spans of randomly chosen services) that share a trace_id
+SPAN_DROP_RATE = 0.1  # Share of spans dropped (span_id missing); a dropped span breaks its whole trace
+RANDOM_SEED = int(os.getenv("RANDOM_SEED", "42"))  # Seed for the synthetic data generator
+DATA_FORMAT = os.getenv("DATA_FORMAT", "parquet")  # Generated data: "parquet", "arrow" (partitioned) or "csv"
+DATA_INPUT_PATH = os.getenv("DATA_INPUT_PATH")  # Replay an existing dataset instead of generating one
+PARQUET_COMPRESSION = "zstd"
 
 # SQS settings
 SQS_QUEUE_NAME = "anomaly-detection-queue"
 SQS_MAX_MESSAGES = 10
 SQS_VISIBILITY_TIMEOUT = 30
+SQS_WAIT_TIME_SECONDS = 20  # Long polling wait per receive (0-20 seconds)
+SQS_BATCH_MAX_RETRIES = 3  # Retries for entries that fail inside a batch call
+SQS_BATCH_RETRY_BACKOFF = 0.2  # Base backoff in seconds, doubled per retry
+SQS_BACKEND = os.getenv("SQS_BACKEND", "sqs")  # "sqs" (boto3) or "local" (SQLite file shared by processes)
+LOCAL_QUEUE_PATH = os.getenv("LOCAL_QUEUE_PATH", "outputs/queue.db")  # Store for the local backend
+SQS_MAX_RECEIVE_COUNT = None  # Receives before a message moves to "<queue>-dlq"; None disables redrive
+SQS_MESSAGE_GROUP_KEY = "service"  # FIFO group per "service", per "trace_id" hash bucket, or None for one group
+SQS_MESSAGE_GROUPS = 16  # Hash buckets when grouping by trace_id
+SQS_PAYLOAD_FORMAT = "arrow"  # "arrow" packs many records per message as compressed columns; "json" sends one per message
+SQS_RECORDS_PER_MESSAGE = 1000  # Upper bound per packed message; the 256 KB message limit may lower it
+CONSUMER_WORKERS = 4  # Concurrent receive -> detect -> delete loops
+CONSUMER_BATCH_SIZE = 10  # Messages a worker gathers before scoring them together (packed: up to 10k records)
+CONSUMER_POLL_SECONDS = 1  # Long-poll wait per receive; also bounds how long shutdown takes
 
 # Model settings
 Z_SCORE_THRESHOLD = 3.0
 ISOLATION_FOREST_CONTAMINATION = 0.01
 ONE_CLASS_SVM_NU = 0.01
+ONE_CLASS_SVM_BACKEND = "exact"  # "exact" (kernel OneClassSVM) or "approximate" (linear time)
+ONE_CLASS_SVM_KERNEL_APPROXIMATION = "nystroem"  # "nystroem" or "rff" (random Fourier features)
+ONE_CLASS_SVM_N_COMPONENTS = 100  # Dimension of the approximate kernel feature map
+ONE_CLASS_SVM_BATCH_SIZE = 100000  # Mini-batch size for partial_fit; None fits in one pass
 LSTM_EPOCHS = 10
 LSTM_BATCH_SIZE = 64
+LSTM_WINDOW_SIZE = 10  # Records per service in each sliding window
+
+# Online (streaming) statistical detector settings
+ONLINE_DETECTOR_ENABLED = False  # Adds the per-service streaming z-score detector ("online_statistical") to the ensemble
+ONLINE_STATS_MODE = "welford"  # "welford" (all history), "ewma" or "window"
+ONLINE_EWMA_ALPHA = 0.01  # Weight of the newest record in "ewma" mode
+ONLINE_WINDOW_SIZE = 1000  # Records per service kept in "window" mode
+ONLINE_MIN_COUNT = 30  # Records a service needs before it can be flagged
+TRACE_DETECTOR_ENABLED = False  # Adds the trace index ("trace_index": missing spans, broken traces) to the ensemble
+TRACE_TTL_SECONDS = 300  # Event-time idle period after which a trace is considered complete and evicted
+TRACE_INDEX_MAX_TRACES = 100000  # Open traces kept in memory; least recently updated are evicted first
+
+# Detector execution settings
+DETECTOR_ENSEMBLE = ["isolation_forest", "one_class_svm", "lstm_autoencoder", "statistical"]  # Plugins in src/detectors; only these are imported
+DETECTOR_MIN_VOTES = 2  # Detectors that must flag a record; capped at the ensemble size
+DECISIVE_DETECTORS = ["trace_index"]  # Detectors whose flag alone marks a record, whatever DETECTOR_MIN_VOTES
+DETECTOR_EXECUTOR = "thread"  # "thread", "process" or "serial"
+DETECTOR_WORKERS = 4  # Thread pool size; one worker per detector runs them all concurrently. "process" always runs one process per detector
+DETECTOR_TIMEOUT = 60  # Seconds a detector may take per batch before it abstains; None waits forever
+DETECTOR_TIMEOUTS = {}  # Per-detector overrides, e.g. {"lstm_autoencoder": 120}
+DETECTOR_CASCADE = False  # Score expensive detectors only on rows the cheaper stages leave undecided
+CASCADE_STAGES = [["statistical", "isolation_forest"], ["one_class_svm"], ["lstm_autoencoder"]]
+CASCADE_SCREEN_Z = None  # If set, rows with no votes and max |z| below it skip the later stages (approximate)
+DETECTOR_SHARDS = 1  # Worker processes for sharded detection; 1 runs in-process, None uses every core
+SHARD_KEY = "service"  # Partition records by "service" or by a hash of "trace_id"
+
+# Model lifecycle settings
+MODEL_DIR = os.getenv("MODEL_DIR", "models")  # Versioned artifact directory
+MODEL_VERSION = os.getenv("MODEL_VERSION")  # None loads the LATEST version
+FIT_WINDOW_SIZE = 10000  # Reference records used to fit the detectors
 
 # LLM settings - Updated for Groq and open-source models
 LLM_PROVIDER = os.getenv("LLM_PROVIDER", "groq")  # Use Groq as default
@@ -25,6 +78,30 @@ LLM_TEMPERATURE = 0.1
 
 # Groq API settings
 GROQ_API_KEY = os.getenv("GROQ_API_KEY", "")
+GROQ_BASE_URL = os.getenv("GROQ_BASE_URL")  # Override to point at a proxy or local stub server
+
+# LLM throughput settings
+LLM_MAX_CONCURRENCY = 8  # Parallel in-flight requests in generate_candidates
+LLM_REQUESTS_PER_MINUTE = int(os.getenv("LLM_REQUESTS_PER_MINUTE", "30"))  # Provider RPM limit; 0 disables
+LLM_TOKENS_PER_MINUTE = int(os.getenv("LLM_TOKENS_PER_MINUTE", "6000"))  # Provider TPM limit; 0 disables
+LLM_MAX_RETRIES = 3  # Retries for rate-limit, timeout and server errors
+LLM_RETRY_BACKOFF = 1.0  # Base backoff in seconds, doubled per retry (full jitter)
+LLM_RETRY_MAX_BACKOFF = 30.0
+
+# Root-cause cache settings
+LLM_CACHE_ENABLED = True
+LLM_CACHE_MAX_ENTRIES = 10000  # In-memory LRU size
+LLM_CACHE_TTL = 3600  # Seconds before a cached root cause is regenerated; None never expires
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH")  # SQLite file so hits survive restarts; None keeps it in memory
+LLM_CACHE_CPU_BUCKET = 10  # cpu_usage bucket width (%) in the anomaly signature
+LLM_CACHE_LATENCY_BUCKET = 100  # latency bucket width (ms) in the anomaly signature
+
+# Metrics settings
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT")) if os.getenv("METRICS_PORT") else None  # Prometheus endpoint; None disables
+METRICS_SNAPSHOT_PATH = os.getenv("METRICS_SNAPSHOT_PATH")  # Periodic JSON snapshot file; None disables
+METRICS_SNAPSHOT_INTERVAL = 15  # Seconds between JSON snapshots
 
 # Performance settings
-CHUNK_SIZE = 10000  # For processing data in chunks
\ No newline at end of file
+CHUNK_SIZE = 10000  # For processing data in chunks
+PIPELINE_QUEUE_SIZE = 4  # Chunks buffered between pipeline stages before producers block
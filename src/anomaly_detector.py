@@ -1,105 +1,439 @@
+import os
+import json
+import time
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, TimeoutError as FutureTimeoutError
 import numpy as np
-import pandas as pd
-from sklearn.ensemble import IsolationForest
-from sklearn.svm import OneClassSVM
-from sklearn.preprocessing import StandardScaler
-from tensorflow.keras.models import Sequential
-from tensorflow.keras.layers import LSTM, Dense, RepeatVector, TimeDistributed
-from tensorflow.keras.optimizers import Adam
-from sklearn.metrics import precision_score, recall_score
+import joblib
 import logging
+from src.detectors import get_detector_class
+from src import metrics
 from config import settings
 
 logger = logging.getLogger(__name__)
 
+BATCH_SECONDS = metrics.histogram('detector_batch_seconds', 'Time to score one batch with the whole ensemble')
+MODEL_SECONDS = metrics.histogram('detector_model_seconds', 'Time spent in one detector', ('detector', 'phase'))
+RECORDS_SCORED = metrics.counter('detector_records_total', 'Records scored by the ensemble')
+RECORDS_FLAGGED = metrics.counter('detector_flagged_total', 'Records flagged as anomalies', ('detector',))
+TIMEOUTS = metrics.counter('detector_timeouts_total', 'Detector runs that exceeded their timeout', ('detector',))
+CASCADE_ROWS = metrics.counter('detector_cascade_rows_total', 'Records that reached each cascade stage', ('stage',))
+
+def _timed_score(detector, processed_data, data, rows=None):
+    # Timed where it runs, so process-pool workers report their own compute time
+    start = time.perf_counter()
+    if rows is None:
+        scores = detector.score(processed_data, data)
+    else:
+        scores = detector.score_rows(processed_data, data, rows)
+    return scores, time.perf_counter() - start
+
+# The fitted detector of a process-pool worker, installed once when the worker starts, so each
+# batch only ships the data
+_WORKER_DETECTOR = None
+
+def _install_detector(detector):
+    global _WORKER_DETECTOR
+    _WORKER_DETECTOR = detector
+
+def _worker_score(processed_data, data, rows=None):
+    return _timed_score(_WORKER_DETECTOR, processed_data, data, rows)
+
+class DetectionResult:
+    def __init__(self, scores, thresholds, min_votes=2, decisive=()):
+        # Raw continuous scores per detector (higher = more anomalous) and the cut-off
+        # each one is flagged at; keeping the scores lets thresholds change without rescoring.
+        # A flag from a decisive detector marks the row on its own, whatever min_votes.
+        self.scores = {name: np.asarray(values, dtype=np.float32) for name, values in scores.items()}
+        self.thresholds = dict(thresholds)
+        self.min_votes = min_votes
+        self.decisive = [name for name in decisive if name in self.scores]
+        # Cascade mode: fraction of the rows each stage scored; skipped rows score -inf
+        self.stage_fractions = {}
+        self.flags = {
+            name: (values > np.float32(self.thresholds[name])).astype(np.int8)
+            for name, values in self.scores.items()
+        }
+
+    def __len__(self):
+        return len(next(iter(self.scores.values()), ()))
+
+    @property
+    def votes(self):
+        # Vectorized vote count per row across all detectors
+        if not self.flags:
+            return np.zeros(0, dtype=np.int8)
+        return np.sum(np.vstack(list(self.flags.values())), axis=0, dtype=np.int8)
+
+    @property
+    def combined(self):
+        # Mark as anomaly if at least min_votes models, or any decisive one, flag it
+        combined = self.votes >= self.min_votes
+        for name in self.decisive:
+            combined |= self.flags[name].astype(bool)
+        return combined.astype(np.int8)
+
+    @property
+    def bitmask(self):
+        # One bit per detector (in self.flags order) packed into a single byte per row
+        mask = np.zeros(len(self), dtype=np.uint8)
+        for bit, flags in enumerate(self.flags.values()):
+            mask |= flags.astype(np.uint8) << bit
+        return mask
+
+    def __getitem__(self, name):
+        if name == 'combined':
+            return self.combined
+        return self.flags[name]
+
+    def keys(self):
+        return list(self.flags) + ['combined']
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def items(self):
+        return [(name, self[name]) for name in self.keys()]
+
+    def with_thresholds(self, thresholds=None, min_votes=None):
+        # Re-flag from the stored scores with new cut-offs and/or vote count
+        return DetectionResult(
+            self.scores,
+            {**self.thresholds, **(thresholds or {})},
+            self.min_votes if min_votes is None else min_votes,
+            self.decisive
+        )
+
+    @classmethod
+    def concat(cls, results):
+        # Join per-batch results row-wise (keeping the first one's thresholds), e.g. to evaluate a stream
+        results = list(results)
+        if not results:
+            return cls({}, {})
+        return cls(
+            {name: np.concatenate([r.scores[name] for r in results]) for name in results[0].scores},
+            results[0].thresholds,
+            results[0].min_votes,
+            results[0].decisive
+        )
+
+class ModelVersionError(ValueError):
+    # A saved version the ensemble cannot be loaded from; a new version has to be fitted
+    pass
+
 class AnomalyDetector:
-    def __init__(self):
-        self.scaler = StandardScaler()
-        
-    def preprocess_data(self, data):
+    FEATURES = ['cpu_usage', 'latency']
+    SCALER_ARTIFACT = 'scaler.joblib'
+    MANIFEST = 'manifest.json'
+    LATEST = 'LATEST'
+
+    def __init__(self, ensemble=None, min_votes=None):
+        # Only the detectors in the ensemble are imported (see src.detectors.REGISTRY)
+        self.ensemble = self.configured_ensemble() if ensemble is None else list(ensemble)
+        self.min_votes = settings.DETECTOR_MIN_VOTES if min_votes is None else min_votes
+        self.scaler = None  # Created by fit(), so scoring-only imports never load sklearn
+        self.detectors = {name: get_detector_class(name)() for name in self.ensemble}
+        self.fitted = False
+        self.version = None
+        self._executor = None
+
+    @staticmethod
+    def configured_ensemble():
+        ensemble = list(settings.DETECTOR_ENSEMBLE)
+        if settings.ONLINE_DETECTOR_ENABLED and 'online_statistical' not in ensemble:
+            ensemble.append('online_statistical')
+        if settings.TRACE_DETECTOR_ENABLED and 'trace_index' not in ensemble:
+            ensemble.append('trace_index')
+        return ensemble
+
+    def __getstate__(self):
+        # Executors cannot cross process boundaries; workers get everything else
+        state = self.__dict__.copy()
+        state['_executor'] = None
+        return state
+
+    def preprocess_data(self, data, fit=False):
         # Select numeric features for anomaly detection
-        features = data[['cpu_usage', 'latency']].fillna(0)
-        scaled_features = self.scaler.fit_transform(features)
-        return scaled_features
-    
-    def isolation_forest(self, data):
-        model = IsolationForest(
-            contamination=settings.ISOLATION_FOREST_CONTAMINATION, 
-            random_state=42
-        )
-        predictions = model.fit_predict(data)
-        # Convert to 0 (normal) and 1 (anomaly)
-        return [1 if x == -1 else 0 for x in predictions]
-    
-    def one_class_svm(self, data):
-        model = OneClassSVM(nu=settings.ONE_CLASS_SVM_NU)
-        predictions = model.fit_predict(data)
-        return [1 if x == -1 else 0 for x in predictions]
-    
-    def lstm_autoencoder(self, data):
-        # Reshape data for LSTM [samples, timesteps, features]
-        data = data.reshape((data.shape[0], 1, data.shape[1]))
-        
-        # Define a simpler model
-        model = Sequential()
-        model.add(LSTM(32, activation='relu', input_shape=(1, data.shape[2]), return_sequences=False))
-        model.add(RepeatVector(1))
-        model.add(LSTM(32, activation='relu', return_sequences=True))
-        model.add(TimeDistributed(Dense(data.shape[2])))
-        model.compile(optimizer=Adam(learning_rate=0.001), loss='mse')
-        
-        # Train with fewer epochs
-        model.fit(data, data, 
-                epochs=5,  # Reduced from 10 to 5
-                batch_size=128,  # Increased batch size
-                validation_split=0.1,
-                verbose=0)
-        
-        # Predict and calculate reconstruction error
-        predictions = model.predict(data, verbose=0, batch_size=128)
-        mse = np.mean(np.power(data - predictions, 2), axis=(1,2))
-        threshold = np.percentile(mse, 100 * (1 - settings.ISOLATION_FOREST_CONTAMINATION))
-        return [1 if e > threshold else 0 for e in mse]
-    
-    def statistical_threshold(self, data):
-        # Using Z-score on the scaled data (which is already standardized)
-        anomalies = []
-        for i in range(data.shape[0]):
-            z_score_cpu = abs(data[i, 0])
-            z_score_latency = abs(data[i, 1])
-            if z_score_cpu > settings.Z_SCORE_THRESHOLD or \
-               z_score_latency > settings.Z_SCORE_THRESHOLD:
-                anomalies.append(1)
+        features = data[self.FEATURES].fillna(0)
+        if fit:
+            from sklearn.preprocessing import StandardScaler
+            self.scaler = StandardScaler()
+            return self.scaler.fit_transform(features)
+        return self.scaler.transform(features)
+
+    def fit(self, data):
+        # Train every detector once on a reference window; batches are only scored afterwards
+        logger.info(f"Fitting {', '.join(self.ensemble)} on {len(data)} reference records")
+        processed_data = self.preprocess_data(data, fit=True)
+        # Process workers hold copies of the previous fit
+        self.close()
+        for name, detector in self.detectors.items():
+            with MODEL_SECONDS.time(detector=name, phase='fit'):
+                detector.fit(processed_data, data)
+        self.fitted = True
+        return self
+
+    def thresholds(self):
+        return {name: detector.threshold for name, detector in self.detectors.items()}
+
+    def decisive(self):
+        return [name for name in self.detectors if name in settings.DECISIVE_DETECTORS]
+
+    def score(self, data):
+        # Inference only: scale with the reference statistics and run the fitted models
+        if not self.fitted:
+            raise RuntimeError("AnomalyDetector must be fitted or loaded before scoring")
+        with BATCH_SECONDS.time():
+            processed_data = self.preprocess_data(data)
+            # A vote threshold above the ensemble size could never flag anything
+            min_votes = min(self.min_votes, len(self.detectors))
+            if settings.DETECTOR_CASCADE:
+                scores, stage_fractions = self._run_cascade(processed_data, data, min_votes)
             else:
-                anomalies.append(0)
-        return anomalies
-    
-    def detect_anomalies(self, data):
-        processed_data = self.preprocess_data(data)
+                scores, stage_fractions = self._run_detectors(processed_data, data), {}
+            result = DetectionResult(scores, self.thresholds(), min_votes, self.decisive())
+            result.stage_fractions = stage_fractions
+        RECORDS_SCORED.inc(len(data))
+        for name, flags in result.items():
+            RECORDS_FLAGGED.inc(int(flags.sum()), detector=name)
+        return result
+
+    def _get_executor(self):
+        if self._executor is None:
+            if settings.DETECTOR_EXECUTOR == 'thread':
+                self._executor = ThreadPoolExecutor(max_workers=settings.DETECTOR_WORKERS)
+            elif settings.DETECTOR_EXECUTOR == 'process':
+                # One single-worker pool per detector: each fitted model is pickled once, into the
+                # one process that scores it, and stays warm there from batch to batch.
+                # spawn, not fork: forking a process that already initialised TensorFlow can deadlock.
+                context = multiprocessing.get_context('spawn')
+                self._executor = {
+                    name: ProcessPoolExecutor(
+                        max_workers=1, mp_context=context, initializer=_install_detector, initargs=(detector,)
+                    )
+                    for name, detector in self.detectors.items() if not detector.inline
+                }
+            else:
+                raise ValueError(f"Unknown DETECTOR_EXECUTOR: {settings.DETECTOR_EXECUTOR}")
+        return self._executor
+
+    def _run_detectors(self, processed_data, data, names=None, rows=None):
+        # Scores every row with the given detectors (default: all), or only the rows at positions rows
+        detectors = {name: self.detectors[name] for name in (self.detectors if names is None else names)}
+        pooled = {name: d for name, d in detectors.items() if not d.inline}
+        if settings.DETECTOR_EXECUTOR == 'serial' or not pooled:
+            results = {name: self._score_one(name, detector, processed_data, data, rows) for name, detector in pooled.items()}
+        else:
+            results = self._run_pooled(pooled, processed_data, data, rows)
+
+        for name, detector in detectors.items():
+            if detector.inline:
+                results[name] = self._score_one(name, detector, processed_data, data, rows)
+        # Keep the ensemble order so the result bitmask layout is stable
+        return {name: results[name] for name in detectors}
+
+    def _cascade_stages(self):
+        # CASCADE_STAGES restricted to the ensemble. Stateful (inline) and decisive detectors,
+        # and detectors that no stage lists, join the first stage, which always scores every row.
+        decisive = self.decisive()
+        stages = [[name for name in stage if name in self.detectors] for stage in settings.CASCADE_STAGES]
+        later = {
+            name for stage in stages[1:] for name in stage
+            if not self.detectors[name].inline and name not in decisive
+        }
+        first = [name for name in self.detectors if name not in later]
+        rest = [[name for name in stage if name in later] for stage in stages[1:]]
+        return [first] + [stage for stage in rest if stage]
+
+    def _run_cascade(self, processed_data, data, min_votes):
+        # Cheap detectors score every row; each later stage only scores rows whose outcome is
+        # still open. A row stops once it has min_votes, or once the detectors left could no
+        # longer reach min_votes, so those rows get the same combined flag as the full ensemble.
+        # CASCADE_SCREEN_Z (off by default) additionally drops rows without a vote whose
+        # largest |z| is below it after the first stage; the later stages may still have
+        # flagged those rows, so the output is then no longer exact.
+        n = processed_data.shape[0]
+        thresholds = self.thresholds()
+        votes = np.zeros(n, dtype=np.int16)
+        # Rows a decisive detector flagged are settled (all decisive detectors are in stage 1)
+        flagged = np.zeros(n, dtype=bool)
+        decisive = self.decisive()
+        remaining = len(self.detectors)
+        active = np.arange(n)
+        scores, stage_fractions = {}, {}
+        for i, stage in enumerate(self._cascade_stages()):
+            if i == 1 and settings.CASCADE_SCREEN_Z is not None:
+                z = np.abs(processed_data[active]).max(axis=1)
+                active = active[(votes[active] > 0) | (z >= settings.CASCADE_SCREEN_Z)]
+            label = '+'.join(stage)
+            stage_fractions[label] = len(active) / n if n else 0.0
+            CASCADE_ROWS.inc(len(active), stage=label)
+
+            if i > 0 and len(active) == 0:
+                stage_scores = {name: np.zeros(0) for name in stage}
+            else:
+                stage_scores = self._run_detectors(processed_data, data, stage, None if i == 0 else active)
+            for name, values in stage_scores.items():
+                full = np.full(n, -np.inf, dtype=np.float32)
+                full[active] = values
+                scores[name] = full
+                votes[active] += (full[active] > np.float32(thresholds[name]))
+                if name in decisive:
+                    flagged[active] |= full[active] > np.float32(thresholds[name])
+            remaining -= len(stage)
+            undecided = (votes[active] < min_votes) & (votes[active] + remaining >= min_votes) & ~flagged[active]
+            active = active[undecided]
+        # Keep the ensemble order so the result bitmask layout is stable
+        return {name: scores[name] for name in self.detectors}, stage_fractions
+
+    def _score_one(self, name, detector, processed_data, data, rows=None):
+        scores, seconds = _timed_score(detector, processed_data, data, rows)
+        MODEL_SECONDS.observe(seconds, detector=name, phase='score')
+        return scores
+
+    def _run_pooled(self, detectors, processed_data, data, rows=None):
+        # The detectors are independent given processed_data, so run them concurrently
+        executor = self._get_executor()
+        start = time.monotonic()
+        if isinstance(executor, dict):
+            futures = {name: executor[name].submit(_worker_score, processed_data, data, rows) for name in detectors}
+        else:
+            futures = {
+                name: executor.submit(_timed_score, detector, processed_data, data, rows)
+                for name, detector in detectors.items()
+            }
+
         results = {}
-        
-        # Run each model
-        results['isolation_forest'] = self.isolation_forest(processed_data)
-        results['one_class_svm'] = self.one_class_svm(processed_data)
-        results['lstm_autoencoder'] = self.lstm_autoencoder(processed_data)
-        results['statistical'] = self.statistical_threshold(processed_data)
-        
-        # Combine results (simple voting)
-        combined = np.sum([results[m] for m in results], axis=0)
-        # Mark as anomaly if at least two models flag it
-        results['combined'] = [1 if c >= 2 else 0 for c in combined]
-        
+        for name, future in futures.items():
+            timeout = settings.DETECTOR_TIMEOUTS.get(name, settings.DETECTOR_TIMEOUT)
+            remaining = None if timeout is None else max(0.0, start + timeout - time.monotonic())
+            try:
+                results[name], seconds = future.result(timeout=remaining)
+                MODEL_SECONDS.observe(seconds, detector=name, phase='score')
+            except FutureTimeoutError:
+                # A slow detector abstains (votes normal) rather than stalling the batch.
+                # Threads cannot be interrupted, so a running thread still finishes in the background.
+                future.cancel()
+                logger.warning(f"{name} exceeded its {timeout}s timeout, counting it as no votes")
+                TIMEOUTS.inc(detector=name)
+                results[name] = np.full(processed_data.shape[0] if rows is None else len(rows), -np.inf)
         return results
-    
+
+    def close(self):
+        if self._executor is not None:
+            executors = self._executor.values() if isinstance(self._executor, dict) else [self._executor]
+            for executor in executors:
+                executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def detect_anomalies(self, data):
+        # Stand-alone use: fit on the data itself the first time, then only score
+        if not self.fitted:
+            self.fit(data)
+        return self.score(data)
+
+    def scan(self, path, batch_size=None):
+        # Scores a Parquet/Arrow (memory-mapped) or CSV dataset one record batch at a time,
+        # yielding (batch, result); fits on the first batch if nothing is fitted yet.
+        # Imported here so that pyarrow stays out of workers that never read datasets.
+        from src.ingest import read_batches
+        for batch in read_batches(path, batch_size):
+            if not self.fitted:
+                self.fit(batch.iloc[:settings.FIT_WINDOW_SIZE])
+            yield batch, self.score(batch)
+
+    def save(self, model_dir):
+        if not self.fitted:
+            raise RuntimeError("Cannot save an unfitted AnomalyDetector")
+
+        # Each save goes to a new versioned directory (v1, v2, ...) and LATEST points at it
+        os.makedirs(model_dir, exist_ok=True)
+        existing = [int(d[1:]) for d in os.listdir(model_dir) if d.startswith('v') and d[1:].isdigit()]
+        version = f"v{max(existing, default=0) + 1}"
+        version_dir = os.path.join(model_dir, version)
+        os.makedirs(version_dir)
+
+        joblib.dump(self.scaler, os.path.join(version_dir, self.SCALER_ARTIFACT))
+        for detector in self.detectors.values():
+            if detector.artifact:
+                detector.save(os.path.join(version_dir, detector.artifact))
+
+        manifest = {
+            'version': version,
+            'features': self.FEATURES,
+            'min_votes': self.min_votes,
+            'detectors': {name: detector.manifest() for name, detector in self.detectors.items()}
+        }
+        with open(os.path.join(version_dir, self.MANIFEST), 'w') as f:
+            json.dump(manifest, f, indent=4)
+        with open(os.path.join(model_dir, self.LATEST), 'w') as f:
+            f.write(version)
+
+        self.version = version
+        logger.info(f"Saved anomaly detectors to {version_dir}")
+        return version_dir
+
+    @classmethod
+    def read_manifest(cls, model_dir, version=None, ensemble=None):
+        # Resolves the version (LATEST by default) and checks that it holds every detector of
+        # the ensemble; returns (version directory, manifest)
+        if version is None:
+            latest_path = os.path.join(model_dir, cls.LATEST)
+            if not os.path.exists(latest_path):
+                raise FileNotFoundError(f"No saved anomaly detectors in {model_dir}")
+            with open(latest_path) as f:
+                version = f.read().strip()
+        version_dir = os.path.join(model_dir, version)
+
+        with open(os.path.join(version_dir, cls.MANIFEST)) as f:
+            manifest = json.load(f)
+        if 'detectors' not in manifest:
+            # Saved before detectors became plugins: the models share one artifact and the LSTM
+            # is not a sequence model, so there is nothing to migrate
+            raise ModelVersionError(f"Version {version} in {model_dir} predates detector plugins and must be refitted")
+
+        # Detectors added to the ensemble after the version was saved only block loading if
+        # they have to be fitted; the others start fresh
+        ensemble = cls.configured_ensemble() if ensemble is None else ensemble
+        missing = [
+            name for name in ensemble
+            if name not in manifest['detectors'] and get_detector_class(name).needs_fit
+        ]
+        if missing:
+            raise ModelVersionError(f"Version {version} in {model_dir} has no saved {', '.join(missing)}")
+        return version_dir, manifest
+
+    @classmethod
+    def load(cls, model_dir, version=None, ensemble=None):
+        # Loads the configured ensemble (or the given one) from a saved version; detectors
+        # saved with the version but not in the ensemble are never imported
+        version_dir, manifest = cls.read_manifest(model_dir, version, ensemble)
+        detector = cls(ensemble)
+        detector.scaler = joblib.load(os.path.join(version_dir, cls.SCALER_ARTIFACT))
+        for name in detector.ensemble:
+            plugin = get_detector_class(name)
+            if name not in manifest['detectors']:
+                logger.info(f"{name} was not saved with {manifest['version']}, starting it fresh")
+                continue
+            path = os.path.join(version_dir, plugin.artifact) if plugin.artifact else None
+            detector.detectors[name] = plugin.load(path, manifest['detectors'][name])
+        detector.version = manifest['version']
+        detector.fitted = True
+        logger.info(f"Loaded {', '.join(detector.ensemble)} from {version_dir}")
+        return detector
+
     def evaluate(self, data, true_anomalies):
         # true_anomalies is a list of known anomalies (1 for anomaly, 0 for normal)
-        processed_data = self.preprocess_data(data)
         results = self.detect_anomalies(data)
-        
+        return self.evaluate_predictions(results, true_anomalies)
+
+    def evaluate_predictions(self, results, true_anomalies):
+        # Precision/recall for a DetectionResult already produced by score(), e.g. concatenated over a stream
+        from sklearn.metrics import precision_score, recall_score
         evaluation = {}
         for model_name, preds in results.items():
             precision = precision_score(true_anomalies, preds, zero_division=0)
             recall = recall_score(true_anomalies, preds, zero_division=0)
             evaluation[model_name] = {'precision': precision, 'recall': recall}
-            
-        return evaluation
\ No newline at end of file
+
+        return evaluation
@@ -0,0 +1,157 @@
+import time
+import queue
+import logging
+import threading
+from src import metrics
+from src.pipeline import END
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+BATCHES = metrics.counter('consumer_batches_total', 'Message batches handled by consumer workers', ('outcome',))
+BATCH_SECONDS = metrics.histogram('consumer_batch_seconds', 'Time from receiving a batch to deleting it')
+VISIBILITY_EXTENSIONS = metrics.counter('consumer_visibility_extensions_total', 'In-flight messages whose visibility timeout was extended')
+BUSY_WORKERS = metrics.gauge('consumer_busy_workers', 'Consumer workers currently handling a batch')
+
+class ConsumerPool:
+    def __init__(self, sqs, handle, workers=None, batch_size=None, inbox=None, outbox=None, stop_event=None):
+        # N workers, each running receive -> handle(messages) -> delete on its own thread.
+        # With an inbox of enqueued counts (ending in END), the pool stops once every enqueued
+        # message has been handled; without one it runs until stop(). Results that are not None
+        # go to the outbox, followed by END when the last worker exits.
+        self.sqs = sqs
+        self.handle = handle
+        self.workers = workers or settings.CONSUMER_WORKERS
+        self.batch_size = batch_size or settings.CONSUMER_BATCH_SIZE
+        self.inbox = inbox
+        self.outbox = outbox
+        self.stop_event = stop_event or threading.Event()
+        self.error = None
+        self.expected = 0
+        self.processed = 0
+        self.lock = threading.Lock()
+        self._draining = threading.Event()
+        self._producer_done = threading.Event()
+        self._in_flight = {}
+        self._threads = [
+            threading.Thread(target=self._work, name=f'consumer-{i}', daemon=True) for i in range(self.workers)
+        ]
+        self._threads.append(threading.Thread(target=self._extend_visibility, name='consumer-heartbeat', daemon=True))
+        if inbox is not None:
+            self._threads.append(threading.Thread(target=self._track_expected, name='consumer-expected', daemon=True))
+
+    def start(self):
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def stop(self):
+        # Graceful: workers finish and delete the batch they hold, then exit
+        self._draining.set()
+
+    def join(self):
+        for thread in self._threads:
+            thread.join()
+        if self.outbox is not None:
+            self._put(END)
+
+    def _stopping(self):
+        return self.stop_event.is_set() or self._draining.is_set()
+
+    def _track_expected(self):
+        while not self._stopping():
+            try:
+                count = self.inbox.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if count is END:
+                self._producer_done.set()
+                self._check_drained()
+                return
+            with self.lock:
+                self.expected += count
+
+    def _check_drained(self):
+        with self.lock:
+            drained = self.processed >= self.expected
+        if self._producer_done.is_set() and drained:
+            self.stop()
+
+    def _queue_empty(self):
+        counts = self.sqs.queue_counts()
+        return counts is not None and counts == (0, 0)
+
+    def _put(self, item):
+        while not self.stop_event.is_set():
+            try:
+                self.outbox.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _receive(self):
+        # Gathers up to batch_size messages; stops early once a receive comes back short,
+        # so an idle worker does not hold messages while waiting for more
+        messages = []
+        while len(messages) < self.batch_size and not self._stopping():
+            received = self.sqs.receive_messages(
+                max_messages=min(settings.SQS_MAX_MESSAGES, self.batch_size - len(messages)),
+                wait_time_seconds=0 if messages else settings.CONSUMER_POLL_SECONDS
+            )
+            messages.extend(received)
+            if len(received) < settings.SQS_MAX_MESSAGES:
+                break
+        return messages
+
+    def _work(self):
+        worker = threading.current_thread().name
+        while not self._stopping():
+            messages = self._receive()
+            if not messages:
+                if self._producer_done.is_set() and self._queue_empty():
+                    # Everything was sent and nothing is left, visible or in flight (e.g. duplicates
+                    # were dropped by FIFO deduplication, so fewer messages arrived than were counted).
+                    # An empty receive alone is not enough: FIFO holds back every group that another
+                    # worker has in flight.
+                    self.stop()
+                # The in-memory fallback queue does not long-poll
+                self._draining.wait(0.05)
+                continue
+            start = time.monotonic()
+            # [last time the visibility timeout was set, messages]
+            self._in_flight[worker] = [start, messages]
+            BUSY_WORKERS.inc()
+            try:
+                result = self.handle(messages)
+            except Exception as e:
+                # The batch is not deleted, so it is redelivered after its visibility timeout
+                logger.exception(f"Consumer {worker} failed on a batch of {len(messages)} messages: {e}")
+                BATCHES.inc(outcome='error')
+                self.error = e
+                self.stop_event.set()
+                return
+            finally:
+                self._in_flight.pop(worker, None)
+                BUSY_WORKERS.dec()
+            if self.outbox is not None and result is not None and not self._put(result):
+                # Stopped before the result could be passed on; leave the batch for redelivery
+                return
+            self.sqs.delete_messages_batch(messages)
+            BATCH_SECONDS.observe(time.monotonic() - start)
+            BATCHES.inc(outcome='ok')
+            with self.lock:
+                self.processed += len(messages)
+            self._check_drained()
+
+    def _extend_visibility(self):
+        # Batches still being handled after a third of the visibility timeout get a fresh
+        # timeout, so a slow batch is never redelivered to another worker mid-flight
+        interval = settings.SQS_VISIBILITY_TIMEOUT / 3
+        while not self._stopping() or self._in_flight:
+            time.sleep(min(interval, 1.0))
+            for batch in list(self._in_flight.values()):
+                if time.monotonic() - batch[0] >= interval:
+                    self.sqs.change_visibility_batch(batch[1], settings.SQS_VISIBILITY_TIMEOUT)
+                    batch[0] = time.monotonic()
+                    VISIBILITY_EXTENSIONS.inc(len(batch[1]))
@@ -1,82 +1,150 @@
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
-import random
 import logging
+from src import metrics, schema
 from config import settings
 
 logger = logging.getLogger(__name__)
 
+RECORDS_GENERATED = metrics.counter('generator_records_total', 'Synthetic records generated')
+CHUNK_SECONDS = metrics.histogram('generator_chunk_seconds', 'Time to generate one chunk of synthetic records')
+
+# Records drawn from one random stream. Streams are keyed by their first record, so a seeded
+# dataset is the same whatever chunk size it is generated in.
+RNG_BLOCK = 4096
+# Start of the generated day for seeded datasets, so their timestamps are reproducible too
+SEEDED_START_TIME = datetime(2024, 1, 1)
+
 class SyntheticDataGenerator:
-    def __init__(self):
+    def __init__(self, seed=None):
         self.size = settings.DATA_SIZE
         self.error_rate = settings.ERROR_RATE
         self.anomaly_rate = settings.ANOMALY_RATE
-        self.log_levels = ['INFO', 'DEBUG', 'WARN', 'ERROR', 'FATAL']
-        self.services = ['web-server', 'auth-service', 'payment-service', 'user-service', 'database']
-        self.event_types = ['request', 'response', 'system', 'transaction']
-        
-    def generate_data(self):
-        logger.info(f"Generating {self.size} synthetic MELT records")
-        
-        # Generate timestamps
-        start_time = datetime.now() - timedelta(days=1)
-        timestamps = [(start_time + timedelta(seconds=random.randint(0, 86400))).isoformat() for _ in range(self.size)]
-        timestamps.sort()
-        
+        self.spans_per_trace = settings.SPANS_PER_TRACE
+        self.span_drop_rate = settings.SPAN_DROP_RATE
+        self.seed = settings.RANDOM_SEED if seed is None else seed
+        self.log_levels = schema.LOG_LEVELS
+        self.log_level_probs = [0.5, 0.3, 0.1, 0.05, 0.05]
+        self.services = schema.SERVICES
+        self.event_types = schema.EVENT_TYPES
+
+    def _generate_chunk(self, rng, start, n, start_time):
+        # Builds one block directly in the compact schema (see src/schema.py)
+        # Timestamps: each block owns a contiguous slice of the day, so the whole
+        # stream stays sorted without ever holding every timestamp at once
+        seconds_per_record = 86400 / self.size
+        lo = int(start * seconds_per_record)
+        hi = max(int((start + n) * seconds_per_record), lo + 1)
+        offsets = np.sort(rng.integers(lo, hi, size=n))
+        timestamps = np.datetime64(start_time, 'ns') + offsets.astype('timedelta64[s]')
+
         # Generate service names
-        services = [random.choice(self.services) for _ in range(self.size)]
-        
+        services = pd.Categorical.from_codes(
+            rng.integers(0, len(self.services), size=n), dtype=schema.DTYPES['service']
+        )
+
         # Generate log levels with a bias towards INFO and DEBUG
-        log_levels = np.random.choice(self.log_levels, size=self.size, p=[0.5, 0.3, 0.1, 0.05, 0.05])
-        
-        # Introduce errors based on error rate
-        messages = []
-        for i in range(self.size):
-            if log_levels[i] in ['ERROR', 'FATAL'] and random.random() < self.error_rate:
-                messages.append(f"Error in {services[i]} at {timestamps[i]}")
-            else:
-                messages.append(f"Operation completed successfully in {services[i]}")
-        
+        level_codes = rng.choice(len(self.log_levels), size=n, p=self.log_level_probs)
+        log_levels = pd.Categorical.from_codes(level_codes, dtype=schema.DTYPES['log_level'])
+
+        # Introduce errors based on error rate; the message text is a template, rendered on demand
+        is_error = np.isin(level_codes, [self.log_levels.index('ERROR'), self.log_levels.index('FATAL')])
+        is_error &= rng.random(n) < self.error_rate
+        message_ids = pd.Categorical.from_codes(
+            np.where(is_error, 1, 0).astype(np.int8), dtype=schema.DTYPES['message_id']
+        )
+
         # Generate metrics (cpu_usage, latency)
-        cpu_usage = np.random.normal(50, 10, self.size)
-        latency = np.random.normal(100, 20, self.size)
-        
+        cpu_usage = rng.normal(50, 10, n).astype(np.float32)
+        latency = rng.normal(100, 20, n).astype(np.float32)
+
         # Introduce metric anomalies
-        for i in range(self.size):
-            if random.random() < self.anomaly_rate:
-                cpu_usage[i] = random.randint(90, 100)
-                latency[i] = random.randint(500, 1000)
-        
-        # Generate traces (trace_id, span_id)
-        trace_ids = [f"trace_{i}" for i in range(self.size)]
-        span_ids = [f"span_{i}" for i in range(self.size)]
-        
-        # Introduce missing spans (anomaly)
-        for i in range(self.size):
-            if random.random() < self.anomaly_rate:
-                span_ids[i] = None
-        
+        spikes = rng.random(n) < self.anomaly_rate
+        n_spikes = int(spikes.sum())
+        cpu_usage[spikes] = rng.integers(90, 101, size=n_spikes)
+        latency[spikes] = rng.integers(500, 1001, size=n_spikes)
+
+        # Generate traces: every record is a span, and spans_per_trace consecutive records
+        # (across services) make up one trace. Ids follow the record position, so a trace cut
+        # by a block or chunk boundary keeps its id.
+        positions = np.arange(start, start + n, dtype=np.int64)
+        trace_ids = positions // self.spans_per_trace
+
+        # Introduce dropped spans (anomaly) through the null mask; each breaks its trace
+        span_ids = pd.arrays.IntegerArray(positions, rng.random(n) < self.span_drop_rate)
+
         # Generate events
-        events = np.random.choice(self.event_types, size=self.size)
-        
+        events = pd.Categorical.from_codes(
+            rng.integers(0, len(self.event_types), size=n), dtype=schema.DTYPES['event_type']
+        )
+
         # Create DataFrame
         data = {
             'timestamp': timestamps,
             'service': services,
             'log_level': log_levels,
-            'message': messages,
+            'message_id': message_ids,
             'cpu_usage': cpu_usage,
             'latency': latency,
             'trace_id': trace_ids,
             'span_id': span_ids,
             'event_type': events
         }
-        
-        return pd.DataFrame(data)
-    
+
+        return pd.DataFrame(data, index=pd.RangeIndex(start, start + n))
+
+    def _blocks(self):
+        # Yields the dataset in RNG_BLOCK-sized frames, each from its own generator derived
+        # from the seed and the block's first record
+        seed = np.random.SeedSequence(self.seed)
+        if self.seed is None:
+            start_time = datetime.now() - timedelta(days=1)
+        else:
+            start_time = SEEDED_START_TIME
+        for start in range(0, self.size, RNG_BLOCK):
+            rng = np.random.default_rng(np.random.SeedSequence(seed.entropy, spawn_key=(start,)))
+            yield self._generate_chunk(rng, start, min(RNG_BLOCK, self.size - start), start_time)
+
+    def generate_chunks(self, chunk_size=None):
+        # Yield the dataset as DataFrames of at most chunk_size rows; peak memory
+        # is bounded by the chunk and one block, not by self.size
+        chunk_size = chunk_size or settings.CHUNK_SIZE
+        blocks = self._blocks()
+        carry = None  # Rows of the last block not yet yielded
+        for start in range(0, self.size, chunk_size):
+            n = min(chunk_size, self.size - start)
+            with CHUNK_SECONDS.time():
+                parts = [] if carry is None else [carry]
+                rows = sum(len(part) for part in parts)
+                while rows < n:
+                    parts.append(next(blocks))
+                    rows += len(parts[-1])
+                chunk = parts[0] if len(parts) == 1 else pd.concat(parts)
+                chunk, carry = chunk.iloc[:n], (chunk.iloc[n:] if rows > n else None)
+            RECORDS_GENERATED.inc(n)
+            yield chunk
+
+    def generate_data(self):
+        logger.info(f"Generating {self.size} synthetic MELT records")
+        return pd.concat(self.generate_chunks(), ignore_index=True)
+
+    def write_csv(self, file_path, chunk_size=None):
+        # Stream chunks straight to disk without materializing the full dataset
+        logger.info(f"Streaming {self.size} synthetic MELT records to {file_path}")
+        for i, chunk in enumerate(self.generate_chunks(chunk_size)):
+            chunk.to_csv(file_path, mode='w' if i == 0 else 'a', header=i == 0, index=False)
+        logger.info(f"Synthetic data saved to {file_path}")
+
+    def write_dataset(self, path, format=None, chunk_size=None):
+        # Partitioned Parquet/Arrow (one part file per chunk) or CSV; see src/ingest.py
+        from src.ingest import write_dataset
+        logger.info(f"Streaming {self.size} synthetic MELT records to {path}")
+        write_dataset(self.generate_chunks(chunk_size), path, format)
+        logger.info(f"Synthetic data saved to {path}")
+
     def to_csv(self, file_path):
         df = self.generate_data()
         df.to_csv(file_path, index=False)
         logger.info(f"Synthetic data saved to {file_path}")
-        return df
\ No newline at end of file
+        return df
@@ -0,0 +1,22 @@
+import importlib
+
+# Detector name -> "module:Class". A plugin module is imported only when its detector is in
+# the ensemble, so e.g. a statistical-only worker never imports TensorFlow or the SVMs.
+REGISTRY = {
+    'isolation_forest': 'src.detectors.isolation_forest:IsolationForestDetector',
+    'one_class_svm': 'src.detectors.one_class_svm:OneClassSVMDetector',
+    'lstm_autoencoder': 'src.detectors.lstm_autoencoder:LSTMAutoencoderDetector',
+    'statistical': 'src.detectors.statistical:StatisticalDetector',
+    'online_statistical': 'src.detectors.online_statistical:OnlineStatisticalPlugin',
+    'trace_index': 'src.detectors.trace_index:TraceIndexDetector'
+}
+
+def register_detector(name, path):
+    # Adds (or replaces) a plugin; path is "module:Class"
+    REGISTRY[name] = path
+
+def get_detector_class(name):
+    if name not in REGISTRY:
+        raise ValueError(f"Unknown detector: {name}")
+    module_name, class_name = REGISTRY[name].split(':')
+    return getattr(importlib.import_module(module_name), class_name)
@@ -0,0 +1,34 @@
+class Detector:
+    # One voter in the ensemble. score() is oriented so that higher means more anomalous,
+    # and a record is flagged when its score exceeds threshold.
+    name = None
+    artifact = None  # File name inside a version directory; None if there is nothing to persist
+    inline = False  # Stateful, order-dependent detectors run in the caller instead of the pool
+    needs_fit = True  # False if fit() learns nothing, so a version saved without it can still load it
+
+    def fit(self, processed, data):
+        # processed: scaled feature matrix; data: the raw records (for service/timestamp)
+        return self
+
+    def score(self, processed, data):
+        raise NotImplementedError
+
+    def score_rows(self, processed, data, rows):
+        # Scores only the records at positions rows (used by the cascade). Detectors whose
+        # score depends on neighbouring records override this to keep that context.
+        return self.score(processed[rows], data.iloc[rows])
+
+    @property
+    def threshold(self):
+        return 0.0
+
+    def manifest(self):
+        # Settings recorded in the version manifest and handed back to load()
+        return {}
+
+    def save(self, path):
+        pass
+
+    @classmethod
+    def load(cls, path, manifest):
+        return cls()
@@ -0,0 +1,32 @@
+import joblib
+from sklearn.ensemble import IsolationForest
+from src.detectors.base import Detector
+from config import settings
+
+class IsolationForestDetector(Detector):
+    name = 'isolation_forest'
+    artifact = 'isolation_forest.joblib'
+
+    def __init__(self, model=None):
+        self.model = model
+
+    def fit(self, processed, data):
+        self.model = IsolationForest(
+            contamination=settings.ISOLATION_FOREST_CONTAMINATION,
+            random_state=42
+        ).fit(processed)
+        return self
+
+    def score(self, processed, data):
+        # Negated decision function: > 0 exactly where predict() returns -1 (anomaly)
+        return -self.model.decision_function(processed)
+
+    def manifest(self):
+        return {'contamination': settings.ISOLATION_FOREST_CONTAMINATION}
+
+    def save(self, path):
+        joblib.dump(self.model, path)
+
+    @classmethod
+    def load(cls, path, manifest):
+        return cls(joblib.load(path))
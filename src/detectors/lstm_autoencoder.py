@@ -0,0 +1,158 @@
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+import pandas as pd
+import tensorflow as tf
+from tensorflow.keras.models import Sequential, load_model
+from tensorflow.keras.layers import Input, LSTM, Dense, RepeatVector, TimeDistributed
+from tensorflow.keras.optimizers import Adam
+from src.detectors.base import Detector
+from config import settings
+
+def sequence_layout(data, window):
+    # Orders records per service by time and lays the groups out back to back.
+    # Returns rows (flat position -> input row), pad (positions that only pad a group
+    # shorter than the window) and starts (window start positions that stay inside one group).
+    n = len(data)
+    if 'service' not in data:
+        keys = np.zeros(n, dtype=int)
+    elif isinstance(data['service'].dtype, pd.CategoricalDtype):
+        keys = data['service'].cat.codes.to_numpy()  # Compact schema: group on the 1-byte codes
+    else:
+        keys = data['service'].astype(str).to_numpy()
+    frame = pd.DataFrame({'key': keys, 'time': data['timestamp'].to_numpy() if 'timestamp' in data else np.arange(n)})
+    order = frame.sort_values(['key', 'time'], kind='stable').index.to_numpy()
+
+    sorted_keys = keys[order]
+    boundaries = np.flatnonzero(sorted_keys[1:] != sorted_keys[:-1]) + 1
+    rows, pad, starts = [], [], []
+    position = 0
+    for group in np.split(order, boundaries):
+        if len(group) == 0:
+            continue
+        # Groups shorter than the window are front-padded by repeating their first record
+        padding = max(window - len(group), 0)
+        rows.append(np.concatenate([np.repeat(group[:1], padding), group]))
+        pad.append(np.arange(padding + len(group)) < padding)
+        length = padding + len(group)
+        starts.append(position + np.arange(length - window + 1))
+        position += length
+    if not rows:
+        return np.zeros(0, dtype=int), np.zeros(0, dtype=bool), np.zeros(0, dtype=int)
+    return np.concatenate(rows), np.concatenate(pad), np.concatenate(starts)
+
+class LSTMAutoencoderDetector(Detector):
+    name = 'lstm_autoencoder'
+    artifact = 'lstm_autoencoder.keras'
+
+    def __init__(self, model=None, threshold=None, window=None):
+        self.model = model
+        self.lstm_threshold = threshold
+        self.window = window or settings.LSTM_WINDOW_SIZE
+        self._errors = None
+
+    def __getstate__(self):
+        # The compiled predict function is rebuilt lazily in each worker
+        state = self.__dict__.copy()
+        state['_errors'] = None
+        return state
+
+    def _window_dataset(self, processed, layout, with_targets=False, shuffle=False):
+        # Windows are zero-copy strided views over the service-ordered records; only one
+        # batch of windows is materialized at a time, and tf.data prefetches the next one
+        rows, _, starts = layout
+        flat = np.ascontiguousarray(processed[rows], dtype=np.float32)
+        windows = sliding_window_view(flat, self.window, axis=0)  # (positions, features, window)
+        batch_size = settings.LSTM_BATCH_SIZE
+        rng = np.random.default_rng(42)
+
+        def batches():
+            order = rng.permutation(starts) if shuffle else starts
+            for i in range(0, len(order), batch_size):
+                batch = windows[order[i:i + batch_size]].transpose(0, 2, 1)
+                yield (batch, batch) if with_targets else batch
+
+        spec = tf.TensorSpec(shape=(None, self.window, processed.shape[1]), dtype=tf.float32)
+        dataset = tf.data.Dataset.from_generator(batches, output_signature=(spec, spec) if with_targets else spec)
+        return dataset.prefetch(tf.data.AUTOTUNE)
+
+    def fit(self, processed, data):
+        # Sequence autoencoder over [windows, timesteps, features]
+        layout = sequence_layout(data, self.window)
+        model = Sequential()
+        model.add(Input(shape=(self.window, processed.shape[1])))
+        model.add(LSTM(32, activation='relu', return_sequences=False))
+        model.add(RepeatVector(self.window))
+        model.add(LSTM(32, activation='relu', return_sequences=True))
+        model.add(TimeDistributed(Dense(processed.shape[1])))
+        model.compile(optimizer=Adam(learning_rate=0.001), loss='mse')
+
+        model.fit(self._window_dataset(processed, layout, with_targets=True, shuffle=True),
+                epochs=settings.LSTM_EPOCHS,
+                verbose=0)
+        self.model = model
+        self._errors = None
+
+        # Reconstruction error cut-off is learned on the reference window, not per batch
+        mse = self.score(processed, data)
+        self.lstm_threshold = float(np.percentile(mse, 100 * (1 - settings.ISOLATION_FOREST_CONTAMINATION)))
+        return self
+
+    def _error_fn(self):
+        # Compiled once per model; returns the squared reconstruction error per window and timestep
+        if self._errors is None:
+            model = self.model
+
+            @tf.function(reduce_retracing=True)
+            def timestep_errors(batch):
+                reconstruction = model(batch, training=False)
+                return tf.reduce_mean(tf.square(batch - reconstruction), axis=2)
+
+            self._errors = timestep_errors
+        return self._errors
+
+    def score(self, processed, data):
+        # Reconstruction error per record, compared against the threshold learned at fit time
+        return self._record_errors(processed, sequence_layout(data, self.window))
+
+    def score_rows(self, processed, data, rows):
+        # Windows still come from the whole batch, but only those covering a requested record
+        # are run through the model; each requested record gets the same error as in score()
+        layout_rows, pad, starts = sequence_layout(data, self.window)
+        wanted = np.zeros(processed.shape[0], dtype=bool)
+        wanted[rows] = True
+        covered = np.concatenate([[0], np.cumsum(wanted[layout_rows] & ~pad)])
+        needed = starts[covered[starts + self.window] > covered[starts]]
+        return self._record_errors(processed, (layout_rows, pad, needed))[rows]
+
+    def _record_errors(self, processed, layout):
+        # Each record's error is its own timestep's error in the window that reconstructs it
+        # best. A spike distorts the reconstruction of the records sharing a window with it,
+        # but each of them is also covered by a window without the spike, so only the spike
+        # itself keeps a high error.
+        rows, pad, starts = layout
+        timestep_errors = self._error_fn()
+        errors = np.concatenate(
+            [timestep_errors(batch).numpy() for batch in self._window_dataset(processed, layout)]
+            or [np.zeros((0, self.window))]
+        )
+        per_position = np.full(len(rows), np.inf)
+        np.minimum.at(per_position, starts[:, None] + np.arange(self.window), errors)
+
+        record_errors = np.zeros(processed.shape[0])
+        scored = ~pad & np.isfinite(per_position)
+        record_errors[rows[scored]] = per_position[scored]
+        return record_errors
+
+    @property
+    def threshold(self):
+        return self.lstm_threshold
+
+    def manifest(self):
+        return {'threshold': self.lstm_threshold, 'window_size': self.window}
+
+    def save(self, path):
+        self.model.save(path)
+
+    @classmethod
+    def load(cls, path, manifest):
+        return cls(load_model(path), manifest['threshold'], manifest['window_size'])
@@ -0,0 +1,58 @@
+import joblib
+from sklearn.svm import OneClassSVM
+from sklearn.linear_model import SGDOneClassSVM
+from sklearn.kernel_approximation import Nystroem, RBFSampler
+from sklearn.pipeline import Pipeline
+from src.detectors.base import Detector
+from config import settings
+
+class OneClassSVMDetector(Detector):
+    name = 'one_class_svm'
+    artifact = 'one_class_svm.joblib'
+
+    def __init__(self, model=None):
+        self.model = model
+
+    def fit(self, processed, data):
+        if settings.ONE_CLASS_SVM_BACKEND == 'exact':
+            self.model = OneClassSVM(nu=settings.ONE_CLASS_SVM_NU).fit(processed)
+            return self
+        if settings.ONE_CLASS_SVM_BACKEND != 'approximate':
+            raise ValueError(f"Unknown ONE_CLASS_SVM_BACKEND: {settings.ONE_CLASS_SVM_BACKEND}")
+
+        # Linear-time approximation: explicit RBF feature map + linear one-class SVM.
+        # gamma mirrors OneClassSVM's gamma='scale' so both backends see the same kernel.
+        gamma = 1.0 / (processed.shape[1] * processed.var()) if processed.var() > 0 else 1.0
+        approximations = {'nystroem': Nystroem, 'rff': RBFSampler}
+        if settings.ONE_CLASS_SVM_KERNEL_APPROXIMATION not in approximations:
+            raise ValueError(f"Unknown ONE_CLASS_SVM_KERNEL_APPROXIMATION: {settings.ONE_CLASS_SVM_KERNEL_APPROXIMATION}")
+        feature_map = approximations[settings.ONE_CLASS_SVM_KERNEL_APPROXIMATION](
+            gamma=gamma,
+            n_components=min(settings.ONE_CLASS_SVM_N_COMPONENTS, processed.shape[0]),
+            random_state=42
+        )
+        svm = SGDOneClassSVM(nu=settings.ONE_CLASS_SVM_NU, random_state=42)
+
+        batch_size = settings.ONE_CLASS_SVM_BATCH_SIZE
+        if batch_size and processed.shape[0] > batch_size:
+            # Mini-batch mode: the feature map is fit on the first batch, the SVM streams over the rest
+            feature_map.fit(processed[:batch_size])
+            for i in range(0, processed.shape[0], batch_size):
+                svm.partial_fit(feature_map.transform(processed[i:i + batch_size]))
+        else:
+            svm.fit(feature_map.fit_transform(processed))
+        self.model = Pipeline([('feature_map', feature_map), ('svm', svm)])
+        return self
+
+    def score(self, processed, data):
+        return -self.model.decision_function(processed)
+
+    def manifest(self):
+        return {'nu': settings.ONE_CLASS_SVM_NU, 'backend': settings.ONE_CLASS_SVM_BACKEND}
+
+    def save(self, path):
+        joblib.dump(self.model, path)
+
+    @classmethod
+    def load(cls, path, manifest):
+        return cls(joblib.load(path))
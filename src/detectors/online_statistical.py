@@ -0,0 +1,41 @@
+import threading
+from src.detectors.base import Detector
+from src.online_detector import OnlineStatisticalDetector
+from config import settings
+
+class OnlineStatisticalPlugin(Detector):
+    name = 'online_statistical'
+    artifact = 'online_statistical.json'
+    # Stateful and order-dependent, so it runs in-line rather than in the pool
+    inline = True
+
+    def __init__(self, online=None, z_score_threshold=None):
+        # Per-service streaming z-score; its state carries across batches
+        self.online = online or OnlineStatisticalDetector()
+        self.z_score_threshold = settings.Z_SCORE_THRESHOLD if z_score_threshold is None else z_score_threshold
+        # Consumer workers may score batches concurrently; state updates must not interleave
+        self.lock = threading.Lock()
+
+    def fit(self, processed, data):
+        # Warm the streaming statistics up on the reference window
+        with self.lock:
+            self.online.score(data)
+        return self
+
+    def score(self, processed, data):
+        with self.lock:
+            return self.online.score(data)
+
+    @property
+    def threshold(self):
+        return self.z_score_threshold
+
+    def manifest(self):
+        return {'z_score_threshold': self.z_score_threshold}
+
+    def save(self, path):
+        self.online.save(path)
+
+    @classmethod
+    def load(cls, path, manifest):
+        return cls(OnlineStatisticalDetector.load(path), manifest['z_score_threshold'])
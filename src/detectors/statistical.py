@@ -0,0 +1,24 @@
+import numpy as np
+from src.detectors.base import Detector
+from config import settings
+
+class StatisticalDetector(Detector):
+    name = 'statistical'
+
+    def __init__(self, z_score_threshold=None):
+        self.z_score_threshold = settings.Z_SCORE_THRESHOLD if z_score_threshold is None else z_score_threshold
+
+    def score(self, processed, data):
+        # Largest absolute Z-score per row on the scaled data (which is already standardized)
+        return np.abs(processed).max(axis=1)
+
+    @property
+    def threshold(self):
+        return self.z_score_threshold
+
+    def manifest(self):
+        return {'z_score_threshold': self.z_score_threshold}
+
+    @classmethod
+    def load(cls, path, manifest):
+        return cls(manifest['z_score_threshold'])
@@ -0,0 +1,33 @@
+import threading
+from src.detectors.base import Detector
+from src.trace_index import TraceIndex
+
+class TraceIndexDetector(Detector):
+    name = 'trace_index'
+    # Open traces carry across batches, so it runs in-line in arrival order
+    inline = True
+    # Nothing is learned from the reference window; the bounds come from settings
+    needs_fit = False
+
+    def __init__(self, index=None):
+        # Votes for records with a missing span or in a broken trace; uses trace_id/span_id
+        # rather than the scaled metrics, so it catches what the metric detectors cannot
+        self.index = index or TraceIndex()
+        # Consumer workers may score batches concurrently; index updates must not interleave
+        self.lock = threading.Lock()
+
+    def score(self, processed, data):
+        with self.lock:
+            return self.index.score(data)
+
+    @property
+    def threshold(self):
+        return 0.5
+
+    def manifest(self):
+        # Open traces are transient and not persisted; only the eviction bounds are
+        return {'ttl': self.index.ttl, 'max_traces': self.index.max_traces}
+
+    @classmethod
+    def load(cls, path, manifest):
+        return cls(TraceIndex(manifest['ttl'], manifest['max_traces']))
@@ -0,0 +1,140 @@
+"""Read and write MELT datasets as partitioned Parquet, Arrow IPC or CSV.
+
+Usage: python -m src.ingest generate outputs/capture --format parquet --size 1000000
+       python -m src.ingest convert capture.csv outputs/capture --format arrow
+"""
+import os
+import glob
+import argparse
+import logging
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from src import schema
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+FORMATS = ('parquet', 'arrow', 'csv')
+EXTENSIONS = {'parquet': '.parquet', 'arrow': '.arrow', 'csv': '.csv'}
+# Other common suffixes for Arrow IPC files
+ARROW_EXTENSIONS = ('.arrow', '.feather', '.ipc')
+
+def infer_format(path):
+    # From the file extension, or from the part files of a dataset directory
+    if os.path.isdir(path):
+        for fmt in FORMATS:
+            if _part_files(path, fmt):
+                return fmt
+        raise ValueError(f"No dataset part files in {path}")
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.parquet':
+        return 'parquet'
+    if extension in ARROW_EXTENSIONS:
+        return 'arrow'
+    if extension == '.csv':
+        return 'csv'
+    raise ValueError(f"Cannot infer the dataset format of {path}")
+
+def _part_files(path, fmt):
+    extensions = ARROW_EXTENSIONS if fmt == 'arrow' else (EXTENSIONS[fmt],)
+    return sorted(f for ext in extensions for f in glob.glob(os.path.join(path, f"*{ext}")))
+
+class DatasetWriter:
+    def __init__(self, path, format=None):
+        # Parquet and Arrow datasets are directories with one part file per chunk, so a
+        # writer never holds more than one chunk; CSV appends to a single file
+        self.path = path
+        self.format = format or settings.DATA_FORMAT
+        if self.format not in FORMATS:
+            raise ValueError(f"Unknown dataset format: {self.format}")
+        self.parts = 0
+        if self.format == 'csv':
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        else:
+            os.makedirs(path, exist_ok=True)
+            # Replace the parts of a previous run instead of mixing them in
+            for part in _part_files(path, self.format):
+                os.remove(part)
+
+    def write(self, df):
+        if self.format == 'csv':
+            df.to_csv(self.path, mode='w' if self.parts == 0 else 'a', header=self.parts == 0, index=False)
+        else:
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            part = os.path.join(self.path, f"part-{self.parts:05d}{EXTENSIONS[self.format]}")
+            if self.format == 'parquet':
+                pq.write_table(table, part, compression=settings.PARQUET_COMPRESSION)
+            else:
+                with pa.OSFile(part, 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+                    writer.write_table(table, max_chunksize=settings.CHUNK_SIZE)
+        self.parts += 1
+
+def write_dataset(chunks, path, format=None):
+    writer = DatasetWriter(path, format)
+    for chunk in chunks:
+        writer.write(chunk)
+    return path
+
+def _arrow_batches(file_path):
+    # Memory-mapped and zero-copy: batches reference the mapped file rather than the heap
+    with pa.memory_map(file_path, 'r') as source:
+        reader = pa.ipc.open_file(source)
+        for i in range(reader.num_record_batches):
+            yield reader.get_batch(i)
+
+def _parquet_batches(file_path, batch_size, columns):
+    parquet_file = pq.ParquetFile(file_path, memory_map=True)
+    yield from parquet_file.iter_batches(batch_size=batch_size, columns=columns)
+
+def read_batches(path, batch_size=None, columns=None, format=None):
+    # Yields the dataset as DataFrames of at most batch_size rows in the compact schema;
+    # only the current batch is materialized, so captures larger than memory can be scanned
+    batch_size = batch_size or settings.CHUNK_SIZE
+    fmt = format or infer_format(path)
+    if fmt == 'csv':
+        for chunk in pd.read_csv(path, chunksize=batch_size, usecols=columns):
+            yield schema.conform(chunk)
+        return
+
+    files = _part_files(path, fmt) if os.path.isdir(path) else [path]
+    for file_path in files:
+        if fmt == 'parquet':
+            batches = _parquet_batches(file_path, batch_size, columns)
+        else:
+            batches = _arrow_batches(file_path)
+        for batch in batches:
+            if columns is not None and fmt == 'arrow':
+                batch = batch.select(columns)
+            # Slicing a record batch is zero-copy, so re-chunking to batch_size is free
+            for offset in range(0, batch.num_rows, batch_size):
+                yield schema.conform(batch.slice(offset, batch_size).to_pandas())
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    generate = subparsers.add_parser('generate', help='Write synthetic data as a dataset')
+    generate.add_argument('output')
+    generate.add_argument('--format', choices=FORMATS, default=settings.DATA_FORMAT)
+    generate.add_argument('--size', type=int, default=settings.DATA_SIZE)
+    generate.add_argument('--seed', type=int, default=settings.RANDOM_SEED)
+
+    convert = subparsers.add_parser('convert', help='Re-encode an existing dataset in another format')
+    convert.add_argument('input')
+    convert.add_argument('output')
+    convert.add_argument('--format', choices=FORMATS, default=settings.DATA_FORMAT)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    if args.command == 'generate':
+        from src.data_generator import SyntheticDataGenerator
+        generator = SyntheticDataGenerator(seed=args.seed)
+        generator.size = args.size
+        generator.write_dataset(args.output, args.format)
+    else:
+        write_dataset(read_batches(args.input), args.output, args.format)
+        logger.info(f"Converted {args.input} to {args.format} at {args.output}")
+
+if __name__ == '__main__':
+    main()
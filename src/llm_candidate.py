@@ -1,11 +1,147 @@
 import json
+import math
+import time
 import logging
-import groq
+import sqlite3
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 import random
+from src import metrics
 from config import settings
 
 logger = logging.getLogger(__name__)
 
+CALL_SECONDS = metrics.histogram('llm_call_seconds', 'Latency of one LLM provider call', ('outcome',))
+CALLS = metrics.counter('llm_calls_total', 'LLM provider calls by outcome', ('outcome',))
+RETRIES = metrics.counter('llm_retries_total', 'LLM calls retried after a transient error')
+FALLBACKS = metrics.counter('llm_fallbacks_total', 'Anomalies answered by the mock fallback after a provider error')
+CACHE_LOOKUPS = metrics.counter('llm_cache_lookups_total', 'Root-cause cache lookups', ('result',))
+RATE_LIMIT_WAIT = metrics.histogram('llm_rate_limit_wait_seconds', 'Time spent waiting for the rate limiters')
+
+def retryable_errors():
+    # Transient provider errors worth retrying; auth and request errors are not.
+    # groq is only imported once a real provider call is made
+    import groq
+    return (
+        groq.RateLimitError,
+        groq.APIConnectionError,
+        groq.APITimeoutError,
+        groq.InternalServerError
+    )
+
+class TokenBucket:
+    def __init__(self, per_minute):
+        # per_minute=None disables the limit
+        self.rate = per_minute / 60.0 if per_minute else None
+        self.capacity = per_minute
+        self.tokens = per_minute
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, amount=1):
+        if self.rate is None:
+            return
+        # A request larger than the bucket could never be admitted, so clamp it
+        amount = min(amount, self.capacity)
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                wait = (amount - self.tokens) / self.rate
+            time.sleep(wait)
+
+def anomaly_signature(metadata):
+    # Near-identical anomalies share a signature: same categorical context,
+    # metrics in the same bucket and the same span presence
+    span_id = metadata.get('span_id')
+    span_missing = span_id is None or (isinstance(span_id, float) and math.isnan(span_id))
+    cpu_bucket = int((metadata.get('cpu_usage') or 0) // settings.LLM_CACHE_CPU_BUCKET) * settings.LLM_CACHE_CPU_BUCKET
+    latency_bucket = int((metadata.get('latency') or 0) // settings.LLM_CACHE_LATENCY_BUCKET) * settings.LLM_CACHE_LATENCY_BUCKET
+    return '|'.join([
+        str(metadata.get('service')),
+        str(metadata.get('log_level')),
+        str(metadata.get('event_type')),
+        f"cpu={cpu_bucket}",
+        f"latency={latency_bucket}",
+        f"span_missing={span_missing}"
+    ])
+
+class RootCauseCache:
+    def __init__(self, max_entries, ttl, path=None):
+        # In-memory LRU with TTL, optionally backed by SQLite so entries survive restarts
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()  # signature -> (created, response)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.db = None
+        if path:
+            self.db = sqlite3.connect(path, check_same_thread=False)
+            self.db.execute("CREATE TABLE IF NOT EXISTS root_causes (signature TEXT PRIMARY KEY, created REAL, response TEXT)")
+            self.db.execute("CREATE INDEX IF NOT EXISTS root_causes_created ON root_causes (created)")
+            self._purge_expired()
+            self.db.commit()
+
+    def _expired(self, created):
+        return self.ttl is not None and time.time() - created > self.ttl
+
+    def get(self, signature):
+        with self.lock:
+            entry = self.entries.get(signature)
+            if entry is None and self.db is not None:
+                row = self.db.execute(
+                    "SELECT created, response FROM root_causes WHERE signature = ?", (signature,)
+                ).fetchone()
+                if row is not None:
+                    entry = tuple(row)
+                    self._store(signature, entry)
+            if entry is None or self._expired(entry[0]):
+                if entry is not None:
+                    del self.entries[signature]
+                self.misses += 1
+                return None
+            self.entries.move_to_end(signature)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, signature, response):
+        entry = (time.time(), response)
+        with self.lock:
+            self._store(signature, entry)
+            if self.db is not None:
+                self.db.execute("INSERT OR REPLACE INTO root_causes VALUES (?, ?, ?)", (signature, *entry))
+                self._purge_expired()
+                self.db.commit()
+
+    def _purge_expired(self):
+        # Expired rows are never served again; dropping them on write keeps the file bounded
+        # by what was written within one TTL
+        if self.ttl is not None:
+            self.db.execute("DELETE FROM root_causes WHERE created < ?", (time.time() - self.ttl,))
+
+    def _store(self, signature, entry):
+        self.entries[signature] = entry
+        self.entries.move_to_end(signature)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self):
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions, 'size': len(self.entries)}
+
+    def close(self):
+        if self.db is not None:
+            self.db.close()
+            self.db = None
+
 class LLMCandidateGenerator:
     def __init__(self):
         self.provider = settings.LLM_PROVIDER
@@ -13,30 +149,133 @@ class LLMCandidateGenerator:
         self.max_tokens = settings.LLM_MAX_TOKENS
         self.temperature = settings.LLM_TEMPERATURE
         self.api_key = settings.GROQ_API_KEY
-        
-    def generate_candidate(self, metadata):
-        # Prepare the prompt
-        prompt = f"""
+        self.base_url = settings.GROQ_BASE_URL
+        self.request_limiter = TokenBucket(settings.LLM_REQUESTS_PER_MINUTE)
+        self.token_limiter = TokenBucket(settings.LLM_TOKENS_PER_MINUTE)
+        self._client = None
+        self._client_lock = threading.Lock()
+        self.cache = RootCauseCache(
+            settings.LLM_CACHE_MAX_ENTRIES,
+            settings.LLM_CACHE_TTL,
+            settings.LLM_CACHE_PATH
+        ) if settings.LLM_CACHE_ENABLED else None
+
+    @property
+    def client(self):
+        # One client (and its HTTP connection pool) shared by every call and thread
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    import groq
+                    # Retries are handled here, with rate limiting and jitter
+                    self._client = groq.Client(api_key=self.api_key, base_url=self.base_url, max_retries=0)
+        return self._client
+
+    def _build_prompt(self, metadata):
+        return f"""
         Based on the following metadata from a software system, generate a likely root cause:
         {metadata}
-        
+
         Return your answer in a JSON format with keys 'anomaly_id', 'root_cause', and 'confidence'.
         """
-        
+
+    def generate_candidate(self, metadata):
+        if self.cache is None:
+            return self._generate(metadata)[0]
+
+        signature = anomaly_signature(metadata)
+        cached = self.cache.get(signature)
+        CACHE_LOOKUPS.inc(result='miss' if cached is None else 'hit')
+        if cached is not None:
+            return self._with_anomaly_id(cached, metadata.get('id', 'unknown'))
+        response, cacheable = self._generate(metadata)
+        if cacheable:
+            self.cache.put(signature, response)
+        return response
+
+    def _generate(self, metadata):
+        # Returns the response and whether it came from the model (fallbacks are not cached)
+        # Prepare the prompt
+        prompt = self._build_prompt(metadata)
+
         if self.provider == "groq":
             try:
-                return self._call_groq(prompt)
+                return self._call_with_retry(prompt), True
             except Exception as e:
                 logger.error(f"Error calling Groq API: {e}")
+                FALLBACKS.inc()
                 # Fallback to mock response using metadata
-                return self._mock_llm_call(metadata)
+                return self._mock_llm_call(metadata), False
+        else:
+            return self._mock_llm_call(metadata), True
+
+    def _with_anomaly_id(self, response, anomaly_id):
+        # Shared root causes are fanned back out under each anomaly's own id
+        try:
+            data = json.loads(response)
+        except (TypeError, json.JSONDecodeError):
+            return response
+        if not isinstance(data, dict):
+            return response
+        data['anomaly_id'] = anomaly_id
+        return json.dumps(data)
+
+    def generate_candidates(self, anomalies):
+        # Bounded fan-out over a thread pool; results keep the order of the input
+        if not anomalies:
+            return []
+        if self.cache is None:
+            groups = {i: [i] for i in range(len(anomalies))}
         else:
-            return self._mock_llm_call(metadata)
-    
+            # Coalesce anomalies with the same signature into a single request
+            groups = {}
+            for i, anomaly in enumerate(anomalies):
+                groups.setdefault(anomaly_signature(anomaly), []).append(i)
+
+        representatives = [anomalies[indices[0]] for indices in groups.values()]
+        workers = min(settings.LLM_MAX_CONCURRENCY, len(representatives))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            responses = list(executor.map(self.generate_candidate, representatives))
+
+        results = [None] * len(anomalies)
+        for indices, response in zip(groups.values(), responses):
+            for i in indices:
+                results[i] = self._with_anomaly_id(response, anomalies[i].get('id', 'unknown'))
+        return results
+
+    def _call_with_retry(self, prompt):
+        # Rough token estimate (~4 characters per token) plus the completion budget
+        tokens = len(prompt) // 4 + self.max_tokens
+        retryable = retryable_errors()
+        for attempt in range(settings.LLM_MAX_RETRIES + 1):
+            with RATE_LIMIT_WAIT.time():
+                self.request_limiter.acquire()
+                self.token_limiter.acquire(tokens)
+            start = time.perf_counter()
+            try:
+                response = self._call_groq(prompt)
+            except retryable as e:
+                CALL_SECONDS.observe(time.perf_counter() - start, outcome='retryable_error')
+                CALLS.inc(outcome='retryable_error')
+                if attempt == settings.LLM_MAX_RETRIES:
+                    raise
+                RETRIES.inc()
+                # Full jitter: sleep a random share of the exponential backoff
+                backoff = min(settings.LLM_RETRY_MAX_BACKOFF, settings.LLM_RETRY_BACKOFF * 2 ** attempt)
+                delay = random.uniform(0, backoff)
+                logger.warning(f"Groq call failed ({e}), retrying in {delay:.2f}s")
+                time.sleep(delay)
+            except Exception:
+                CALL_SECONDS.observe(time.perf_counter() - start, outcome='error')
+                CALLS.inc(outcome='error')
+                raise
+            else:
+                CALL_SECONDS.observe(time.perf_counter() - start, outcome='success')
+                CALLS.inc(outcome='success')
+                return response
+
     def _call_groq(self, prompt):
-        client = groq.Client(api_key=self.api_key)
-        
-        response = client.chat.completions.create(
+        response = self.client.chat.completions.create(
             model=self.model,
             messages=[
                 {"role": "system", "content": "You are a helpful DevOps engineer analyzing system anomalies."},
@@ -46,9 +285,16 @@ class LLMCandidateGenerator:
             temperature=self.temperature,
             response_format={"type": "json_object"}
         )
-        
+
         return response.choices[0].message.content
 
+    def close(self):
+        if self._client is not None:
+            self._client.close()
+            self._client = None
+        if self.cache is not None:
+            self.cache.close()
+
     def _mock_llm_call(self, metadata):
         # Use metadata to generate varied mock responses
         service = metadata.get('service', 'unknown service')
@@ -56,7 +302,7 @@ class LLMCandidateGenerator:
         cpu_usage = metadata.get('cpu_usage', 0)
         latency = metadata.get('latency', 0)
         span_id = metadata.get('span_id', '')
-        
+
         if log_level in ['ERROR', 'FATAL']:
             root_cause = f"{log_level} log detected in {service}, possibly due to a software bug or configuration error."
         elif cpu_usage > 90:
@@ -67,15 +313,15 @@ class LLMCandidateGenerator:
             root_cause = f"Missing span ID in {service}, indicating a tracing issue or service disruption."
         else:
             root_cause = "Anomaly detected due to multiple factors, requiring further investigation."
-        
+
         mock_response = {
             'anomaly_id': metadata.get('id', 'unknown'),
             'root_cause': root_cause,
             'confidence': round(0.7 + 0.3 * random.random(), 2)  # Random confidence between 0.7 and 1.0
         }
-        
+
         return json.dumps(mock_response)
-    
+
     def parse_response(self, response):
         # Parse the JSON response from the LLM
         try:
@@ -83,4 +329,4 @@ class LLMCandidateGenerator:
             return data
         except json.JSONDecodeError as e:
             logger.error(f"Failed to parse LLM response: {e}")
-            return None
\ No newline at end of file
+            return None
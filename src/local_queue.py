@@ -0,0 +1,353 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+import hashlib
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+URL_PREFIX = 'local://'
+ARN_PREFIX = 'arn:local:sqs:'
+# Same limits as SQS
+BATCH_LIMIT = 10
+DEDUPLICATION_WINDOW = 300
+# Expired deduplication ids are ignored when sending and only deleted this often
+DEDUPLICATION_PURGE_INTERVAL = 60
+MAX_WAIT_TIME_SECONDS = 20
+# How often a long poll re-checks the queue
+POLL_INTERVAL = 0.05
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS queues (
+    name TEXT PRIMARY KEY,
+    fifo INTEGER NOT NULL,
+    content_dedup INTEGER NOT NULL,
+    visibility_timeout REAL NOT NULL,
+    max_receive_count INTEGER,
+    dead_letter_queue TEXT
+);
+CREATE TABLE IF NOT EXISTS messages (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    queue TEXT NOT NULL,
+    message_id TEXT NOT NULL,
+    body TEXT NOT NULL,
+    group_id TEXT,
+    sent_at REAL NOT NULL,
+    visible_at REAL NOT NULL,
+    receive_count INTEGER NOT NULL DEFAULT 0,
+    receipt_handle TEXT UNIQUE
+);
+CREATE INDEX IF NOT EXISTS messages_visible ON messages (queue, visible_at);
+CREATE INDEX IF NOT EXISTS messages_group ON messages (queue, group_id, seq);
+CREATE TABLE IF NOT EXISTS deduplication (
+    queue TEXT NOT NULL,
+    dedup_id TEXT NOT NULL,
+    expires_at REAL NOT NULL,
+    PRIMARY KEY (queue, dedup_id)
+);
+CREATE INDEX IF NOT EXISTS deduplication_expiry ON deduplication (expires_at);
+"""
+
+class LocalQueueError(Exception):
+    def __init__(self, code, message):
+        super().__init__(f"{code}: {message}")
+        self.code = code
+
+class LocalQueueClient:
+    def __init__(self, path):
+        # Drop-in for the subset of the boto3 SQS client that SQSHandler uses, stored in one
+        # SQLite file. Every state change runs in a write transaction, so any number of
+        # threads and processes can share the file.
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._local = threading.local()
+        self._deduplication_purged_at = 0.0
+        self._connection().executescript(SCHEMA)
+
+    def _connection(self):
+        # One connection per thread and per process; SQLite connections survive neither a fork
+        # nor being shared between threads
+        db = getattr(self._local, 'db', None)
+        if db is None or self._local.pid != os.getpid():
+            db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            db.row_factory = sqlite3.Row
+            self._local.db, self._local.pid = db, os.getpid()
+        return db
+
+    def _transaction(self):
+        return _Transaction(self._connection())
+
+    def _queue(self, db, queue_url):
+        if not queue_url.startswith(URL_PREFIX):
+            raise LocalQueueError('QueueDoesNotExist', f"Not a local queue URL: {queue_url}")
+        queue = db.execute('SELECT * FROM queues WHERE name = ?', (queue_url[len(URL_PREFIX):],)).fetchone()
+        if queue is None:
+            raise LocalQueueError('QueueDoesNotExist', f"No queue at {queue_url}")
+        return queue
+
+    def create_queue(self, QueueName, Attributes=None):
+        attributes = Attributes or {}
+        redrive = json.loads(attributes.get('RedrivePolicy', '{}'))
+        dead_letter_queue = redrive.get('deadLetterTargetArn')
+        if dead_letter_queue is not None:
+            dead_letter_queue = dead_letter_queue[len(ARN_PREFIX):]
+        with self._transaction() as db:
+            # Like SQS, creating an existing queue returns it; the attributes are updated
+            db.execute(
+                'INSERT INTO queues VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (name) DO UPDATE SET '
+                'fifo = excluded.fifo, content_dedup = excluded.content_dedup, '
+                'visibility_timeout = excluded.visibility_timeout, '
+                'max_receive_count = excluded.max_receive_count, dead_letter_queue = excluded.dead_letter_queue',
+                (
+                    QueueName,
+                    attributes.get('FifoQueue') == 'true',
+                    attributes.get('ContentBasedDeduplication') == 'true',
+                    float(attributes.get('VisibilityTimeout', 30)),
+                    int(redrive['maxReceiveCount']) if 'maxReceiveCount' in redrive else None,
+                    dead_letter_queue
+                )
+            )
+        return {'QueueUrl': URL_PREFIX + QueueName}
+
+    def get_queue_attributes(self, QueueUrl, AttributeNames=None):
+        now = time.time()
+        with self._transaction() as db:
+            queue = self._queue(db, QueueUrl)
+            visible, in_flight = db.execute(
+                'SELECT COALESCE(SUM(visible_at <= ?), 0), COALESCE(SUM(visible_at > ?), 0) '
+                'FROM messages WHERE queue = ?',
+                (now, now, queue['name'])
+            ).fetchone()
+        return {'Attributes': {
+            'QueueArn': ARN_PREFIX + queue['name'],
+            'ApproximateNumberOfMessages': str(visible),
+            'ApproximateNumberOfMessagesNotVisible': str(in_flight),
+            'FifoQueue': str(bool(queue['fifo'])).lower(),
+            'VisibilityTimeout': str(int(queue['visibility_timeout']))
+        }}
+
+    def _send(self, db, queue, body, group_id=None, dedup_id=None):
+        if queue['fifo'] and group_id is None:
+            raise LocalQueueError('MissingParameter', 'FIFO queues require a MessageGroupId')
+        now = time.time()
+        message_id = str(uuid.uuid4())
+        if queue['fifo']:
+            if dedup_id is None and queue['content_dedup']:
+                dedup_id = hashlib.sha256(body.encode()).hexdigest()
+            if dedup_id is not None:
+                # A repeat within the deduplication window is accepted but not enqueued again;
+                # an expired id counts as new whether or not it was purged yet
+                self._purge_deduplication(db, now)
+                inserted = db.execute(
+                    'INSERT INTO deduplication VALUES (?, ?, ?) ON CONFLICT (queue, dedup_id) '
+                    'DO UPDATE SET expires_at = excluded.expires_at WHERE deduplication.expires_at <= ?',
+                    (queue['name'], dedup_id, now + DEDUPLICATION_WINDOW, now)
+                ).rowcount
+                if not inserted:
+                    return message_id
+        db.execute(
+            'INSERT INTO messages (queue, message_id, body, group_id, sent_at, visible_at) VALUES (?, ?, ?, ?, ?, ?)',
+            (queue['name'], message_id, body, group_id, now, now)
+        )
+        return message_id
+
+    def _purge_deduplication(self, db, now):
+        # Only keeps the table small, so it runs at most once per interval and client
+        if now - self._deduplication_purged_at >= DEDUPLICATION_PURGE_INTERVAL:
+            db.execute('DELETE FROM deduplication WHERE expires_at <= ?', (now,))
+            self._deduplication_purged_at = now
+
+    def send_message(self, QueueUrl, MessageBody, MessageGroupId=None, MessageDeduplicationId=None):
+        with self._transaction() as db:
+            queue = self._queue(db, QueueUrl)
+            message_id = self._send(db, queue, MessageBody, MessageGroupId, MessageDeduplicationId)
+        return {'MessageId': message_id, 'MD5OfMessageBody': hashlib.md5(MessageBody.encode()).hexdigest()}
+
+    def send_message_batch(self, QueueUrl, Entries):
+        if len(Entries) > BATCH_LIMIT:
+            raise LocalQueueError('TooManyEntriesInBatchRequest', f"At most {BATCH_LIMIT} entries per batch")
+        successful, failed = [], []
+        with self._transaction() as db:
+            queue = self._queue(db, QueueUrl)
+            for entry in Entries:
+                try:
+                    message_id = self._send(
+                        db, queue, entry['MessageBody'], entry.get('MessageGroupId'), entry.get('MessageDeduplicationId')
+                    )
+                except LocalQueueError as e:
+                    failed.append({'Id': entry['Id'], 'SenderFault': True, 'Code': e.code, 'Message': str(e)})
+                    continue
+                successful.append({
+                    'Id': entry['Id'],
+                    'MessageId': message_id,
+                    'MD5OfMessageBody': hashlib.md5(entry['MessageBody'].encode()).hexdigest()
+                })
+        return {'Successful': successful, 'Failed': failed}
+
+    def _dead_letter(self, db, queue, now):
+        # Visible messages that were already received max_receive_count times move to the
+        # dead-letter queue (or are dropped without one) instead of being delivered again
+        if queue['max_receive_count'] is None:
+            return
+        exhausted = 'queue = ? AND visible_at <= ? AND receive_count >= ?'
+        args = (queue['name'], now, queue['max_receive_count'])
+        if queue['dead_letter_queue'] is None:
+            moved = db.execute(f'DELETE FROM messages WHERE {exhausted}', args).rowcount
+        else:
+            moved = db.execute(
+                f'UPDATE messages SET queue = ?, receive_count = 0, receipt_handle = NULL WHERE {exhausted}',
+                (queue['dead_letter_queue'],) + args
+            ).rowcount
+        if moved:
+            logger.warning(f"{moved} messages exceeded {queue['max_receive_count']} receives on {queue['name']}")
+
+    def _receive(self, queue_url, max_messages, visibility_timeout):
+        now = time.time()
+        with self._transaction() as db:
+            queue = self._queue(db, queue_url)
+            self._dead_letter(db, queue, now)
+            if queue['fifo']:
+                # Messages of a group are delivered in order, and not while an earlier
+                # message of the same group is in flight. Like SQS, a receive returns as many
+                # messages of one group as it can, oldest group first, so concurrent consumers
+                # each lock as few groups as possible. The groups and their heads are found by
+                # skipping through the (queue, group_id, seq) index, one lookup per group, and
+                # the in-flight messages through the visibility index, so a receive does not
+                # scan the whole queue.
+                heads = db.execute(
+                    'WITH RECURSIVE groups (group_id) AS ('
+                    '  SELECT MIN(group_id) FROM messages WHERE queue = :queue'
+                    '  UNION ALL SELECT (SELECT MIN(group_id) FROM messages WHERE queue = :queue AND group_id > groups.group_id)'
+                    '  FROM groups WHERE groups.group_id IS NOT NULL'
+                    ') SELECT group_id, (SELECT MIN(seq) FROM messages WHERE queue = :queue AND group_id = groups.group_id) AS head'
+                    ' FROM groups WHERE group_id IS NOT NULL AND group_id NOT IN ('
+                    '  SELECT group_id FROM messages WHERE queue = :queue AND visible_at > :now'
+                    ') ORDER BY head',
+                    {'queue': queue['name'], 'now': now}
+                ).fetchall()
+                rows = []
+                for head in heads:
+                    if len(rows) == max_messages:
+                        break
+                    rows.extend(db.execute(
+                        'SELECT * FROM messages WHERE queue = ? AND group_id = ? ORDER BY seq LIMIT ?',
+                        (queue['name'], head['group_id'], max_messages - len(rows))
+                    ).fetchall())
+            else:
+                rows = db.execute(
+                    'SELECT * FROM messages WHERE queue = ? AND visible_at <= ? ORDER BY seq LIMIT ?',
+                    (queue['name'], now, max_messages)
+                ).fetchall()
+            timeout = queue['visibility_timeout'] if visibility_timeout is None else visibility_timeout
+            messages = []
+            for row in rows:
+                # A fresh receipt handle per delivery; handles from earlier deliveries go stale
+                handle = uuid.uuid4().hex
+                db.execute(
+                    'UPDATE messages SET visible_at = ?, receive_count = receive_count + 1, receipt_handle = ? WHERE seq = ?',
+                    (now + timeout, handle, row['seq'])
+                )
+                attributes = {
+                    'ApproximateReceiveCount': str(row['receive_count'] + 1),
+                    'SentTimestamp': str(int(row['sent_at'] * 1000))
+                }
+                if row['group_id'] is not None:
+                    attributes['MessageGroupId'] = row['group_id']
+                    attributes['SequenceNumber'] = str(row['seq'])
+                messages.append({
+                    'MessageId': row['message_id'],
+                    'ReceiptHandle': handle,
+                    'MD5OfBody': hashlib.md5(row['body'].encode()).hexdigest(),
+                    'Body': row['body'],
+                    'Attributes': attributes
+                })
+        return messages
+
+    def receive_message(self, QueueUrl, MaxNumberOfMessages=1, VisibilityTimeout=None, WaitTimeSeconds=0, **kwargs):
+        # Long polling: re-check every POLL_INTERVAL until a message arrives or the wait ends
+        max_messages = max(1, min(MaxNumberOfMessages, BATCH_LIMIT))
+        deadline = time.monotonic() + min(WaitTimeSeconds or 0, MAX_WAIT_TIME_SECONDS)
+        while True:
+            messages = self._receive(QueueUrl, max_messages, VisibilityTimeout)
+            if messages or time.monotonic() >= deadline:
+                return {'Messages': messages} if messages else {}
+            time.sleep(POLL_INTERVAL)
+
+    def _delete(self, db, queue, receipt_handle):
+        deleted = db.execute(
+            'DELETE FROM messages WHERE queue = ? AND receipt_handle = ?', (queue['name'], receipt_handle)
+        ).rowcount
+        if not deleted:
+            raise LocalQueueError('ReceiptHandleIsInvalid', 'The receipt handle is unknown or was superseded')
+
+    def delete_message(self, QueueUrl, ReceiptHandle):
+        with self._transaction() as db:
+            self._delete(db, self._queue(db, QueueUrl), ReceiptHandle)
+        return {}
+
+    def delete_message_batch(self, QueueUrl, Entries):
+        if len(Entries) > BATCH_LIMIT:
+            raise LocalQueueError('TooManyEntriesInBatchRequest', f"At most {BATCH_LIMIT} entries per batch")
+        successful, failed = [], []
+        with self._transaction() as db:
+            queue = self._queue(db, QueueUrl)
+            for entry in Entries:
+                try:
+                    self._delete(db, queue, entry['ReceiptHandle'])
+                    successful.append({'Id': entry['Id']})
+                except LocalQueueError as e:
+                    failed.append({'Id': entry['Id'], 'SenderFault': True, 'Code': e.code, 'Message': str(e)})
+        return {'Successful': successful, 'Failed': failed}
+
+    def change_message_visibility(self, QueueUrl, ReceiptHandle, VisibilityTimeout):
+        with self._transaction() as db:
+            queue = self._queue(db, QueueUrl)
+            updated = db.execute(
+                'UPDATE messages SET visible_at = ? WHERE queue = ? AND receipt_handle = ?',
+                (time.time() + VisibilityTimeout, queue['name'], ReceiptHandle)
+            ).rowcount
+        if not updated:
+            raise LocalQueueError('ReceiptHandleIsInvalid', 'The receipt handle is unknown or was superseded')
+        return {}
+
+    def change_message_visibility_batch(self, QueueUrl, Entries):
+        if len(Entries) > BATCH_LIMIT:
+            raise LocalQueueError('TooManyEntriesInBatchRequest', f"At most {BATCH_LIMIT} entries per batch")
+        now = time.time()
+        successful, failed = [], []
+        with self._transaction() as db:
+            queue = self._queue(db, QueueUrl)
+            for entry in Entries:
+                updated = db.execute(
+                    'UPDATE messages SET visible_at = ? WHERE queue = ? AND receipt_handle = ?',
+                    (now + entry['VisibilityTimeout'], queue['name'], entry['ReceiptHandle'])
+                ).rowcount
+                if updated:
+                    successful.append({'Id': entry['Id']})
+                else:
+                    failed.append({'Id': entry['Id'], 'SenderFault': True, 'Code': 'ReceiptHandleIsInvalid'})
+        return {'Successful': successful, 'Failed': failed}
+
+    def purge_queue(self, QueueUrl):
+        with self._transaction() as db:
+            queue = self._queue(db, QueueUrl)
+            db.execute('DELETE FROM messages WHERE queue = ?', (queue['name'],))
+        return {}
+
+class _Transaction:
+    # BEGIN IMMEDIATE takes the write lock up front, so two consumers can never select the
+    # same visible message; other processes wait up to the connection timeout
+    def __init__(self, db):
+        self.db = db
+
+    def __enter__(self):
+        self.db.execute('BEGIN IMMEDIATE')
+        return self.db
+
+    def __exit__(self, exc_type, exc, tb):
+        self.db.execute('ROLLBACK' if exc_type else 'COMMIT')
@@ -1,124 +1,215 @@
+import sys
+import argparse
 import logging
-import json
 import time
-import random  
+import queue
+import signal
+import itertools
+import threading
+import numpy as np
 import pandas as pd
-from memory_profiler import memory_usage
 from src.data_generator import SyntheticDataGenerator
-from src.anomaly_detector import AnomalyDetector
+from src.anomaly_detector import AnomalyDetector, DetectionResult, ModelVersionError
+from src.sharding import ShardedDetector
 from src.llm_candidate import LLMCandidateGenerator
 from src.sqs_handler import SQSHandler
+from src.pipeline import Stage, JsonArraySink, run_stages
+from src.consumer import ConsumerPool
+from src.metrics import MetricsExporter
+from src.ingest import DatasetWriter, read_batches
+from src import schema
 from config import settings
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-def main():
+DATA_PATH = 'outputs/synthetic_data'  # A directory of part files, or DATA_PATH.csv for CSV
+ANOMALIES_PATH = 'outputs/anomalies.json'
+SHARDED_MODEL_DIR = f"{settings.MODEL_DIR}/sharded"
+METADATA_COLUMNS = ['timestamp', 'service', 'log_level', 'cpu_usage', 'latency', 'trace_id', 'span_id', 'event_type']
+
+def true_labels(df):
+    # In our synthetic data, we know anomalies were introduced in logs (ERROR/FATAL with error_rate),
+    # metrics (spikes with anomaly_rate) and traces (missing spans)
+    return (
+        df['log_level'].isin(['ERROR', 'FATAL'])
+        | (df['cpu_usage'] > 90)
+        | (df['latency'] > 500)
+        | df['span_id'].isna()
+    ).to_numpy(dtype=np.int8)
+
+def peak_rss_mib():
+    # Peak resident memory over the whole run. resource is Unix-only (ru_maxrss is in KiB on
+    # Linux, bytes on macOS); on Windows psutil reports the peak working set instead.
+    try:
+        import resource
+    except ImportError:
+        import psutil
+        return psutil.Process().memory_info().peak_wset / 2 ** 20
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak_rss / (2 ** 20 if sys.platform == 'darwin' else 2 ** 10)
+
+def main(input_path=None):
     start_time = time.time()
-    
-    # Step 1: Generate synthetic data
-    logger.info("Generating synthetic data...")
-    data_generator = SyntheticDataGenerator()
-    df = data_generator.to_csv('outputs/synthetic_data.csv')
-    
-    # Step 2: Set up SQS queue and send messages
+    input_path = input_path or settings.DATA_INPUT_PATH
+    # Prometheus endpoint and/or JSON snapshots, per METRICS_PORT / METRICS_SNAPSHOT_PATH
+    exporter = MetricsExporter().start()
+
+    # Set up SQS queue
     logger.info("Setting up SQS queue...")
     sqs = SQSHandler()
     sqs.create_queue(settings.SQS_QUEUE_NAME)
-    
-    # Send data to SQS in chunks
-    for i in range(0, len(df), settings.CHUNK_SIZE):
-        chunk = df.iloc[i:i+settings.CHUNK_SIZE]
-        for _, row in chunk.iterrows():
-            sqs.send_message(row.to_dict())
-    
-    # Step 3: Process messages from the queue and detect anomalies
-    logger.info("Processing messages for anomaly detection...")
-    detector = AnomalyDetector()
+
+    data_generator = SyntheticDataGenerator()
+    # Load trained detectors at startup; fit on a reference window only if none are saved yet
+    sharded = settings.DETECTOR_SHARDS != 1
+    try:
+        if sharded:
+            detector = ShardedDetector.load(SHARDED_MODEL_DIR)
+        else:
+            detector = AnomalyDetector.load(settings.MODEL_DIR, settings.MODEL_VERSION)
+    except FileNotFoundError:
+        detector = None
+    except ModelVersionError as e:
+        # e.g. saved in an older layout or without a detector added to the ensemble since
+        logger.warning(f"{e}; fitting a new version")
+        detector = None
     llm_generator = LLMCandidateGenerator()
-    
-    # We'll collect anomalies and their metadata for LLM processing
-    anomalies = []
-    
-    # Process messages in chunks for efficiency
+    sink = JsonArraySink(ANOMALIES_PATH)
+
+    # Stages overlap in time and are connected by bounded queues: generation -> SQS ->
+    # detection -> root cause -> sink. A slow stage fills its inbox and blocks its producer.
+    stop_event = threading.Event()
+    generated, enqueued, detected, explained = (
+        queue.Queue(maxsize=settings.PIPELINE_QUEUE_SIZE) for _ in range(4)
+    )
     processed_count = 0
-    while processed_count < len(df):
-        messages = sqs.receive_messages(max_messages=settings.SQS_MAX_MESSAGES)
-        if not messages:
-            break
-            
-        # Convert messages to DataFrame
-        data_batch = []
-        for msg in messages:
-            data_batch.append(json.loads(msg['Body']))
-        batch_df = pd.DataFrame(data_batch)
-        
+    batch_results = []
+    batch_labels = []
+    # Consumer workers share the evaluation state
+    results_lock = threading.Lock()
+
+    def generate():
+        # Step 1: Replay an existing dataset batch by batch, or generate synthetic data and
+        # write each chunk (Parquet/Arrow part file or CSV rows) as it is produced
+        if input_path:
+            logger.info(f"Replaying dataset {input_path}...")
+            yield from read_batches(input_path)
+            return
+        logger.info("Generating synthetic data...")
+        writer = DatasetWriter(DATA_PATH + '.csv' if settings.DATA_FORMAT == 'csv' else DATA_PATH)
+        for chunk in data_generator.generate_chunks():
+            writer.write(chunk)
+            yield chunk
+
+    source = generate()
+    if detector is None:
+        # Fit on the first FIT_WINDOW_SIZE records of the input before any consumer scores;
+        # the chunks read for it are put back in front of the rest, so every record is queued
+        logger.info("No saved detectors found, fitting on reference window...")
+        window, size = [], 0
+        for chunk in source:
+            window.append(chunk)
+            size += len(chunk)
+            if size >= settings.FIT_WINDOW_SIZE:
+                break
+        if window:
+            reference = pd.concat(window, ignore_index=True).iloc[:settings.FIT_WINDOW_SIZE]
+            if sharded:
+                detector = ShardedDetector().fit(reference)
+                detector.save(SHARDED_MODEL_DIR)
+            else:
+                detector = AnomalyDetector().fit(reference)
+                detector.save(settings.MODEL_DIR)
+        source = itertools.chain(window, source)
+
+    def enqueue(chunk):
+        # Step 2: Send the chunk to SQS (packed into few messages with SQS_PAYLOAD_FORMAT="arrow");
+        # only the message count travels on, so the consumers know when everything was handled
+        return len(sqs.send_frame(chunk)['Successful'])
+
+    def detect(messages):
+        # Step 3: Score one worker's batch of messages together; the pool deletes them afterwards
+        nonlocal processed_count
+
+        # Convert messages back to a DataFrame in the compact schema
+        batch_df = sqs.to_frame(messages)
+
         # Detect anomalies
-        results = detector.detect_anomalies(batch_df)
-        
-        # For each row, if the combined model flags it as anomaly, collect metadata for LLM
-        for i, row in batch_df.iterrows():
-            if results['combined'][i] == 1:
-                # Extract metadata (excluding raw message)
-                metadata = {
-                    'id': processed_count + i,
-                    'timestamp': row['timestamp'],
-                    'service': row['service'],
-                    'log_level': row['log_level'],
-                    'cpu_usage': row['cpu_usage'],
-                    'latency': row['latency'],
-                    'trace_id': row['trace_id'],
-                    'span_id': row['span_id'],
-                    'event_type': row['event_type']
-                }
-                anomalies.append(metadata)
-                
-        # Delete processed messages from queue
-        for msg in messages:
-            sqs.delete_message(msg)
-            
-        processed_count += len(messages)
-        logger.info(f"Processed {processed_count} messages")
-    
-    # Step 4: Generate candidate root causes for anomalies using LLM
-    logger.info(f"Generating candidate root causes for {len(anomalies)} anomalies...")
-    candidates = []
-    for anomaly in anomalies:
-        response = llm_generator.generate_candidate(anomaly)
-        candidate = llm_generator.parse_response(response)
-        if candidate:
-            candidates.append(candidate)
-    
-    # Save candidates to JSON file
-    with open('outputs/anomalies.json', 'w') as f:
-        json.dump(candidates, f, indent=4)
-    
-    # Step 5: Evaluate the models (since we know the synthetic anomalies)
-    # For evaluation, we need the true labels. We'll create a true_anomalies list from the synthetic data.
-    # In our synthetic data, we know anomalies were introduced in logs (ERROR/FATAL with error_rate) and metrics (spikes with anomaly_rate)
-    true_anomalies = []
-    for _, row in df.iterrows():
-        is_anomaly = 0
-        if row['log_level'] in ['ERROR', 'FATAL']:
-            is_anomaly = 1
-        if row['cpu_usage'] > 90 or row['latency'] > 500:
-            is_anomaly = 1
-        if row['span_id'] is None:
-            is_anomaly = 1
-        true_anomalies.append(is_anomaly)
-    
-    evaluation = detector.evaluate(df, true_anomalies)
-    logger.info("Model Evaluation:")
-    for model_name, metrics in evaluation.items():
-        logger.info(f"{model_name}: Precision={metrics['precision']}, Recall={metrics['recall']}")
-    
+        results = detector.score(batch_df)
+
+        with results_lock:
+            batch_results.append(results)
+            batch_labels.append(true_labels(batch_df))
+            first_id = processed_count
+            processed_count += len(batch_df)
+        logger.info(f"Processed {processed_count} records")
+
+        # Collect metadata (excluding raw message) for every row the combined model flags
+        flagged = batch_df[results.combined.astype(bool)]
+        return schema.to_records(flagged[METADATA_COLUMNS].assign(id=first_id + flagged.index.to_numpy()))
+
+    def explain(anomalies):
+        # Step 4: Generate candidate root causes for anomalies using LLM
+        if not anomalies:
+            return None
+        logger.info(f"Generating candidate root causes for {len(anomalies)} anomalies...")
+        candidates = []
+        for response in llm_generator.generate_candidates(anomalies):
+            candidate = llm_generator.parse_response(response)
+            if candidate:
+                candidates.append(candidate)
+        return candidates
+
+    # CONSUMER_WORKERS concurrent receive -> detect -> delete loops; FIFO message groups
+    # keep each service's (or trace bucket's) records in order across workers
+    consumers = ConsumerPool(sqs, detect, inbox=enqueued, outbox=detected, stop_event=stop_event)
+
+    def shutdown(signum, frame):
+        # Graceful stop: in-flight batches are finished and deleted, the rest stays queued
+        logger.info(f"Received signal {signum}, stopping after in-flight batches...")
+        consumers.stop()
+        stop_event.set()
+
+    if threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGTERM, shutdown)
+
+    try:
+        run_stages([
+            Stage('generate', lambda: source, outbox=generated, stop_event=stop_event),
+            Stage('enqueue', enqueue, inbox=generated, outbox=enqueued, stop_event=stop_event),
+            consumers,
+            Stage('explain', explain, inbox=detected, outbox=explained, stop_event=stop_event),
+            # Save candidates to the JSON file incrementally
+            Stage('sink', sink.write, inbox=explained, stop_event=stop_event)
+        ])
+    finally:
+        sink.close()
+        llm_generator.close()
+        if detector is not None:
+            detector.close()
+        exporter.close()
+    logger.info(f"Saved {sink.count} candidate root causes to {ANOMALIES_PATH}")
+    if llm_generator.cache is not None:
+        logger.info(f"Root-cause cache: {llm_generator.cache.stats()}")
+
+    # Step 5: Evaluate the models (since we know the synthetic anomalies) on the streamed predictions
+    if detector is None or not batch_results:
+        # Stopped before the first batch was scored, or there was no input
+        logger.info("Nothing scored, skipping model evaluation")
+    else:
+        evaluation = detector.evaluate_predictions(DetectionResult.concat(batch_results), np.concatenate(batch_labels))
+        logger.info("Model Evaluation:")
+        for model_name, metrics in evaluation.items():
+            logger.info(f"{model_name}: Precision={metrics['precision']}, Recall={metrics['recall']}")
+
     end_time = time.time()
     logger.info(f"Total execution time: {end_time - start_time} seconds")
-    
-    # Memory usage
-    mem_usage = memory_usage(-1, interval=1, timeout=1)
-    logger.info(f"Peak memory usage: {max(mem_usage)} MiB")
+
+    logger.info(f"Peak memory usage: {peak_rss_mib():.1f} MiB")
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='Anomaly detection and root-cause pipeline')
+    parser.add_argument('--input', help='Existing Parquet/Arrow dataset (file or directory) or CSV to replay')
+    main(parser.parse_args().input)
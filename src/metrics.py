@@ -0,0 +1,247 @@
+import os
+import json
+import time
+import bisect
+import logging
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# Latency buckets in seconds, from sub-millisecond queue operations to slow LLM calls
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, help, labelnames=()):
+        # One value per combination of label values; a single lock per metric keeps
+        # updates cheap enough for the hot path
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.lock = threading.Lock()
+        self.values = {}
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self):
+        with self.lock:
+            return [(dict(zip(self.labelnames, key)), value) for key, value in self.values.items()]
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            state = self.values.get(key)
+            if state is None:
+                # Per-bucket (non-cumulative) counts plus +Inf, then sum and count
+                state = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self):
+        with self.lock:
+            samples = []
+            for key, (counts, total, count) in self.values.items():
+                cumulative, running = {}, 0
+                for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                    running += bucket_count
+                    cumulative['+Inf' if bound == float('inf') else repr(bound)] = running
+                samples.append((dict(zip(self.labelnames, key)), {'buckets': cumulative, 'sum': total, 'count': count}))
+            return samples
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics = {}
+        self.lock = threading.Lock()
+
+    def _get_or_create(self, cls, name, help, labelnames, **kwargs):
+        # Modules declare their metrics at import time; asking again returns the same object
+        with self.lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = self.metrics[name] = cls(name, help, labelnames, **kwargs)
+            elif not isinstance(metric, cls) or metric.labelnames != tuple(labelnames):
+                raise ValueError(f"Metric {name} is already registered with a different type or labels")
+            return metric
+
+    def counter(self, name, help, labelnames=()):
+        return self._get_or_create(Counter, name, help, labelnames)
+
+    def gauge(self, name, help, labelnames=()):
+        return self._get_or_create(Gauge, name, help, labelnames)
+
+    def histogram(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._get_or_create(Histogram, name, help, labelnames, buckets=buckets)
+
+    def snapshot(self):
+        # JSON-serializable view of every metric
+        with self.lock:
+            metrics = list(self.metrics.values())
+        return {
+            'timestamp': time.time(),
+            'metrics': {
+                metric.name: {
+                    'type': metric.kind,
+                    'help': metric.help,
+                    'samples': [{'labels': labels, 'value': value} for labels, value in metric.samples()]
+                }
+                for metric in metrics
+            }
+        }
+
+    def prometheus_text(self):
+        # Prometheus text exposition format (version 0.0.4)
+        with self.lock:
+            metrics = list(self.metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for labels, value in metric.samples():
+                if metric.kind == 'histogram':
+                    for bound, count in value['buckets'].items():
+                        lines.append(f"{metric.name}_bucket{_labels({**labels, 'le': bound})} {count}")
+                    lines.append(f"{metric.name}_sum{_labels(labels)} {value['sum']}")
+                    lines.append(f"{metric.name}_count{_labels(labels)} {value['count']}")
+                else:
+                    lines.append(f"{metric.name}{_labels(labels)} {value}")
+        return '\n'.join(lines) + '\n'
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + '}'
+
+# Process-wide registry that the generator, SQS handler, detectors and LLM client report into
+REGISTRY = MetricsRegistry()
+counter = REGISTRY.counter
+gauge = REGISTRY.gauge
+histogram = REGISTRY.histogram
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+        payload = self.server.registry.prometheus_text().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+class SnapshotWriter:
+    def __init__(self, path, interval, registry=REGISTRY):
+        # Writes registry.snapshot() to path every interval seconds; the file is replaced
+        # atomically so readers never see a partial snapshot
+        self.path = path
+        self.interval = interval
+        self.registry = registry
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='metrics-snapshot', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def write(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.registry.snapshot(), f)
+        os.replace(tmp_path, self.path)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.write()
+            except OSError as e:
+                logger.error(f"Error writing metrics snapshot: {e}")
+
+    def close(self):
+        # Stop the thread and write a final snapshot with the end-of-run totals
+        self._stop.set()
+        self._thread.join()
+        self.write()
+
+class MetricsExporter:
+    def __init__(self, registry=REGISTRY):
+        self.registry = registry
+        self.server = None
+        self.writer = None
+
+    def start(self, port=None, snapshot_path=None, snapshot_interval=None):
+        # Either or both exporters; settings supply the defaults
+        port = settings.METRICS_PORT if port is None else port
+        snapshot_path = snapshot_path or settings.METRICS_SNAPSHOT_PATH
+        if port is not None:
+            self.server = ThreadingHTTPServer((settings.METRICS_HOST, port), MetricsHandler)
+            self.server.registry = self.registry
+            threading.Thread(target=self.server.serve_forever, name='metrics-http', daemon=True).start()
+            logger.info(f"Serving metrics on http://{settings.METRICS_HOST}:{self.server.server_port}/metrics")
+        if snapshot_path:
+            self.writer = SnapshotWriter(
+                snapshot_path, snapshot_interval or settings.METRICS_SNAPSHOT_INTERVAL, self.registry
+            ).start()
+        return self
+
+    def close(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
@@ -0,0 +1,178 @@
+import json
+import math
+import logging
+from collections import deque
+import numpy as np
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+class OnlineStatisticalDetector:
+    MODES = ('welford', 'ewma', 'window')
+
+    def __init__(self, features=('cpu_usage', 'latency'), mode=None, alpha=None, window=None, min_count=None):
+        # Per-service running mean/variance of each feature, updated in O(1) per record.
+        # Memory is constant per service: three numbers per feature (plus the window for 'window').
+        self.features = list(features)
+        self.mode = mode or settings.ONLINE_STATS_MODE
+        if self.mode not in self.MODES:
+            raise ValueError(f"Unknown online statistics mode: {self.mode}")
+        self.alpha = alpha or settings.ONLINE_EWMA_ALPHA
+        self.window = window or settings.ONLINE_WINDOW_SIZE
+        self.min_count = settings.ONLINE_MIN_COUNT if min_count is None else min_count
+        self.state = {}  # service -> {'count', 'mean', 'm2'} (+ 'values' in window mode)
+
+    def _new_state(self):
+        n = len(self.features)
+        state = {'count': 0, 'mean': [0.0] * n, 'm2': [0.0] * n}
+        if self.mode == 'window':
+            state['values'] = deque(maxlen=self.window)
+        return state
+
+    def _variance(self, state, i):
+        if self.mode == 'ewma':
+            return state['m2'][i]
+        return state['m2'][i] / state['count'] if state['count'] else 0.0
+
+    def zscores(self, service, values):
+        # Z-score of one record against the service's statistics so far (0 while warming up)
+        state = self.state.get(service)
+        if state is None or state['count'] < self.min_count:
+            return [0.0] * len(values)
+        result = []
+        for i, value in enumerate(values):
+            std = math.sqrt(self._variance(state, i))
+            result.append(abs(value - state['mean'][i]) / std if std > 0 else 0.0)
+        return result
+
+    def update(self, service, values):
+        # Score the record, then fold it into the running statistics
+        z = self.zscores(service, values)
+        state = self.state.setdefault(service, self._new_state())
+        mean, m2 = state['mean'], state['m2']
+
+        if self.mode == 'welford':
+            state['count'] += 1
+            for i, value in enumerate(values):
+                delta = value - mean[i]
+                mean[i] += delta / state['count']
+                m2[i] += delta * (value - mean[i])
+        elif self.mode == 'ewma':
+            # Exponentially weighted mean and variance; m2 holds the variance directly
+            state['count'] += 1
+            for i, value in enumerate(values):
+                if state['count'] == 1:
+                    mean[i] = value
+                    continue
+                delta = value - mean[i]
+                mean[i] += self.alpha * delta
+                m2[i] = (1 - self.alpha) * (m2[i] + self.alpha * delta * delta)
+        else:
+            # Rolling window: Welford add for the new value, Welford remove for the evicted one
+            values_window = state['values']
+            evicted = values_window[0] if len(values_window) == values_window.maxlen else None
+            values_window.append(list(values))
+            if evicted is not None:
+                for i, old in enumerate(evicted):
+                    delta = old - mean[i]
+                    mean[i] -= delta / (state['count'] - 1)
+                    m2[i] -= delta * (old - mean[i])
+                state['count'] -= 1
+            state['count'] += 1
+            for i, value in enumerate(values):
+                delta = value - mean[i]
+                mean[i] += delta / state['count']
+                m2[i] += delta * (value - mean[i])
+        return z
+
+    def score(self, data):
+        # Max |z| per row, in row order; each row is scored before it updates its service
+        features = data[self.features].fillna(0).to_numpy(dtype=np.float64)
+        services = data['service'].astype(str).to_numpy() if 'service' in data else np.full(len(data), 'all')
+        if self.mode == 'welford':
+            return self._score_welford(services, features)
+
+        scores = np.zeros(len(data))
+        for row, (service, values) in enumerate(zip(services, features.tolist())):
+            scores[row] = max(self.update(service, values))
+        return scores
+
+    def _score_welford(self, services, features):
+        # Vectorized equivalent of calling update() row by row: within a service, each row is
+        # scored against the running moments of all earlier rows (prefix sums), then the whole
+        # group is merged into the state with Chan's parallel update
+        scores = np.zeros(len(services))
+        for service in np.unique(services):
+            rows = np.flatnonzero(services == service)
+            values = features[rows]
+            state = self.state.setdefault(service, self._new_state())
+            n0, mean0, m20 = state['count'], np.array(state['mean']), np.array(state['m2'])
+
+            # Moments of (previous state + rows before k), combined with Chan's formula
+            k = np.arange(len(rows))[:, None]
+            prefix_sum = np.cumsum(values, axis=0) - values
+            prefix_sq = np.cumsum(values ** 2, axis=0) - values ** 2
+            prefix_mean = np.divide(prefix_sum, k, out=np.zeros_like(prefix_sum), where=k > 0)
+            prefix_m2 = np.maximum(prefix_sq - k * prefix_mean ** 2, 0)
+            count = n0 + k
+            delta = prefix_mean - mean0
+            mean = np.divide(n0 * mean0 + prefix_sum, count, out=np.zeros_like(prefix_sum), where=count > 0)
+            m2 = m20 + prefix_m2 + np.divide(delta ** 2 * n0 * k, count, out=np.zeros_like(prefix_sum), where=count > 0)
+
+            std = np.sqrt(np.divide(m2, count, out=np.zeros_like(m2), where=count > 0))
+            z = np.divide(np.abs(values - mean), std, out=np.zeros_like(values), where=std > 0)
+            z[(count < self.min_count)[:, 0]] = 0.0
+            scores[rows] = z.max(axis=1)
+
+            # Fold the whole group into the running state
+            n = len(rows)
+            batch_mean = values.mean(axis=0)
+            batch_m2 = ((values - batch_mean) ** 2).sum(axis=0)
+            total = n0 + n
+            delta = batch_mean - mean0
+            state['mean'] = (mean0 + delta * n / total).tolist()
+            state['m2'] = (m20 + batch_m2 + delta ** 2 * n0 * n / total).tolist()
+            state['count'] = total
+        return scores
+
+    def snapshot(self):
+        # JSON-serializable copy of the detector state
+        state = {}
+        for service, s in self.state.items():
+            state[service] = {'count': s['count'], 'mean': list(s['mean']), 'm2': list(s['m2'])}
+            if 'values' in s:
+                state[service]['values'] = list(s['values'])
+        return {
+            'features': self.features,
+            'mode': self.mode,
+            'alpha': self.alpha,
+            'window': self.window,
+            'min_count': self.min_count,
+            'state': state
+        }
+
+    @classmethod
+    def restore(cls, snapshot):
+        detector = cls(
+            features=snapshot['features'],
+            mode=snapshot['mode'],
+            alpha=snapshot['alpha'],
+            window=snapshot['window'],
+            min_count=snapshot['min_count']
+        )
+        for service, s in snapshot['state'].items():
+            state = detector._new_state()
+            state['count'], state['mean'], state['m2'] = s['count'], list(s['mean']), list(s['m2'])
+            if 'values' in state:
+                state['values'].extend(s.get('values', []))
+            detector.state[service] = state
+        return detector
+
+    def save(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.snapshot(), f)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            return cls.restore(json.load(f))
@@ -0,0 +1,55 @@
+import base64
+import pandas as pd
+from src import schema
+
+# Marks a message body that packs many records as a compressed Arrow IPC stream
+PACKED_PREFIX = 'arrow-ipc:'
+# SQS limit for one message, and for all messages of one batch call together
+MAX_MESSAGE_BYTES = 256 * 1024
+# Headroom kept when estimating how many rows fit into a message
+FILL_FACTOR = 0.9
+
+def is_packed(body):
+    return body.startswith(PACKED_PREFIX)
+
+# pyarrow is imported by the functions that pack or unpack, so importing this module (as the
+# SQS handler does for every queue) stays cheap when no packed messages are used
+
+def encode(table):
+    # Arrow IPC stream, zstd-compressed buffers, base64 because SQS bodies must be text
+    import pyarrow as pa
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema, options=pa.ipc.IpcWriteOptions(compression='zstd')) as writer:
+        writer.write_table(table)
+    return PACKED_PREFIX + base64.b64encode(sink.getvalue().to_pybytes()).decode('ascii')
+
+def decode(body):
+    import pyarrow as pa
+    return pa.ipc.open_stream(base64.b64decode(body[len(PACKED_PREFIX):])).read_all()
+
+def pack(df, max_bytes=MAX_MESSAGE_BYTES, max_records=None):
+    # Yields message bodies of consecutive row slices, each at most max_bytes. The frame is
+    # converted to Arrow once; the rows per message are estimated from the size of the last
+    # slice and only re-encoded when that estimate overshoots.
+    import pyarrow as pa
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    # The pandas metadata would be repeated in every message; schema.conform restores the dtypes
+    table = table.replace_schema_metadata(None)
+    rows = min(max_records or table.num_rows, table.num_rows)
+    offset = 0
+    while offset < table.num_rows:
+        n = min(rows, table.num_rows - offset)
+        body = encode(table.slice(offset, n))
+        if len(body) > max_bytes and n > 1:
+            rows = max(1, int(n * max_bytes * FILL_FACTOR / len(body)))
+            continue
+        yield body
+        offset += n
+
+def unpack(bodies):
+    # One frame in the compact schema from packed bodies, decoded column by column
+    import pyarrow as pa
+    tables = [decode(body) for body in bodies]
+    if not tables:
+        return pd.DataFrame(columns=schema.COLUMNS)
+    return schema.conform(pa.concat_tables(tables).to_pandas())
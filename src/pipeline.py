@@ -0,0 +1,89 @@
+import json
+import queue
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Marks the end of a stage's output stream
+END = object()
+
+class Stage(threading.Thread):
+    def __init__(self, name, func, inbox=None, outbox=None, stop_event=None):
+        # A source stage (no inbox) iterates func(); other stages call func(item) per item
+        # and forward non-None results. Bounded outboxes make a slow consumer block its producer.
+        super().__init__(name=name, daemon=True)
+        self.func = func
+        self.inbox = inbox
+        self.outbox = outbox
+        self.stop_event = stop_event or threading.Event()
+        self.error = None
+
+    def _put(self, item):
+        while not self.stop_event.is_set():
+            try:
+                self.outbox.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self):
+        while not self.stop_event.is_set():
+            try:
+                return self.inbox.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return END
+
+    def _items(self):
+        if self.inbox is None:
+            yield from self.func()
+            return
+        while True:
+            item = self._get()
+            if item is END:
+                return
+            yield self.func(item)
+
+    def run(self):
+        try:
+            for result in self._items():
+                if self.outbox is not None and result is not None and not self._put(result):
+                    return
+        except Exception as e:
+            # Stop every stage so nothing blocks forever on a dead neighbour
+            logger.exception(f"Pipeline stage {self.name} failed: {e}")
+            self.error = e
+            self.stop_event.set()
+        finally:
+            if self.outbox is not None:
+                self._put(END)
+
+def run_stages(stages):
+    for stage in stages:
+        stage.start()
+    for stage in stages:
+        stage.join()
+    errors = [stage.error for stage in stages if stage.error is not None]
+    if errors:
+        raise errors[0]
+
+class JsonArraySink:
+    def __init__(self, file_path):
+        # Appends items to a JSON array on disk as they arrive; the file is a valid
+        # array once close() has run
+        self.file = open(file_path, 'w')
+        self.file.write('[')
+        self.count = 0
+
+    def write(self, items):
+        for item in items:
+            self.file.write(',\n' if self.count else '\n')
+            self.file.write('    ' + json.dumps(item, indent=4).replace('\n', '\n    '))
+            self.count += 1
+        self.file.flush()
+
+    def close(self):
+        self.file.write('\n]' if self.count else ']')
+        self.file.close()
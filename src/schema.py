@@ -0,0 +1,95 @@
+import pandas as pd
+import numpy as np
+
+SERVICES = ['web-server', 'auth-service', 'payment-service', 'user-service', 'database']
+LOG_LEVELS = ['INFO', 'DEBUG', 'WARN', 'ERROR', 'FATAL']
+EVENT_TYPES = ['request', 'response', 'system', 'transaction']
+
+# Message templates are stored once; a record keeps only its template key, and the
+# template parameters ({service}, {timestamp}) are the record's own columns
+MESSAGE_TEMPLATES = {
+    'ok': "Operation completed successfully in {service}",
+    'error': "Error in {service} at {timestamp}"
+}
+
+# Compact MELT record schema: 1-byte categorical codes for the enums, float32 metrics,
+# integer ids and a nullable span id (values plus a mask) for missing spans
+DTYPES = {
+    'timestamp': 'datetime64[ns]',
+    'service': pd.CategoricalDtype(SERVICES),
+    'log_level': pd.CategoricalDtype(LOG_LEVELS),
+    'message_id': pd.CategoricalDtype(list(MESSAGE_TEMPLATES)),
+    'cpu_usage': 'float32',
+    'latency': 'float32',
+    'trace_id': 'int64',
+    'span_id': 'Int64',
+    'event_type': pd.CategoricalDtype(EVENT_TYPES)
+}
+COLUMNS = list(DTYPES)
+
+# Captures written before the compact schema (e.g. outputs/synthetic_data.csv) spell the ids
+# as 'trace_<n>' / 'span_<n>' and keep the rendered message text instead of its template key
+LEGACY_ID_PREFIXES = {'trace_id': 'trace_', 'span_id': 'span_'}
+
+def _legacy_ids(values, prefix):
+    # 'trace_<n>' -> n; ids in any other text format are dictionary-encoded instead
+    text = values.astype('string')
+    try:
+        return pd.to_numeric(text.str.removeprefix(prefix))
+    except ValueError:
+        codes, _ = pd.factorize(text)
+        return pd.Series(codes, index=values.index, dtype='Int64').mask(codes < 0)
+
+def _legacy_message_ids(messages):
+    # The template a rendered message came from, matched on the text before its first parameter
+    message_ids = pd.Series(pd.NA, index=messages.index, dtype=object)
+    for key, template in MESSAGE_TEMPLATES.items():
+        message_ids[messages.str.startswith(template.split('{')[0]).fillna(False).to_numpy(bool)] = key
+    return message_ids
+
+def conform(df):
+    # Coerce the schema columns of a frame (e.g. one rebuilt from queue messages) to the
+    # compact dtypes; other columns are left as they are
+    df = df.copy()
+    if 'timestamp' in df and not pd.api.types.is_datetime64_any_dtype(df['timestamp']):
+        df['timestamp'] = pd.to_datetime(df['timestamp'])
+    for column, prefix in LEGACY_ID_PREFIXES.items():
+        if column in df and not pd.api.types.is_numeric_dtype(df[column]):
+            df[column] = _legacy_ids(df[column], prefix)
+    if 'message' in df and 'message_id' not in df:
+        df.insert(df.columns.get_loc('message'), 'message_id', _legacy_message_ids(df.pop('message')))
+    return df.astype({column: dtype for column, dtype in DTYPES.items() if column in df})
+
+def json_safe(record):
+    # One record as plain JSON types: ISO timestamps, Python numbers and None for missing values
+    safe = {}
+    for key, value in record.items():
+        if value is None or value is pd.NA or value is pd.NaT:
+            value = None
+        elif hasattr(value, 'isoformat'):
+            value = value.isoformat()
+        elif isinstance(value, np.generic):
+            value = value.item()
+        safe[key] = value
+    return safe
+
+def to_records(df):
+    # Wire format for SQS and the LLM stage: a list of JSON-safe dicts
+    return [json_safe(record) for record in df.to_dict('records')]
+
+def from_records(records):
+    return conform(pd.DataFrame(list(records)))
+
+def render_messages(df):
+    # Expands the message templates back to text; only needed for display, not on the hot path
+    messages = pd.Series('', index=df.index, dtype=object)
+    # ISO timestamps, as the messages were originally written
+    timestamps = df['timestamp'].map(lambda timestamp: timestamp.isoformat())
+    services = df['service'].astype(str)
+    for key, template in MESSAGE_TEMPLATES.items():
+        rows = (df['message_id'] == key).to_numpy()
+        messages[rows] = [
+            template.format(service=service, timestamp=timestamp)
+            for service, timestamp in zip(services[rows], timestamps[rows])
+        ]
+    return messages
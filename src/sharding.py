@@ -0,0 +1,276 @@
+import os
+import json
+import zlib
+import logging
+import threading
+import multiprocessing
+from multiprocessing import shared_memory
+import numpy as np
+import pandas as pd
+from src.anomaly_detector import AnomalyDetector, DetectionResult, ModelVersionError
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+SHARD_KEYS = ('service', 'trace_id')
+SHARDS_MANIFEST = 'shards.json'
+
+def shard_ids(data, n_shards, key):
+    # Stable shard per record: crc32 of the service name, or a multiplicative hash of
+    # trace_id; both are the same in every process and every run
+    if key == 'service':
+        services = data['service']
+        if not isinstance(services.dtype, pd.CategoricalDtype):
+            services = services.astype(str).astype('category')
+        per_category = np.array(
+            [zlib.crc32(str(name).encode()) % n_shards for name in services.cat.categories] + [0], dtype=np.int32
+        )
+        # Code -1 (missing service) maps to the trailing 0 entry
+        return per_category[services.cat.codes.to_numpy()]
+    if key == 'trace_id':
+        trace_ids = data['trace_id'].to_numpy(dtype=np.uint64)
+        return ((trace_ids * np.uint64(2654435761)) % np.uint64(2 ** 32) % np.uint64(n_shards)).astype(np.int32)
+    raise ValueError(f"Unknown SHARD_KEY: {key}")
+
+class SharedBatch:
+    # Columns the detectors need, packed back to back in one shared memory block with the
+    # records grouped by shard; workers map it instead of unpickling a DataFrame
+    def __init__(self, data, order):
+        columns = {name: data[name].to_numpy(dtype=np.float64)[order] for name in AnomalyDetector.FEATURES}
+        self.categories = None
+        if 'service' in data:
+            services = data['service']
+            if not isinstance(services.dtype, pd.CategoricalDtype):
+                services = services.astype(str).astype('category')
+            self.categories = [str(c) for c in services.cat.categories]
+            columns['service'] = services.cat.codes.to_numpy().astype(np.int32)[order]
+        if 'timestamp' in data:
+            columns['timestamp'] = pd.to_datetime(data['timestamp']).to_numpy(dtype='datetime64[ns]').view(np.int64)[order]
+        # For the trace index: ids as int64, span ids as float64 with NaN for missing spans
+        if 'trace_id' in data:
+            columns['trace_id'] = data['trace_id'].to_numpy(dtype=np.int64)[order]
+        if 'span_id' in data:
+            columns['span_id'] = data['span_id'].to_numpy(dtype=np.float64, na_value=np.nan)[order]
+
+        self.layout = {}
+        offset = 0
+        for name, values in columns.items():
+            self.layout[name] = (values.dtype.str, offset)
+            offset += values.nbytes
+        self.rows = len(order)
+        self.shm = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+        for name, values in columns.items():
+            dtype, offset = self.layout[name]
+            np.ndarray(self.rows, dtype=dtype, buffer=self.shm.buf, offset=offset)[:] = values
+
+    def descriptor(self):
+        return {'name': self.shm.name, 'rows': self.rows, 'layout': self.layout, 'categories': self.categories}
+
+    def close(self):
+        self.shm.close()
+        self.shm.unlink()
+
+def _read_shared_batch(descriptor, start, stop):
+    # Rebuilds rows [start, stop) of a SharedBatch as a DataFrame (copied out of the block)
+    shm = shared_memory.SharedMemory(name=descriptor['name'])
+    try:
+        columns = {}
+        for name, (dtype, offset) in descriptor['layout'].items():
+            values = np.ndarray(descriptor['rows'], dtype=dtype, buffer=shm.buf, offset=offset)[start:stop].copy()
+            if name == 'service':
+                values = pd.Categorical.from_codes(values, categories=descriptor['categories'])
+            elif name == 'timestamp':
+                values = values.view('datetime64[ns]')
+            columns[name] = values
+        return pd.DataFrame(columns)
+    finally:
+        shm.close()
+
+def _shard_worker(conn, shard, ensemble, min_votes):
+    # One long-lived process per shard; its fitted detectors stay resident between batches
+    if settings.DETECTOR_EXECUTOR == 'process':
+        # The shard is already its own process; nesting process pools only adds overhead
+        settings.DETECTOR_EXECUTOR = 'thread'
+    detector = AnomalyDetector(ensemble, min_votes)
+    while True:
+        command, args = conn.recv()
+        try:
+            if command == 'fit':
+                descriptor, start, stop = args
+                detector.fit(_read_shared_batch(descriptor, start, stop))
+                conn.send(('ok', None))
+            elif command == 'score':
+                descriptor, start, stop, output = args
+                result = detector.score(_read_shared_batch(descriptor, start, stop))
+                # Margins over this shard's own thresholds, so shards with different fitted
+                # cut-offs can be merged under a common threshold of 0
+                shm = shared_memory.SharedMemory(name=output['name'])
+                try:
+                    margins = np.ndarray((len(output['detectors']), output['rows']), dtype=np.float32, buffer=shm.buf)
+                    for i, name in enumerate(output['detectors']):
+                        margins[i, start:stop] = result.scores[name] - np.float32(result.thresholds[name])
+                finally:
+                    shm.close()
+                conn.send(('ok', None))
+            elif command == 'save':
+                conn.send(('ok', detector.save(args)))
+            elif command == 'load':
+                detector = AnomalyDetector.load(args, ensemble=ensemble)
+                detector.min_votes = min_votes
+                conn.send(('ok', None))
+            elif command == 'close':
+                detector.close()
+                conn.send(('ok', None))
+                return
+        except Exception as e:
+            logger.exception(f"Shard {shard} failed on {command}")
+            conn.send(('error', f"{type(e).__name__}: {e}"))
+
+class ShardedDetector:
+    def __init__(self, n_shards=None, key=None, ensemble=None, min_votes=None):
+        # Partitions records by key across n_shards worker processes, each with its own
+        # fitted detectors, so detection scales past the GIL and a single mixed-service fit
+        self.n_shards = n_shards or settings.DETECTOR_SHARDS or os.cpu_count()
+        self.key = key or settings.SHARD_KEY
+        if self.key not in SHARD_KEYS:
+            raise ValueError(f"Unknown SHARD_KEY: {self.key}")
+        # The parent only routes and merges; detector plugins are imported in the shards
+        self.ensemble = AnomalyDetector.configured_ensemble() if ensemble is None else list(ensemble)
+        if 'trace_index' in self.ensemble and self.key != 'trace_id':
+            # Each shard has its own trace index, so a trace split across shards is never
+            # seen whole and a broken trace is only flagged in the shard with the gap
+            raise ValueError("The trace_index detector needs SHARD_KEY = 'trace_id' to keep each trace in one shard")
+        self.min_votes = settings.DETECTOR_MIN_VOTES if min_votes is None else min_votes
+        self.fitted_shards = set()
+        self.version = None
+        # One request per shard pipe at a time: callers on other threads (e.g. consumer
+        # workers) would otherwise read each other's replies
+        self._lock = threading.Lock()
+        context = multiprocessing.get_context('spawn')
+        self.connections, self.processes = [], []
+        for shard in range(self.n_shards):
+            parent, child = context.Pipe()
+            process = context.Process(target=_shard_worker, args=(child, shard, self.ensemble, self.min_votes), daemon=True)
+            process.start()
+            self.connections.append(parent)
+            self.processes.append(process)
+
+    @property
+    def fitted(self):
+        return bool(self.fitted_shards)
+
+    def _call(self, requests):
+        # Sends to every shard first and then collects, so the shards work in parallel
+        replies, errors = {}, []
+        with self._lock:
+            for shard, (command, args) in requests.items():
+                self.connections[shard].send((command, args))
+            for shard in requests:
+                # Every reply is read, even after an error, so no pipe is left out of step
+                status, value = self.connections[shard].recv()
+                if status == 'error':
+                    errors.append(f"shard {shard}: {value}")
+                replies[shard] = value
+        if errors:
+            raise RuntimeError(f"Sharded detection failed ({'; '.join(errors)})")
+        return replies
+
+    def _partition(self, data):
+        shards = shard_ids(data, self.n_shards, self.key)
+        order = np.argsort(shards, kind='stable')
+        bounds = np.concatenate([[0], np.cumsum(np.bincount(shards, minlength=self.n_shards))])
+        ranges = {shard: (int(bounds[shard]), int(bounds[shard + 1])) for shard in range(self.n_shards)}
+        return order, {shard: r for shard, r in ranges.items() if r[1] > r[0]}
+
+    def fit(self, data):
+        # Every shard is fitted: one with no records in the reference window gets a model of
+        # the whole window, so a key that first shows up later is still scored
+        order, ranges = self._partition(data)
+        batch = SharedBatch(data, order)
+        try:
+            self._call({
+                shard: ('fit', (batch.descriptor(),) + ranges.get(shard, (0, len(data))))
+                for shard in range(self.n_shards)
+            })
+        finally:
+            batch.close()
+        self.fitted_shards = set(range(self.n_shards))
+        logger.info(
+            f"Fitted {self.n_shards} shards by {self.key} "
+            f"({self.n_shards - len(ranges)} on the whole window, having no records of their own)"
+        )
+        return self
+
+    def score(self, data):
+        order, ranges = self._partition(data)
+        unfitted = set(ranges) - self.fitted_shards
+        if unfitted:
+            raise RuntimeError(f"Shards {sorted(unfitted)} received records but were never fitted")
+
+        batch = SharedBatch(data, order)
+        output = shared_memory.SharedMemory(create=True, size=max(len(self.ensemble) * len(data) * 4, 1))
+        try:
+            spec = {'name': output.name, 'rows': len(data), 'detectors': self.ensemble}
+            self._call({
+                shard: ('score', (batch.descriptor(), start, stop, spec))
+                for shard, (start, stop) in ranges.items()
+            })
+            margins = np.ndarray((len(self.ensemble), len(data)), dtype=np.float32, buffer=output.buf)
+            # Scatter back from shard order to record order
+            scores = {}
+            for i, name in enumerate(self.ensemble):
+                values = np.empty(len(data), dtype=np.float32)
+                values[order] = margins[i]
+                scores[name] = values
+        finally:
+            batch.close()
+            output.close()
+            output.unlink()
+        min_votes = min(self.min_votes, len(self.ensemble))
+        decisive = [name for name in self.ensemble if name in settings.DECISIVE_DETECTORS]
+        return DetectionResult(scores, {name: 0.0 for name in self.ensemble}, min_votes, decisive)
+
+    def detect_anomalies(self, data):
+        if not self.fitted:
+            self.fit(data)
+        return self.score(data)
+
+    def save(self, model_dir):
+        # One versioned AnomalyDetector directory per shard, plus the sharding layout
+        os.makedirs(model_dir, exist_ok=True)
+        self._call({shard: ('save', os.path.join(model_dir, f"shard-{shard}")) for shard in self.fitted_shards})
+        with open(os.path.join(model_dir, SHARDS_MANIFEST), 'w') as f:
+            json.dump({'n_shards': self.n_shards, 'key': self.key, 'fitted': sorted(self.fitted_shards)}, f, indent=4)
+        return model_dir
+
+    @classmethod
+    def load(cls, model_dir, ensemble=None):
+        path = os.path.join(model_dir, SHARDS_MANIFEST)
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"No saved shards in {model_dir}")
+        with open(path) as f:
+            manifest = json.load(f)
+        # Checked here, before any shard process starts, so a stale version surfaces as a
+        # ModelVersionError rather than as a failed shard
+        unfitted = sorted(set(range(manifest['n_shards'])) - set(manifest['fitted']))
+        if unfitted:
+            raise ModelVersionError(f"Shards {unfitted} in {model_dir} were never fitted and must be refitted")
+        for shard in manifest['fitted']:
+            AnomalyDetector.read_manifest(os.path.join(model_dir, f"shard-{shard}"), ensemble=ensemble)
+        detector = cls(manifest['n_shards'], manifest['key'], ensemble)
+        detector._call({shard: ('load', os.path.join(model_dir, f"shard-{shard}")) for shard in manifest['fitted']})
+        detector.fitted_shards = set(manifest['fitted'])
+        return detector
+
+    def evaluate_predictions(self, results, true_anomalies):
+        return AnomalyDetector(ensemble=[]).evaluate_predictions(results, true_anomalies)
+
+    def close(self):
+        for shard, process in enumerate(self.processes):
+            if process.is_alive():
+                try:
+                    self._call({shard: ('close', None)})
+                except (EOFError, OSError, RuntimeError):
+                    pass
+            process.join(timeout=5)
+        self.processes = []
@@ -1,78 +1,314 @@
 import boto3
 import json
+import time
+import pandas as pd
 import logging
+import itertools
+import threading
+from collections import deque
+from src import metrics, payload, schema
+from src.local_queue import LocalQueueClient
 from config import settings
 
 logger = logging.getLogger(__name__)
 
+MESSAGES = metrics.counter('sqs_messages_total', 'Messages handled by SQSHandler', ('operation',))
+FAILED = metrics.counter('sqs_failed_entries_total', 'Batch entries that still failed after retries', ('operation',))
+RETRIES = metrics.counter('sqs_batch_retries_total', 'Batch calls retried for failed entries', ('operation',))
+CALL_SECONDS = metrics.histogram('sqs_call_seconds', 'Latency of one SQS API call', ('operation',))
+QUEUE_DEPTH = metrics.gauge('sqs_queue_depth', 'Messages sent by this process and not yet received')
+RECORDS = metrics.counter('sqs_records_total', 'MELT records sent in or decoded from messages', ('operation',))
+
+# SendMessageBatch/DeleteMessageBatch accept at most 10 entries per call
+SQS_BATCH_LIMIT = 10
+DEFAULT_MESSAGE_GROUP = 'anomaly-detection'
+
 class SQSHandler:
     def __init__(self):
-        # For local development, use a mock SQS or localstack
-        self.sqs = boto3.client('sqs', region_name='us-east-1')
+        # For local development, use the SQLite-backed local queue, a mock SQS or localstack
+        if settings.SQS_BACKEND == 'local':
+            self.sqs = LocalQueueClient(settings.LOCAL_QUEUE_PATH)
+        else:
+            self.sqs = boto3.client('sqs', region_name='us-east-1')
         self.queue_url = None
-        
+        self.sent_count = 0
+        # Guards the in-memory fallback queue against concurrent consumers
+        self.lock = threading.Lock()
+
     def create_queue(self, queue_name):
         try:
-            response = self.sqs.create_queue(
-                QueueName=queue_name,
-                Attributes={
-                    'FifoQueue': 'true',
-                    'ContentBasedDeduplication': 'true'
-                }
-            )
+            attributes = {
+                'FifoQueue': 'true',
+                'ContentBasedDeduplication': 'true'
+            }
+            if settings.SQS_MAX_RECEIVE_COUNT:
+                # Messages received this many times without a delete go to the dead-letter queue
+                dlq_url = self.sqs.create_queue(QueueName=f"{queue_name}-dlq", Attributes=dict(attributes))['QueueUrl']
+                dlq_arn = self.sqs.get_queue_attributes(QueueUrl=dlq_url, AttributeNames=['QueueArn'])['Attributes']['QueueArn']
+                attributes['RedrivePolicy'] = json.dumps({
+                    'deadLetterTargetArn': dlq_arn,
+                    'maxReceiveCount': str(settings.SQS_MAX_RECEIVE_COUNT)
+                })
+            response = self.sqs.create_queue(QueueName=queue_name, Attributes=attributes)
             self.queue_url = response['QueueUrl']
             logger.info(f"Created queue: {self.queue_url}")
         except Exception as e:
             logger.error(f"Error creating queue: {e}")
-            # Fallback to in-memory queue
+            # Fallback to in-memory queue; a deque keeps receives O(1) per message
             self.queue_url = None
-            self.messages = []
-            
+            self.messages = deque()
+
+    def _group_id(self, message_body):
+        # FIFO ordering only holds within a group, and a group has at most one batch in flight,
+        # so records are spread over groups by service or trace hash to let consumers run in parallel
+        key = settings.SQS_MESSAGE_GROUP_KEY
+        if key == 'service' and message_body.get('service') is not None:
+            return f"service-{message_body['service']}"
+        if key == 'trace_id' and message_body.get('trace_id') is not None:
+            return f"trace-{int(message_body['trace_id']) % settings.SQS_MESSAGE_GROUPS}"
+        return DEFAULT_MESSAGE_GROUP
+
+    def _prepare(self, message_body):
+        # Timestamps to ISO strings, numpy scalars to Python numbers, missing values to None
+        return schema.json_safe(message_body)
+
+    def _frame_groups(self, df):
+        # Vectorized _group_id: (group id, rows) per message group, rows kept in frame order
+        key = settings.SQS_MESSAGE_GROUP_KEY
+        if key == 'service' and 'service' in df:
+            for service, part in df.groupby('service', observed=True, sort=False, dropna=False):
+                yield (DEFAULT_MESSAGE_GROUP if pd.isna(service) else f"service-{service}"), part
+        elif key == 'trace_id' and 'trace_id' in df:
+            buckets = df['trace_id'].to_numpy() % settings.SQS_MESSAGE_GROUPS
+            for bucket, part in df.groupby(buckets, sort=False):
+                yield f"trace-{bucket}", part
+        else:
+            yield DEFAULT_MESSAGE_GROUP, df
+
+    def send_frame(self, df):
+        # Sends a frame of MELT records in the compact schema (see src/schema.py). Packed, each
+        # message carries up to SQS_RECORDS_PER_MESSAGE records of one message group as
+        # compressed Arrow columns; otherwise every record is its own JSON message.
+        if settings.SQS_PAYLOAD_FORMAT != 'arrow':
+            return self.send_messages_batch(df.to_dict('records'))
+        entries = []
+        for group_id, part in self._frame_groups(df):
+            for body in payload.pack(part, max_records=settings.SQS_RECORDS_PER_MESSAGE):
+                entries.append({'Id': str(len(entries)), 'MessageBody': body, 'MessageGroupId': group_id})
+        RECORDS.inc(len(df), operation='send')
+        return self._send_entries(entries)
+
+    @staticmethod
+    def to_frame(messages):
+        # Rebuilds received messages as a frame in the compact schema; packed messages are
+        # decoded straight to columns, JSON messages row by row
+        bodies = [message['Body'] for message in messages]
+        packed = [body for body in bodies if payload.is_packed(body)]
+        frames = []
+        if packed:
+            frames.append(payload.unpack(packed))
+        if len(packed) < len(bodies):
+            frames.append(schema.from_records(json.loads(body) for body in bodies if not payload.is_packed(body)))
+        if not frames:
+            return schema.from_records([])
+        frame = frames[0] if len(frames) == 1 else pd.concat(frames, ignore_index=True)
+        RECORDS.inc(len(frame), operation='receive')
+        return frame
+
     def send_message(self, message_body):
-    # Convert any timestamp objects to strings
-        if 'timestamp' in message_body and hasattr(message_body['timestamp'], 'isoformat'):
-            message_body['timestamp'] = message_body['timestamp'].isoformat()
-    
+        message_body = self._prepare(message_body)
+
         if self.queue_url:
             try:
-                response = self.sqs.send_message(
-                    QueueUrl=self.queue_url,
-                    MessageBody=json.dumps(message_body),
-                    MessageGroupId='anomaly-detection'
-                )
+                with CALL_SECONDS.time(operation='send'):
+                    response = self.sqs.send_message(
+                        QueueUrl=self.queue_url,
+                        MessageBody=json.dumps(message_body),
+                        MessageGroupId=self._group_id(message_body)
+                    )
+                MESSAGES.inc(operation='send')
+                QUEUE_DEPTH.inc()
                 return response
             except Exception as e:
                 logger.error(f"Error sending message: {e}")
                 return None
         else:
             # Fallback to in-memory queue
-            self.messages.append(message_body)
-            return {'MessageId': 'local-' + str(len(self.messages))}
-            
-    def receive_messages(self, max_messages=10):
+            self.messages.append(json.dumps(message_body))
+            self.sent_count += 1
+            MESSAGES.inc(operation='send')
+            QUEUE_DEPTH.inc()
+            return {'MessageId': 'local-' + str(self.sent_count)}
+
+    @staticmethod
+    def _chunks(entries):
+        # At most 10 entries per call, and message bodies of at most 256 KB per call together
+        chunk, size = [], 0
+        for entry in entries:
+            entry_size = len(entry.get('MessageBody', '').encode())
+            if chunk and (len(chunk) == SQS_BATCH_LIMIT or size + entry_size > payload.MAX_MESSAGE_BYTES):
+                yield chunk
+                chunk, size = [], 0
+            chunk.append(entry)
+            size += entry_size
+        if chunk:
+            yield chunk
+
+    def _call_batch(self, operation, entries, name):
+        # Issue batch calls of at most 10 entries, in order, and retry only the entries that
+        # failed on the service side; sender faults (bad input) are not retried. When an entry
+        # is retried, the entries after it in its FIFO message group are put back behind it
+        # even if they went through, so a group is never reordered; content-based
+        # deduplication drops the ones SQS had already accepted.
+        remaining = deque(entries)
+        retries = {}
+        successful, failed = [], []
+        while remaining:
+            pending = next(self._chunks(itertools.islice(remaining, SQS_BATCH_LIMIT)))
+            try:
+                with CALL_SECONDS.time(operation=name):
+                    response = operation(QueueUrl=self.queue_url, Entries=pending)
+            except Exception as e:
+                logger.error(f"Error in batch request: {e}")
+                response = {'Failed': [{'Id': entry['Id'], 'SenderFault': False, 'Message': str(e)} for entry in pending]}
+            accepted = {s['Id']: s for s in response.get('Successful', [])}
+            failures = {f['Id']: f for f in response.get('Failed', [])}
+
+            backoff = None
+            held, resend = set(), []
+            for entry in pending:
+                remaining.popleft()
+                group = entry.get('MessageGroupId', ('entry', entry['Id']))
+                failure = failures.get(entry['Id'])
+                if group in held:
+                    resend.append(entry)
+                elif failure is not None and not failure.get('SenderFault'):
+                    attempt = retries.get(entry['Id'], 0)
+                    if attempt < settings.SQS_BATCH_MAX_RETRIES:
+                        retries[entry['Id']] = attempt + 1
+                        backoff = max(backoff or 0, attempt)
+                        held.add(group)
+                        resend.append(entry)
+                        continue
+                    failed.append({'Id': entry['Id'], 'SenderFault': False})
+                    logger.error(f"Batch entry {entry['Id']} still failing after {settings.SQS_BATCH_MAX_RETRIES} retries")
+                elif failure is not None:
+                    failed.append(failure)
+                elif entry['Id'] in accepted:
+                    successful.append(accepted[entry['Id']])
+            # The group tails go out again, in order, at the front of the next call
+            remaining.extendleft(reversed(resend))
+            if backoff is not None:
+                RETRIES.inc(operation=name)
+                time.sleep(settings.SQS_BATCH_RETRY_BACKOFF * 2 ** backoff)
+        MESSAGES.inc(len(successful), operation=name)
+        FAILED.inc(len(failed), operation=name)
+        return {'Successful': successful, 'Failed': failed}
+
+    def send_messages_batch(self, message_bodies):
+        message_bodies = [self._prepare(body) for body in message_bodies]
+        entries = [
+            {
+                'Id': str(i),
+                'MessageBody': json.dumps(body),
+                'MessageGroupId': self._group_id(body)
+            }
+            for i, body in enumerate(message_bodies)
+        ]
+        return self._send_entries(entries)
+
+    def _send_entries(self, entries):
+        if self.queue_url:
+            result = self._call_batch(self.sqs.send_message_batch, entries, 'send_batch')
+            QUEUE_DEPTH.inc(len(result['Successful']))
+            return result
+        else:
+            # Fallback to in-memory queue
+            self.messages.extend(entry['MessageBody'] for entry in entries)
+            first = self.sent_count
+            self.sent_count += len(entries)
+            MESSAGES.inc(len(entries), operation='send_batch')
+            QUEUE_DEPTH.inc(len(entries))
+            return {
+                'Successful': [{'Id': entry['Id'], 'MessageId': 'local-' + str(first + i + 1)} for i, entry in enumerate(entries)],
+                'Failed': []
+            }
+
+    def receive_messages(self, max_messages=10, wait_time_seconds=None):
         if self.queue_url:
             try:
-                response = self.sqs.receive_message(
-                    QueueUrl=self.queue_url,
-                    MaxNumberOfMessages=max_messages,
-                    VisibilityTimeout=settings.SQS_VISIBILITY_TIMEOUT
-                )
-                return response.get('Messages', [])
+                with CALL_SECONDS.time(operation='receive'):
+                    response = self.sqs.receive_message(
+                        QueueUrl=self.queue_url,
+                        MaxNumberOfMessages=max_messages,
+                        VisibilityTimeout=settings.SQS_VISIBILITY_TIMEOUT,
+                        # Long polling: wait for messages instead of returning empty responses
+                        WaitTimeSeconds=settings.SQS_WAIT_TIME_SECONDS if wait_time_seconds is None else wait_time_seconds
+                    )
+                messages = response.get('Messages', [])
+                MESSAGES.inc(len(messages), operation='receive')
+                QUEUE_DEPTH.dec(len(messages))
+                return messages
             except Exception as e:
                 logger.error(f"Error receiving messages: {e}")
                 return []
         else:
             # Return messages from in-memory queue
-            messages = self.messages[:max_messages]
-            self.messages = self.messages[max_messages:]
-            return [{'Body': json.dumps(msg), 'ReceiptHandle': 'local'} for msg in messages]
-            
+            with self.lock:
+                messages = [self.messages.popleft() for _ in range(min(max_messages, len(self.messages)))]
+            MESSAGES.inc(len(messages), operation='receive')
+            QUEUE_DEPTH.dec(len(messages))
+            return [{'Body': body, 'ReceiptHandle': 'local'} for body in messages]
+
+    def queue_counts(self):
+        # (visible, in flight) messages as reported by the queue, or None if it cannot be asked
+        if not self.queue_url:
+            with self.lock:
+                return len(self.messages), 0
+        try:
+            with CALL_SECONDS.time(operation='attributes'):
+                attributes = self.sqs.get_queue_attributes(
+                    QueueUrl=self.queue_url,
+                    AttributeNames=['ApproximateNumberOfMessages', 'ApproximateNumberOfMessagesNotVisible']
+                )['Attributes']
+        except Exception as e:
+            logger.error(f"Error reading queue attributes: {e}")
+            return None
+        return int(attributes['ApproximateNumberOfMessages']), int(attributes['ApproximateNumberOfMessagesNotVisible'])
+
     def delete_message(self, message):
         if self.queue_url and 'ReceiptHandle' in message:
             try:
-                self.sqs.delete_message(
-                    QueueUrl=self.queue_url,
-                    ReceiptHandle=message['ReceiptHandle']
-                )
+                with CALL_SECONDS.time(operation='delete'):
+                    self.sqs.delete_message(
+                        QueueUrl=self.queue_url,
+                        ReceiptHandle=message['ReceiptHandle']
+                    )
+                MESSAGES.inc(operation='delete')
             except Exception as e:
-                logger.error(f"Error deleting message: {e}")
\ No newline at end of file
+                logger.error(f"Error deleting message: {e}")
+
+    def delete_messages_batch(self, messages):
+        if not self.queue_url:
+            # In-memory messages are removed on receive
+            return {'Successful': [{'Id': str(i)} for i in range(len(messages))], 'Failed': []}
+
+        entries = [
+            {'Id': str(i), 'ReceiptHandle': message['ReceiptHandle']}
+            for i, message in enumerate(messages)
+            if 'ReceiptHandle' in message
+        ]
+        return self._call_batch(self.sqs.delete_message_batch, entries, 'delete_batch')
+
+    def change_visibility_batch(self, messages, visibility_timeout):
+        # Keeps received messages hidden while a slow batch is still being processed
+        if not self.queue_url:
+            # In-memory messages are removed on receive
+            return {'Successful': [{'Id': str(i)} for i in range(len(messages))], 'Failed': []}
+
+        entries = [
+            {'Id': str(i), 'ReceiptHandle': message['ReceiptHandle'], 'VisibilityTimeout': int(visibility_timeout)}
+            for i, message in enumerate(messages)
+            if 'ReceiptHandle' in message
+        ]
+        return self._call_batch(self.sqs.change_message_visibility_batch, entries, 'change_visibility_batch')
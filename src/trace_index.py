@@ -0,0 +1,78 @@
+import time
+import logging
+from collections import OrderedDict
+import numpy as np
+from src import metrics
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+OPEN_TRACES = metrics.gauge('trace_index_open_traces', 'Traces currently held in the trace index')
+EVICTED = metrics.counter('trace_index_evicted_total', 'Traces evicted from the trace index', ('reason',))
+
+class TraceIndex:
+    def __init__(self, ttl=None, max_traces=None):
+        # Streaming index of open traces: trace_id -> [last_seen, spans, missing spans], kept in
+        # least-recently-updated order so both TTL and LRU eviction pop from the front.
+        # Memory is bounded by max_traces, however long the stream runs.
+        self.ttl = settings.TRACE_TTL_SECONDS if ttl is None else ttl
+        self.max_traces = max_traces or settings.TRACE_INDEX_MAX_TRACES
+        self.traces = OrderedDict()
+        self.watermark = None  # Newest event time seen, in seconds
+
+    def _event_times(self, data):
+        # Record timestamps when present, otherwise the arrival time of the batch
+        if 'timestamp' in data:
+            return data['timestamp'].to_numpy(dtype='datetime64[ns]').astype(np.int64) / 1e9
+        return np.full(len(data), time.time())
+
+    def score(self, data):
+        # 1 for a record whose span is missing or whose trace is broken (has a missing span,
+        # here or in an earlier batch), else 0. The batch is folded into the index first, so
+        # every record of a trace broken within this batch is flagged.
+        if len(data) == 0 or 'trace_id' not in data or 'span_id' not in data:
+            return np.zeros(len(data))
+        trace_ids = data['trace_id'].to_numpy(dtype=np.int64)
+        missing = data['span_id'].isna().to_numpy()
+        times = self._event_times(data)
+
+        traces, inverse = np.unique(trace_ids, return_inverse=True)
+        spans = np.bincount(inverse, minlength=len(traces))
+        missing_spans = np.bincount(inverse, weights=missing, minlength=len(traces)).astype(np.int64)
+        last_seen = np.full(len(traces), -np.inf)
+        np.maximum.at(last_seen, inverse, times)
+
+        broken = np.zeros(len(traces), dtype=bool)
+        for i, (trace_id, last, n, n_missing) in enumerate(
+            zip(traces.tolist(), last_seen.tolist(), spans.tolist(), missing_spans.tolist())
+        ):
+            state = self.traces.get(trace_id)
+            if state is None:
+                state = self.traces[trace_id] = [last, 0, 0]
+            else:
+                self.traces.move_to_end(trace_id)
+                state[0] = max(state[0], last)
+            state[1] += n
+            state[2] += n_missing
+            broken[i] = state[2] > 0
+
+        self.watermark = max(self.watermark or -np.inf, float(times.max()))
+        self.evict()
+        return np.maximum(missing, broken[inverse]).astype(np.float64)
+
+    def evict(self):
+        # Traces idle for longer than ttl (in event time) are complete or abandoned; beyond
+        # that, the least recently updated traces go first once max_traces is exceeded
+        expired = 0
+        while self.traces and self.watermark - next(iter(self.traces.values()))[0] > self.ttl:
+            self.traces.popitem(last=False)
+            expired += 1
+        overflow = max(len(self.traces) - self.max_traces, 0)
+        for _ in range(overflow):
+            self.traces.popitem(last=False)
+        EVICTED.inc(expired, reason='ttl')
+        EVICTED.inc(overflow, reason='lru')
+        OPEN_TRACES.set(len(self.traces))
+
+    def broken_traces(self):
+        return [trace_id for trace_id, (_, _, missing) in self.traces.items() if missing]
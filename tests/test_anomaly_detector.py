@@ -1,12 +1,33 @@
+import os
+import json
 import unittest
+import subprocess
+import sys
+import tempfile
+import time
 import numpy as np
 import pandas as pd
-from src.anomaly_detector import AnomalyDetector
+from src.anomaly_detector import AnomalyDetector, DetectionResult, ModelVersionError
+from src.detectors import REGISTRY, register_detector
+from src.detectors.statistical import StatisticalDetector
+from src.detectors.one_class_svm import OneClassSVMDetector
+from src.detectors.lstm_autoencoder import sequence_layout
+from config import settings
+
+class PickleCountingDetector(StatisticalDetector):
+    """Statistical detector that counts how often it is pickled"""
+    name = 'pickle_counting'
+    pickled = 0
+
+    def __getstate__(self):
+        PickleCountingDetector.pickled += 1
+        return self.__dict__.copy()
 
 class TestAnomalyDetector(unittest.TestCase):
     
     def setUp(self):
         """Create test data with known anomalies"""
+        np.random.seed(42)
         self.normal_data = pd.DataFrame({
             'cpu_usage': np.random.normal(50, 10, 100),
             'latency': np.random.normal(100, 20, 100)
@@ -40,5 +61,239 @@ class TestAnomalyDetector(unittest.TestCase):
         self.assertGreater(evaluation['combined']['precision'], 0.5)
         self.assertGreater(evaluation['combined']['recall'], 0.5)
 
+    def test_fit_once_score_many(self):
+        """Test that scoring reuses the fitted models instead of refitting"""
+        self.detector.fit(self.normal_data)
+        model = self.detector.detectors['isolation_forest'].model
+
+        batch = self.anomalous_data.iloc[:10].reset_index(drop=True)
+        results = self.detector.score(batch)
+
+        self.assertIs(self.detector.detectors['isolation_forest'].model, model)
+        self.assertEqual(len(results['combined']), 10)
+        self.assertEqual(results['combined'][5], 1, "Should detect high CPU in a small batch")
+
+    def test_score_requires_fit(self):
+        """Test that scoring an unfitted detector fails loudly"""
+        with self.assertRaises(RuntimeError):
+            self.detector.score(self.anomalous_data)
+
+    def test_save_and_load(self):
+        """Test that saved artifacts reproduce the same predictions"""
+        self.detector.fit(self.normal_data)
+        expected = self.detector.score(self.anomalous_data)
+
+        with tempfile.TemporaryDirectory() as model_dir:
+            self.detector.save(model_dir)
+            self.detector.save(model_dir)
+            loaded = AnomalyDetector.load(model_dir)
+            self.assertEqual(loaded.version, 'v2')
+            np.testing.assert_array_equal(loaded.score(self.anomalous_data).bitmask, expected.bitmask)
+
+    def test_load_pre_plugin_version(self):
+        """Test that a version saved before detector plugins fails with ModelVersionError"""
+        with tempfile.TemporaryDirectory() as model_dir:
+            os.makedirs(os.path.join(model_dir, 'v1'))
+            with open(os.path.join(model_dir, 'v1', AnomalyDetector.MANIFEST), 'w') as f:
+                json.dump({'version': 'v1', 'features': AnomalyDetector.FEATURES, 'lstm_threshold': 0.5}, f)
+            with open(os.path.join(model_dir, AnomalyDetector.LATEST), 'w') as f:
+                f.write('v1')
+            with self.assertRaises(ModelVersionError):
+                AnomalyDetector.load(model_dir)
+
+    def test_approximate_one_class_svm(self):
+        """Test the linear-time One-Class SVM backend, including mini-batch fitting"""
+        reference = pd.DataFrame({
+            'cpu_usage': np.random.normal(50, 10, 2000),
+            'latency': np.random.normal(100, 20, 2000)
+        })
+        batch = pd.DataFrame({'cpu_usage': [50, 95, 50], 'latency': [100, 100, 500]})
+
+        backend, batch_size = settings.ONE_CLASS_SVM_BACKEND, settings.ONE_CLASS_SVM_BATCH_SIZE
+        settings.ONE_CLASS_SVM_BACKEND = 'approximate'
+        try:
+            for mini_batch in (None, 500):
+                settings.ONE_CLASS_SVM_BATCH_SIZE = mini_batch
+                processed = self.detector.preprocess_data(reference, fit=True)
+                svm = OneClassSVMDetector().fit(processed, reference)
+                scores = svm.score(self.detector.preprocess_data(batch), batch)
+                self.assertEqual((scores > 0).astype(int).tolist(), [0, 1, 1])
+        finally:
+            settings.ONE_CLASS_SVM_BACKEND, settings.ONE_CLASS_SVM_BATCH_SIZE = backend, batch_size
+
+    def test_executors_agree(self):
+        """Test that concurrent execution gives the same votes as serial execution"""
+        self.detector.fit(self.normal_data)
+        executor = settings.DETECTOR_EXECUTOR
+        try:
+            settings.DETECTOR_EXECUTOR = 'serial'
+            expected = self.detector.score(self.anomalous_data)
+            for mode in ('thread', 'process'):
+                settings.DETECTOR_EXECUTOR = mode
+                np.testing.assert_array_equal(self.detector.score(self.anomalous_data).bitmask, expected.bitmask)
+                self.detector.close()
+        finally:
+            settings.DETECTOR_EXECUTOR = executor
+
+    def test_process_workers_keep_fitted_detectors(self):
+        """Test that process mode ships each fitted detector once, to its own worker, not once per batch"""
+        register_detector('pickle_counting', f'{__name__}:PickleCountingDetector')
+        executor = settings.DETECTOR_EXECUTOR
+        detector = AnomalyDetector(ensemble=['pickle_counting', 'isolation_forest'], min_votes=1)
+        try:
+            settings.DETECTOR_EXECUTOR = 'process'
+            detector.fit(self.normal_data)
+            PickleCountingDetector.pickled = 0
+            for _ in range(5):
+                result = detector.score(self.anomalous_data)
+            self.assertEqual(PickleCountingDetector.pickled, 1)
+            self.assertEqual(result['pickle_counting'][5], 1)
+        finally:
+            detector.close()
+            settings.DETECTOR_EXECUTOR = executor
+            REGISTRY.pop('pickle_counting', None)
+
+    def test_detector_timeout(self):
+        """Test that a slow detector abstains instead of stalling the batch"""
+        self.detector.fit(self.normal_data)
+        statistical = self.detector.detectors['statistical']
+        score = statistical.score
+
+        def slow_statistical(processed, data):
+            time.sleep(2)
+            return score(processed, data)
+
+        statistical.score = slow_statistical
+        settings.DETECTOR_TIMEOUTS['statistical'] = 0.1
+        try:
+            start = time.monotonic()
+            results = self.detector.score(self.anomalous_data)
+            self.assertLess(time.monotonic() - start, 2)
+            self.assertEqual(results['statistical'].tolist(), [0] * 100)
+        finally:
+            del settings.DETECTOR_TIMEOUTS['statistical']
+            self.detector.close()
+
+    def test_sequence_layout(self):
+        """Test that windows stay within one service, in time order, with short groups padded"""
+        data = pd.DataFrame({
+            'service': ['a', 'b', 'a', 'a', 'b'],
+            'timestamp': [3, 1, 1, 2, 2]
+        })
+        rows, pad, starts = sequence_layout(data, 3)
+        self.assertEqual(rows.tolist(), [2, 3, 0, 1, 1, 4])
+        self.assertEqual(pad.tolist(), [False, False, False, True, False, False])
+        self.assertEqual(starts.tolist(), [0, 3])
+
+    def test_lstm_scores_every_record(self):
+        """Test that per-window reconstruction errors map back to one score per record"""
+        data = self.normal_data.assign(service=np.repeat(['a', 'b'], 50), timestamp=np.arange(100))
+        self.detector.fit(data)
+        batch = data.iloc[:5].reset_index(drop=True)
+        errors = self.detector.detectors['lstm_autoencoder'].score(self.detector.preprocess_data(batch), batch)
+        self.assertEqual(errors.shape, (5,))
+        self.assertTrue(np.all(errors > 0))
+
+    def test_lightweight_ensemble_skips_heavy_imports(self):
+        """Test that a statistical-only detector never imports the heavy backends"""
+        code = (
+            "import sys\n"
+            "import pandas as pd\n"
+            "from src.anomaly_detector import AnomalyDetector\n"
+            "data = pd.DataFrame({'cpu_usage': [50.0, 51.0, 49.0, 95.0], 'latency': [100.0, 101.0, 99.0, 100.0]})\n"
+            "AnomalyDetector(ensemble=['statistical']).detect_anomalies(data)\n"
+            "print(' '.join(m for m in ('tensorflow', 'sklearn.svm', 'sklearn.ensemble') if m in sys.modules))\n"
+        )
+        output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True).stdout
+        self.assertEqual(output.strip(), '')
+
+    def test_ensemble_and_votes_from_settings(self):
+        """Test that the ensemble and vote threshold come from settings and survive save/load"""
+        ensemble, min_votes = settings.DETECTOR_ENSEMBLE, settings.DETECTOR_MIN_VOTES
+        trace_enabled = settings.TRACE_DETECTOR_ENABLED
+        settings.DETECTOR_ENSEMBLE, settings.DETECTOR_MIN_VOTES = ['isolation_forest', 'statistical'], 1
+        settings.TRACE_DETECTOR_ENABLED = False
+        try:
+            detector = AnomalyDetector().fit(self.normal_data)
+            results = detector.score(self.anomalous_data)
+            self.assertEqual(list(results.flags), ['isolation_forest', 'statistical'])
+            self.assertEqual(results.min_votes, 1)
+
+            with tempfile.TemporaryDirectory() as model_dir:
+                detector.save(model_dir)
+                statistical = AnomalyDetector.load(model_dir, ensemble=['statistical'])
+                self.assertEqual(list(statistical.detectors), ['statistical'])
+                with self.assertRaises(ValueError):
+                    AnomalyDetector.load(model_dir, ensemble=['one_class_svm'])
+        finally:
+            settings.DETECTOR_ENSEMBLE, settings.DETECTOR_MIN_VOTES = ensemble, min_votes
+            settings.TRACE_DETECTOR_ENABLED = trace_enabled
+
+    def test_cascade_matches_full_ensemble(self):
+        """Test that the cascade gives the full ensemble's combined flags while scoring fewer rows"""
+        detector = AnomalyDetector(
+            ensemble=['statistical', 'isolation_forest', 'one_class_svm', 'lstm_autoencoder'], min_votes=2
+        ).fit(self.normal_data)
+        saved = settings.DETECTOR_CASCADE, settings.CASCADE_SCREEN_Z
+        try:
+            settings.DETECTOR_CASCADE = False
+            expected = detector.score(self.anomalous_data)
+            settings.DETECTOR_CASCADE, settings.CASCADE_SCREEN_Z = True, None
+            result = detector.score(self.anomalous_data)
+            np.testing.assert_array_equal(result.combined, expected.combined)
+            fractions = list(result.stage_fractions.values())
+            self.assertEqual(list(result.stage_fractions), ['statistical+isolation_forest', 'one_class_svm', 'lstm_autoencoder'])
+            self.assertEqual(fractions[0], 1.0)
+            self.assertLess(fractions[-1], 1.0)
+            self.assertEqual(fractions, sorted(fractions, reverse=True))
+
+            # The z-screen only ever drops rows, so it can miss flags but never adds one
+            settings.CASCADE_SCREEN_Z = 2.0
+            screened = detector.score(self.anomalous_data)
+            self.assertTrue(np.all(screened.combined <= expected.combined))
+            self.assertLessEqual(list(screened.stage_fractions.values())[1], fractions[1])
+        finally:
+            settings.DETECTOR_CASCADE, settings.CASCADE_SCREEN_Z = saved
+            detector.close()
+
+    def test_lstm_score_rows_keeps_context(self):
+        """Test that scoring a subset of records gives them the same LSTM error as a full pass"""
+        data = self.normal_data.assign(service=np.repeat(['a', 'b'], 50), timestamp=np.arange(100))
+        self.detector.fit(data)
+        lstm = self.detector.detectors['lstm_autoencoder']
+        processed = self.detector.preprocess_data(data)
+        rows = np.array([3, 48, 51, 97])
+        np.testing.assert_allclose(lstm.score_rows(processed, data, rows), lstm.score(processed, data)[rows], rtol=1e-5)
+
+    def test_lstm_spike_flags_only_itself(self):
+        """Test that a single-point spike raises the LSTM flag of that record and no neighbour"""
+        data = self.normal_data.assign(service='a', timestamp=np.arange(100))
+        detector = AnomalyDetector(ensemble=['lstm_autoencoder'], min_votes=1).fit(data)
+        spiked = data.copy()
+        spiked.loc[50, ['cpu_usage', 'latency']] = [100.0, 1000.0]
+        before = detector.score(data)['lstm_autoencoder']
+        after = detector.score(spiked)['lstm_autoencoder']
+        self.assertEqual(np.flatnonzero(after != before).tolist(), [50])
+        detector.close()
+
+    def test_detection_result_rethreshold(self):
+        """Test vectorized voting and re-thresholding from stored scores"""
+        result = DetectionResult(
+            {'a': [0.5, 2.0, 3.0], 'b': [0.1, 0.2, 5.0], 'c': [9.0, 0.0, 9.0]},
+            {'a': 1.0, 'b': 1.0, 'c': 1.0}
+        )
+        self.assertEqual(result['a'].dtype, np.int8)
+        self.assertEqual(result.votes.tolist(), [1, 1, 3])
+        self.assertEqual(result['combined'].tolist(), [0, 0, 1])
+        self.assertEqual(result.bitmask.tolist(), [0b100, 0b001, 0b111])
+
+        looser = result.with_thresholds({'b': 0.15}, min_votes=2)
+        self.assertEqual(looser.combined.tolist(), [0, 1, 1])
+        self.assertEqual(result.combined.tolist(), [0, 0, 1], "Original result is unchanged")
+
+        both = DetectionResult.concat([result, looser])
+        self.assertEqual(len(both), 6)
+        self.assertEqual(both.combined.tolist(), [0, 0, 1, 0, 0, 1])
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,34 @@
+import unittest
+from benchmarks.suite import compare, run_stage
+
+
+class TestBenchmarkSuite(unittest.TestCase):
+
+    def test_stages_report_metrics(self):
+        """Test that the cheap stages run end to end and report the expected metrics"""
+        options = {'seed': 42, 'detectors': ['statistical'], 'sqs_queue': None}
+        records = [record for stage in ('generate', 'sqs', 'detector') for record in run_stage(stage, 1000, options)]
+
+        self.assertEqual(
+            [record['name'] for record in records],
+            ['generate', 'sqs.enqueue', 'sqs.dequeue', 'statistical.fit', 'statistical.score']
+        )
+        dequeue = records[2]
+        self.assertEqual(dequeue['rows'], 1000)
+        self.assertGreater(dequeue['throughput_rows_per_s'], 0)
+        self.assertLessEqual(dequeue['latency_p50_ms'], dequeue['latency_p99_ms'])
+        self.assertGreater(dequeue['peak_rss_mb'], 0)
+
+    def test_compare_flags_regressions(self):
+        """Test that only changes beyond the tolerance, in the bad direction, are flagged"""
+        key = {'stage': 'sqs', 'name': 'sqs.enqueue', 'rows': 1000}
+        baseline = [dict(key, throughput_rows_per_s=1000.0, latency_p95_ms=10.0, peak_rss_delta_mb=50.0)]
+        current = [dict(key, throughput_rows_per_s=700.0, latency_p95_ms=5.0, peak_rss_delta_mb=55.0)]
+
+        regressions = compare(current, baseline, tolerance=0.2)
+        self.assertEqual([r['metric'] for r in regressions], ['throughput_rows_per_s'])
+        self.assertEqual(regressions[0]['change'], -0.3)
+        self.assertEqual(compare(current, [], tolerance=0.2), [])
+
+if __name__ == '__main__':
+    unittest.main()
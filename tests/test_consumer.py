@@ -0,0 +1,158 @@
+import os
+import json
+import time
+import queue
+import unittest
+import tempfile
+import threading
+from src.consumer import ConsumerPool
+from src.local_queue import LocalQueueClient
+from src.pipeline import END
+from config import settings
+
+class LocalSQS:
+    """The SQSHandler calls ConsumerPool makes, against the local queue backend"""
+
+    def __init__(self, path):
+        self.client = LocalQueueClient(path)
+        self.queue_url = self.client.create_queue(
+            QueueName='consumers', Attributes={'FifoQueue': 'true', 'ContentBasedDeduplication': 'true'}
+        )['QueueUrl']
+        self.extended = 0
+
+    def send(self, records, group):
+        for start in range(0, len(records), 10):
+            self.client.send_message_batch(QueueUrl=self.queue_url, Entries=[
+                {'Id': str(i), 'MessageBody': json.dumps(record), 'MessageGroupId': group(record)}
+                for i, record in enumerate(records[start:start + 10])
+            ])
+
+    def receive_messages(self, max_messages=10, wait_time_seconds=None):
+        return self.client.receive_message(
+            QueueUrl=self.queue_url, MaxNumberOfMessages=max_messages, WaitTimeSeconds=wait_time_seconds or 0,
+            VisibilityTimeout=settings.SQS_VISIBILITY_TIMEOUT
+        ).get('Messages', [])
+
+    def delete_messages_batch(self, messages):
+        for start in range(0, len(messages), 10):
+            self.client.delete_message_batch(QueueUrl=self.queue_url, Entries=[
+                {'Id': str(i), 'ReceiptHandle': m['ReceiptHandle']} for i, m in enumerate(messages[start:start + 10])
+            ])
+
+    def queue_counts(self):
+        attributes = self.client.get_queue_attributes(QueueUrl=self.queue_url)['Attributes']
+        return int(attributes['ApproximateNumberOfMessages']), int(attributes['ApproximateNumberOfMessagesNotVisible'])
+
+    def change_visibility_batch(self, messages, visibility_timeout):
+        self.extended += 1
+        for start in range(0, len(messages), 10):
+            self.client.change_message_visibility_batch(QueueUrl=self.queue_url, Entries=[
+                {'Id': str(i), 'ReceiptHandle': m['ReceiptHandle'], 'VisibilityTimeout': visibility_timeout}
+                for i, m in enumerate(messages[start:start + 10])
+            ])
+
+class TestConsumerPool(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.sqs = LocalSQS(os.path.join(self.tmp.name, 'queue.db'))
+        self.saved = (settings.SQS_VISIBILITY_TIMEOUT, settings.CONSUMER_POLL_SECONDS)
+        settings.CONSUMER_POLL_SECONDS = 0.1
+
+    def tearDown(self):
+        settings.SQS_VISIBILITY_TIMEOUT, settings.CONSUMER_POLL_SECONDS = self.saved
+        self.tmp.cleanup()
+
+    def _run(self, pool, count):
+        enqueued = pool.inbox
+        pool.start()
+        enqueued.put(count)
+        enqueued.put(END)
+        pool.join()
+
+    def test_every_message_once_in_group_order(self):
+        """Workers share the queue, handle each message once and keep each group in order"""
+        records = [{'id': i, 'service': f'service-{i % 5}'} for i in range(300)]
+        self.sqs.send(records, group=lambda record: record['service'])
+        seen, lock = [], threading.Lock()
+
+        def handle(messages):
+            with lock:
+                seen.extend(json.loads(m['Body']) for m in messages)
+            time.sleep(0.01)
+
+        pool = ConsumerPool(self.sqs, handle, workers=4, batch_size=20, inbox=queue.Queue())
+        self._run(pool, len(records))
+
+        self.assertIsNone(pool.error)
+        self.assertEqual(sorted(r['id'] for r in seen), list(range(300)))
+        for service in {r['service'] for r in records}:
+            ids = [r['id'] for r in seen if r['service'] == service]
+            self.assertEqual(ids, sorted(ids))
+
+    def test_no_early_stop_while_groups_are_in_flight(self):
+        """Workers keep going while every remaining group is held by another worker"""
+        records = [{'id': i} for i in range(60)]
+        self.sqs.send(records, group=lambda record: f"group-{record['id'] % 2}")
+        handled, lock = [], threading.Lock()
+
+        def handle(messages):
+            time.sleep(0.3)
+            with lock:
+                handled.extend(json.loads(m['Body'])['id'] for m in messages)
+
+        pool = ConsumerPool(self.sqs, handle, workers=4, batch_size=10, inbox=queue.Queue())
+        self._run(pool, len(records))
+
+        self.assertIsNone(pool.error)
+        self.assertEqual(sorted(handled), list(range(60)))
+
+    def test_stops_when_fewer_messages_arrive_than_were_counted(self):
+        """Deduplicated sends leave the queue empty before the count is reached"""
+        self.sqs.send([{'id': i % 5} for i in range(10)], group=lambda record: 'one')
+        pool = ConsumerPool(self.sqs, lambda messages: None, workers=2, batch_size=10, inbox=queue.Queue())
+        self._run(pool, 10)
+
+        self.assertIsNone(pool.error)
+        self.assertEqual(pool.processed, 5)
+
+    def test_slow_batch_visibility_is_extended(self):
+        """A batch that outlives its visibility timeout is extended rather than redelivered"""
+        settings.SQS_VISIBILITY_TIMEOUT = 0.3
+        self.sqs.send([{'id': i} for i in range(10)], group=lambda record: f"group-{record['id']}")
+        handled = []
+
+        def handle(messages):
+            handled.extend(json.loads(m['Body'])['id'] for m in messages)
+            time.sleep(1.0)
+
+        pool = ConsumerPool(self.sqs, handle, workers=2, batch_size=10, inbox=queue.Queue())
+        self._run(pool, 10)
+
+        self.assertEqual(sorted(handled), list(range(10)))
+        self.assertGreater(self.sqs.extended, 0)
+
+    def test_graceful_stop(self):
+        """stop() lets the batch in flight finish and be deleted before the workers exit"""
+        self.sqs.send([{'id': i} for i in range(50)], group=lambda record: 'one')
+        started, results = threading.Event(), queue.Queue()
+
+        def handle(messages):
+            started.set()
+            time.sleep(0.2)
+            return len(messages)
+
+        pool = ConsumerPool(self.sqs, handle, workers=2, batch_size=10, outbox=results).start()
+        started.wait(5)
+        pool.stop()
+        pool.join()
+
+        handled = 0
+        while (item := results.get()) is not END:
+            handled += item
+        remaining = self.sqs.client.get_queue_attributes(QueueUrl=self.sqs.queue_url)['Attributes']
+        self.assertEqual(int(remaining['ApproximateNumberOfMessages']), 50 - handled)
+        self.assertEqual(remaining['ApproximateNumberOfMessagesNotVisible'], '0')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,8 @@
 import unittest
 import pandas as pd
 from src.data_generator import SyntheticDataGenerator
+from src import schema
+from config import settings
 
 class TestDataGenerator(unittest.TestCase):
     
@@ -23,5 +25,55 @@ class TestDataGenerator(unittest.TestCase):
         self.assertGreater(len(error_logs), 0, "Should have error logs")
         self.assertGreater(len(high_cpu), 0, "Should have high CPU values")
 
+    def test_chunked_generation_is_seeded(self):
+        """Test that chunked generation is bounded, ordered and reproducible"""
+        generator = SyntheticDataGenerator(seed=7)
+        generator.size = 2500
+        chunks = list(generator.generate_chunks(chunk_size=1000))
+        df = pd.concat(chunks, ignore_index=True)
+
+        self.assertEqual([len(c) for c in chunks], [1000, 1000, 500])
+        self.assertTrue(df['timestamp'].is_monotonic_increasing)
+        self.assertEqual(df['trace_id'].iloc[-1], 2499 // settings.SPANS_PER_TRACE)
+
+        again = pd.concat(generator.generate_chunks(chunk_size=1000), ignore_index=True)
+        pd.testing.assert_frame_equal(df, again)
+
+    def test_seeded_output_ignores_chunk_size(self):
+        """Test that a seeded dataset is the same whatever chunk size generates it"""
+        generator = SyntheticDataGenerator(seed=7)
+        generator.size = 10000
+        expected = generator.generate_data()
+        for chunk_size in (999, 4096, 5000, 20000):
+            chunks = list(generator.generate_chunks(chunk_size=chunk_size))
+            self.assertTrue(all(len(chunk) <= chunk_size for chunk in chunks), chunk_size)
+            df = pd.concat(chunks, ignore_index=True)
+            pd.testing.assert_frame_equal(df, expected, obj=f"chunk_size={chunk_size}")
+
+    def test_compact_schema(self):
+        """Test that generated data uses the compact dtypes, also after concatenating chunks"""
+        generator = SyntheticDataGenerator(seed=7)
+        generator.size = 2500
+        df = pd.concat(generator.generate_chunks(chunk_size=1000), ignore_index=True)
+
+        self.assertEqual(list(df.columns), schema.COLUMNS)
+        for column, dtype in schema.DTYPES.items():
+            self.assertEqual(df[column].dtype, dtype, column)
+        self.assertGreater(df['span_id'].isna().sum(), 0, "Should have missing spans")
+        self.assertTrue((df['message_id'] == 'error').any(), "Should have error messages")
+
+    def test_multi_span_traces(self):
+        """Test that traces span several services and a share of their spans is dropped"""
+        generator = SyntheticDataGenerator(seed=7)
+        generator.size = 4000
+        df = generator.generate_data()
+
+        spans = df.groupby('trace_id').size()
+        self.assertEqual(len(spans), 4000 // settings.SPANS_PER_TRACE)
+        self.assertTrue((spans == settings.SPANS_PER_TRACE).all())
+        self.assertGreater(df.groupby('trace_id')['service'].nunique().mean(), 1)
+        self.assertTrue(df['span_id'].dropna().is_unique)
+        self.assertAlmostEqual(df['span_id'].isna().mean(), settings.SPAN_DROP_RATE, delta=0.02)
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,71 @@
+import os
+import tempfile
+import unittest
+import pandas as pd
+from src.anomaly_detector import AnomalyDetector
+from src.data_generator import SyntheticDataGenerator
+from src.ingest import infer_format, read_batches, write_dataset
+from src import schema
+
+LEGACY_CSV = os.path.join(os.path.dirname(__file__), '..', 'outputs', 'synthetic_data.csv')
+
+
+class TestIngest(unittest.TestCase):
+
+    def setUp(self):
+        self.generator = SyntheticDataGenerator(seed=5)
+        self.generator.size = 2500
+        # The files and the expected frame come from the same chunks
+        self.chunks = list(self.generator.generate_chunks(chunk_size=1000))
+        self.expected = pd.concat(self.chunks, ignore_index=True)
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_round_trip(self):
+        """Test that every format reads back the same records, in batches, in the compact schema"""
+        for fmt, name in (('parquet', 'capture'), ('arrow', 'capture_ipc'), ('csv', 'capture.csv')):
+            path = os.path.join(self.tmp.name, name)
+            write_dataset(self.chunks, path, fmt)
+            self.assertEqual(infer_format(path), fmt)
+
+            batches = list(read_batches(path, batch_size=400))
+            self.assertTrue(all(len(batch) <= 400 for batch in batches), fmt)
+            actual = pd.concat(batches, ignore_index=True)
+            self.assertEqual(dict(actual.dtypes), dict(self.expected.dtypes), fmt)
+            pd.testing.assert_frame_equal(actual, self.expected, check_exact=False, obj=fmt)
+
+    def test_legacy_csv(self):
+        """Test that a capture written before the compact schema still reads into it"""
+        legacy = pd.read_csv(LEGACY_CSV)
+        df = pd.concat(read_batches(LEGACY_CSV, batch_size=40), ignore_index=True)
+
+        self.assertEqual(list(df.columns), schema.COLUMNS)
+        self.assertEqual(dict(df.dtypes), {column: pd.Series(dtype=dtype).dtype for column, dtype in schema.DTYPES.items()})
+        self.assertEqual(df['trace_id'].tolist(), [int(t.removeprefix('trace_')) for t in legacy['trace_id']])
+        self.assertEqual(df['span_id'].isna().sum(), legacy['span_id'].isna().sum())
+        self.assertEqual(schema.render_messages(df).tolist(), legacy['message'].tolist())
+        # Ids in another format are dictionary-encoded
+        ids = schema.conform(pd.DataFrame({'trace_id': ['a1f', '9c0', 'a1f']}))['trace_id']
+        self.assertEqual(ids.tolist(), [0, 1, 0])
+
+    def test_rewrite_replaces_parts(self):
+        """Test that writing into an existing dataset directory does not mix in old parts"""
+        path = os.path.join(self.tmp.name, 'capture')
+        write_dataset([self.expected.iloc[:100], self.expected.iloc[100:200]], path, 'parquet')
+        write_dataset([self.expected.iloc[:50]], path, 'parquet')
+        self.assertEqual(sum(len(batch) for batch in read_batches(path)), 50)
+
+    def test_detector_scans_dataset(self):
+        """Test that the detector scores a dataset batch by batch"""
+        path = os.path.join(self.tmp.name, 'capture')
+        write_dataset(self.chunks, path, 'arrow')
+        detector = AnomalyDetector(ensemble=['isolation_forest', 'statistical'])
+
+        sizes = [(len(batch), len(result)) for batch, result in detector.scan(path, batch_size=1000)]
+        self.assertEqual(sizes, [(1000, 1000), (1000, 1000), (500, 500)])
+        self.assertTrue(detector.fitted)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,154 @@
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from src.llm_candidate import LLMCandidateGenerator, RootCauseCache, TokenBucket, anomaly_signature
+from config import settings
+
+
+class StubGroqHandler(BaseHTTPRequestHandler):
+    """Chat-completions stub that fails every first request with a 503"""
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        server = self.server
+        with server.lock:
+            server.requests += 1
+            server.in_flight += 1
+            server.max_in_flight = max(server.max_in_flight, server.in_flight)
+            fail = server.requests == 1
+        time.sleep(0.05)
+        with server.lock:
+            server.in_flight -= 1
+
+        if fail:
+            self.send_response(503)
+            self.end_headers()
+            return
+        content = json.dumps({'anomaly_id': 0, 'root_cause': 'stub', 'confidence': 0.9})
+        payload = json.dumps({
+            'id': 'stub', 'object': 'chat.completion', 'created': 0, 'model': body['model'],
+            'choices': [{'index': 0, 'finish_reason': 'stop',
+                         'message': {'role': 'assistant', 'content': content}}]
+        }).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestLLMCandidateGenerator(unittest.TestCase):
+
+    def setUp(self):
+        self.overrides = {
+            'LLM_PROVIDER': 'mock', 'LLM_MAX_CONCURRENCY': 4, 'LLM_RETRY_BACKOFF': 0.01,
+            'LLM_REQUESTS_PER_MINUTE': 0, 'LLM_TOKENS_PER_MINUTE': 0, 'LLM_CACHE_ENABLED': False
+        }
+        self.saved = {name: getattr(settings, name) for name in self.overrides}
+        for name, value in self.overrides.items():
+            setattr(settings, name, value)
+        self.anomalies = [{'id': i, 'service': 'database', 'cpu_usage': 95.0} for i in range(12)]
+
+    def tearDown(self):
+        for name, value in self.saved.items():
+            setattr(settings, name, value)
+
+    def test_mock_candidates_keep_order(self):
+        """Test that concurrent generation returns one candidate per anomaly, in order"""
+        generator = LLMCandidateGenerator()
+        candidates = [generator.parse_response(r) for r in generator.generate_candidates(self.anomalies)]
+        self.assertEqual([c['anomaly_id'] for c in candidates], list(range(12)))
+
+    def test_stub_server_concurrency_and_retry(self):
+        """Test bounded concurrency, a shared client and retries against a local stub"""
+        server = ThreadingHTTPServer(('127.0.0.1', 0), StubGroqHandler)
+        server.lock = threading.Lock()
+        server.requests = server.in_flight = server.max_in_flight = 0
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        try:
+            generator = LLMCandidateGenerator()
+            generator.provider = 'groq'
+            generator.api_key = 'test'
+            generator.base_url = f'http://127.0.0.1:{server.server_port}'
+            responses = generator.generate_candidates(self.anomalies)
+            client = generator.client
+            generator.close()
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        self.assertIsNotNone(client)
+        self.assertTrue(all(json.loads(r)['root_cause'] == 'stub' for r in responses))
+        self.assertEqual(server.requests, 13, "The failed request should be retried once")
+        self.assertLessEqual(server.max_in_flight, 4)
+
+    def test_token_bucket_rate(self):
+        """Test that the bucket admits a burst of its capacity, then throttles"""
+        bucket = TokenBucket(600)  # 10 per second
+        start = time.monotonic()
+        bucket.acquire(600)
+        bucket.acquire(5)
+        self.assertGreaterEqual(time.monotonic() - start, 0.4)
+
+    def test_signature_coalescing(self):
+        """Test that near-identical anomalies share one LLM call and keep their own ids"""
+        settings.LLM_CACHE_ENABLED = True
+        generator = LLMCandidateGenerator()
+        calls = []
+        generate = generator._generate
+        generator._generate = lambda metadata: calls.append(metadata['id']) or generate(metadata)
+
+        anomalies = self.anomalies + [{'id': 12, 'service': 'database', 'cpu_usage': 95.0, 'span_id': 'span_12'}]
+        candidates = [json.loads(r) for r in generator.generate_candidates(anomalies)]
+        self.assertEqual(calls, [0, 12])
+        self.assertEqual([c['anomaly_id'] for c in candidates], list(range(13)))
+
+        generator.generate_candidate({'id': 99, 'service': 'database', 'cpu_usage': 97.5})
+        self.assertEqual(len(calls), 2, "Same bucket should be served from the cache")
+        self.assertEqual(generator.cache.stats()['hits'], 1)
+
+    def test_cache_lru_ttl_and_disk(self):
+        """Test LRU eviction, TTL expiry and persistence across cache instances"""
+        cache = RootCauseCache(max_entries=2, ttl=None)
+        for key in ('a', 'b', 'c'):
+            cache.put(key, key.upper())
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.get('c'), 'C')
+        self.assertEqual(cache.stats(), {'hits': 1, 'misses': 1, 'evictions': 1, 'size': 2})
+
+        expiring = RootCauseCache(max_entries=2, ttl=0)
+        expiring.put('a', 'A')
+        time.sleep(0.01)
+        self.assertIsNone(expiring.get('a'))
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'cache.db')
+            first = RootCauseCache(max_entries=10, ttl=60, path=path)
+            first.put(anomaly_signature({'service': 'database', 'cpu_usage': 95.0}), 'cached')
+            first.close()
+            second = RootCauseCache(max_entries=10, ttl=60, path=path)
+            self.assertEqual(second.get(anomaly_signature({'service': 'database', 'cpu_usage': 91.0})), 'cached')
+            second.close()
+
+    def test_disk_cache_drops_expired_rows(self):
+        """Test that writes delete expired rows from the SQLite store"""
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = RootCauseCache(max_entries=10, ttl=0.05, path=os.path.join(tmp, 'cache.db'))
+            for key in ('a', 'b', 'c'):
+                cache.put(key, key.upper())
+            time.sleep(0.1)
+            cache.put('d', 'D')
+            rows = cache.db.execute("SELECT signature FROM root_causes").fetchall()
+            self.assertEqual(rows, [('d',)])
+            cache.close()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,124 @@
+import os
+import json
+import time
+import unittest
+import tempfile
+import multiprocessing
+from src import local_queue
+from src.local_queue import LocalQueueClient, LocalQueueError
+
+def _consume(path, queue_url, results):
+    # Drains the queue from a separate process, deleting what it receives
+    client = LocalQueueClient(path)
+    received = []
+    while True:
+        messages = client.receive_message(QueueUrl=queue_url, MaxNumberOfMessages=10).get('Messages', [])
+        if not messages:
+            break
+        received.extend(json.loads(m['Body'])['id'] for m in messages)
+        client.delete_message_batch(
+            QueueUrl=queue_url, Entries=[{'Id': str(i), 'ReceiptHandle': m['ReceiptHandle']} for i, m in enumerate(messages)]
+        )
+    results.put(received)
+
+class TestLocalQueue(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'queue.db')
+        self.client = LocalQueueClient(self.path)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _send(self, queue_url, n, group=None):
+        for start in range(0, n, 10):
+            entries = [{'Id': str(i), 'MessageBody': json.dumps({'id': i})} for i in range(start, min(start + 10, n))]
+            for entry in entries:
+                if group is not None:
+                    entry['MessageGroupId'] = group(int(entry['Id']))
+            self.assertEqual(self.client.send_message_batch(QueueUrl=queue_url, Entries=entries)['Failed'], [])
+
+    def _ids(self, messages):
+        return [json.loads(m['Body'])['id'] for m in messages]
+
+    def test_visibility_timeout_and_redelivery(self):
+        """An undeleted message comes back after its visibility timeout with a new receipt handle"""
+        queue_url = self.client.create_queue(QueueName='standard')['QueueUrl']
+        self._send(queue_url, 1)
+
+        first = self.client.receive_message(QueueUrl=queue_url, VisibilityTimeout=0.2)['Messages']
+        self.assertEqual(self.client.receive_message(QueueUrl=queue_url), {})
+        time.sleep(0.3)
+        second = self.client.receive_message(QueueUrl=queue_url)['Messages']
+        self.assertEqual(second[0]['Attributes']['ApproximateReceiveCount'], '2')
+
+        # The first handle is stale once the message has been delivered again
+        with self.assertRaises(LocalQueueError):
+            self.client.delete_message(QueueUrl=queue_url, ReceiptHandle=first[0]['ReceiptHandle'])
+        self.client.delete_message(QueueUrl=queue_url, ReceiptHandle=second[0]['ReceiptHandle'])
+        self.assertEqual(self.client.get_queue_attributes(QueueUrl=queue_url)['Attributes']['ApproximateNumberOfMessages'], '0')
+
+    def test_fifo_message_groups(self):
+        """A group is delivered in order and blocked while one of its messages is in flight"""
+        queue_url = self.client.create_queue(
+            QueueName='fifo', Attributes={'FifoQueue': 'true', 'ContentBasedDeduplication': 'true'}
+        )['QueueUrl']
+        self._send(queue_url, 6, group=lambda i: 'a' if i % 2 == 0 else 'b')
+        # Content-based deduplication drops a repeat of the same body
+        self.client.send_message(QueueUrl=queue_url, MessageBody=json.dumps({'id': 0}), MessageGroupId='a')
+
+        first = self.client.receive_message(QueueUrl=queue_url, MaxNumberOfMessages=1)['Messages']
+        self.assertEqual(self._ids(first), [0])
+        # Group a is in flight, so only group b is delivered
+        self.assertEqual(self._ids(self.client.receive_message(QueueUrl=queue_url, MaxNumberOfMessages=10)['Messages']), [1, 3, 5])
+        self.client.delete_message(QueueUrl=queue_url, ReceiptHandle=first[0]['ReceiptHandle'])
+        self.assertEqual(self._ids(self.client.receive_message(QueueUrl=queue_url, MaxNumberOfMessages=10)['Messages']), [2, 4])
+
+    def test_deduplication_window_expires(self):
+        """A repeat after the deduplication window is enqueued again, even before the expired id is purged"""
+        queue_url = self.client.create_queue(
+            QueueName='fifo', Attributes={'FifoQueue': 'true', 'ContentBasedDeduplication': 'true'}
+        )['QueueUrl']
+        window = local_queue.DEDUPLICATION_WINDOW
+        try:
+            local_queue.DEDUPLICATION_WINDOW = 0.2
+            self._send(queue_url, 1, group=lambda i: 'a')
+            self._send(queue_url, 1, group=lambda i: 'a')
+            time.sleep(0.3)
+            self._send(queue_url, 1, group=lambda i: 'a')
+        finally:
+            local_queue.DEDUPLICATION_WINDOW = window
+
+        self.assertEqual(self._ids(self.client.receive_message(QueueUrl=queue_url, MaxNumberOfMessages=10)['Messages']), [0, 0])
+
+    def test_dead_letter_after_max_receives(self):
+        dlq_url = self.client.create_queue(QueueName='work-dlq')['QueueUrl']
+        dlq_arn = self.client.get_queue_attributes(QueueUrl=dlq_url)['Attributes']['QueueArn']
+        queue_url = self.client.create_queue(QueueName='work', Attributes={
+            'RedrivePolicy': json.dumps({'deadLetterTargetArn': dlq_arn, 'maxReceiveCount': '2'})
+        })['QueueUrl']
+        self._send(queue_url, 1)
+
+        for _ in range(2):
+            self.assertEqual(len(self.client.receive_message(QueueUrl=queue_url, VisibilityTimeout=0)['Messages']), 1)
+        self.assertEqual(self.client.receive_message(QueueUrl=queue_url), {})
+        self.assertEqual(self._ids(self.client.receive_message(QueueUrl=dlq_url)['Messages']), [0])
+
+    def test_concurrent_processes(self):
+        """Consumers in separate processes together receive every message exactly once"""
+        queue_url = self.client.create_queue(QueueName='shared')['QueueUrl']
+        self._send(queue_url, 200)
+
+        context = multiprocessing.get_context('spawn')
+        results = context.Queue()
+        consumers = [context.Process(target=_consume, args=(self.path, queue_url, results)) for _ in range(4)]
+        for consumer in consumers:
+            consumer.start()
+        received = [i for _ in consumers for i in results.get(timeout=60)]
+        for consumer in consumers:
+            consumer.join()
+        self.assertEqual(sorted(received), list(range(200)))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+import os
+import signal
+import unittest
+import tempfile
+from src import main
+from src.data_generator import SyntheticDataGenerator
+from src.llm_candidate import LLMCandidateGenerator
+from config import settings
+
+
+class RecordingGenerator(LLMCandidateGenerator):
+    """Mock root-cause generator that keeps every anomaly the pipeline hands it"""
+    anomalies = []
+
+    def generate_candidates(self, anomalies):
+        RecordingGenerator.anomalies.extend(anomalies)
+        return super().generate_candidates(anomalies)
+
+
+class TestMain(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.overrides = {
+            'DATA_SIZE': 2000, 'SQS_BACKEND': 'local', 'LOCAL_QUEUE_PATH': os.path.join(self.tmp.name, 'queue.db'),
+            'SQS_MESSAGE_GROUP_KEY': 'trace_id', 'CONSUMER_POLL_SECONDS': 0.1,
+            'MODEL_DIR': os.path.join(self.tmp.name, 'models'), 'DETECTOR_ENSEMBLE': ['trace_index'],
+            'TRACE_DETECTOR_ENABLED': True, 'ONLINE_DETECTOR_ENABLED': False, 'DETECTOR_SHARDS': 1,
+            'LLM_PROVIDER': 'mock', 'LLM_REQUESTS_PER_MINUTE': 0, 'LLM_TOKENS_PER_MINUTE': 0, 'LLM_CACHE_PATH': None,
+            'METRICS_PORT': None, 'METRICS_SNAPSHOT_PATH': None
+        }
+        self.saved = {name: getattr(settings, name) for name in self.overrides}
+        for name, value in self.overrides.items():
+            setattr(settings, name, value)
+        # main() writes its outputs relative to the working directory and handles SIGTERM
+        self.cwd, self.sigterm = os.getcwd(), signal.getsignal(signal.SIGTERM)
+        os.chdir(self.tmp.name)
+        os.makedirs('outputs')
+        self.generator_class, main.LLMCandidateGenerator = main.LLMCandidateGenerator, RecordingGenerator
+        RecordingGenerator.anomalies = []
+
+    def tearDown(self):
+        main.LLMCandidateGenerator = self.generator_class
+        signal.signal(signal.SIGTERM, self.sigterm)
+        os.chdir(self.cwd)
+        for name, value in self.saved.items():
+            setattr(settings, name, value)
+        self.tmp.cleanup()
+
+    def test_trace_index_flags_broken_traces(self):
+        """Test that the pipeline flags intact spans of traces broken by a dropped span"""
+        main.main()
+
+        data = SyntheticDataGenerator().generate_data()
+        broken = set(data.loc[data['span_id'].isna(), 'trace_id'])
+        flagged = RecordingGenerator.anomalies
+        self.assertTrue(flagged)
+        self.assertTrue({anomaly['trace_id'] for anomaly in flagged} <= broken)
+        # Every dropped span, and beyond them other spans of the same traces
+        dropped = [anomaly for anomaly in flagged if anomaly['span_id'] is None]
+        self.assertEqual(len(dropped), int(data['span_id'].isna().sum()))
+        self.assertGreater(len(flagged), len(dropped))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+import json
+import os
+import tempfile
+import time
+import unittest
+import urllib.request
+from src.metrics import MetricsExporter, MetricsRegistry
+
+
+class TestMetrics(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = MetricsRegistry()
+
+    def test_counters_and_histograms(self):
+        """Test label handling and cumulative histogram buckets"""
+        calls = self.registry.counter('calls_total', 'Calls', ('outcome',))
+        calls.inc(outcome='success')
+        calls.inc(2, outcome='success')
+        calls.inc(outcome='error')
+        self.assertIs(self.registry.counter('calls_total', 'Calls', ('outcome',)), calls)
+        with self.assertRaises(ValueError):
+            calls.inc(status='success')
+
+        latency = self.registry.histogram('latency_seconds', 'Latency', buckets=(0.1, 1.0))
+        for value in (0.05, 0.1, 0.5, 5.0):
+            latency.observe(value)
+        with latency.time():
+            pass
+
+        [(labels, value)] = latency.samples()
+        self.assertEqual(labels, {})
+        self.assertEqual(value['buckets'], {'0.1': 3, '1.0': 4, '+Inf': 5})
+        self.assertEqual(value['count'], 5)
+        self.assertEqual(dict((l['outcome'], v) for l, v in calls.samples()), {'success': 3, 'error': 1})
+
+    def test_prometheus_text(self):
+        """Test the text exposition format, including label escaping"""
+        self.registry.gauge('queue_depth', 'Depth', ('queue',)).set(4, queue='a"b')
+        self.registry.histogram('seconds', 'Time', buckets=(1.0,)).observe(0.5)
+
+        text = self.registry.prometheus_text()
+        self.assertIn('# TYPE queue_depth gauge\n', text)
+        self.assertIn('queue_depth{queue="a\\"b"} 4\n', text)
+        self.assertIn('seconds_bucket{le="1.0"} 1\n', text)
+        self.assertIn('seconds_bucket{le="+Inf"} 1\n', text)
+        self.assertIn('seconds_count 1\n', text)
+
+    def test_exporters(self):
+        """Test the HTTP endpoint and the periodic JSON snapshot"""
+        self.registry.counter('records_total', 'Records').inc(7)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'metrics.json')
+            exporter = MetricsExporter(self.registry).start(port=0, snapshot_path=path, snapshot_interval=0.01)
+            try:
+                url = f"http://127.0.0.1:{exporter.server.server_port}/metrics"
+                body = urllib.request.urlopen(url).read().decode()
+                self.assertIn('records_total 7\n', body)
+                time.sleep(0.05)
+                self.assertTrue(os.path.exists(path))
+            finally:
+                exporter.close()
+
+            with open(path) as f:
+                snapshot = json.load(f)
+            self.assertEqual(snapshot['metrics']['records_total']['samples'], [{'labels': {}, 'value': 7}])
+
+if __name__ == '__main__':
+    unittest.main()
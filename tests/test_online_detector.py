@@ -0,0 +1,54 @@
+import unittest
+import numpy as np
+import pandas as pd
+from src.online_detector import OnlineStatisticalDetector
+
+
+class TestOnlineStatisticalDetector(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.data = pd.DataFrame({
+            'service': rng.choice(['web-server', 'database'], size=600),
+            'cpu_usage': rng.normal(50, 10, 600),
+            'latency': rng.normal(100, 20, 600)
+        })
+        # The database runs hotter, so a spike is relative to each service's own baseline
+        self.data.loc[self.data['service'] == 'database', 'cpu_usage'] += 30
+        self.data.loc[500, ['service', 'cpu_usage']] = ['web-server', 95]
+
+    def test_vectorized_matches_record_updates(self):
+        """Test that batch scoring equals scoring the records one at a time, across batches"""
+        batched = OnlineStatisticalDetector(min_count=10)
+        scores = np.concatenate([batched.score(self.data.iloc[:250]), batched.score(self.data.iloc[250:])])
+
+        single = OnlineStatisticalDetector(min_count=10)
+        expected = [
+            max(single.update(row.service, [row.cpu_usage, row.latency]))
+            for row in self.data.itertuples()
+        ]
+        np.testing.assert_allclose(scores, expected, rtol=1e-9, atol=1e-9)
+        self.assertGreater(scores[500], 3.0, "Should flag the web-server CPU spike")
+
+    def test_modes_flag_spike(self):
+        """Test that EWMA and rolling-window statistics also flag the spike"""
+        for mode in ('ewma', 'window'):
+            detector = OnlineStatisticalDetector(mode=mode, alpha=0.05, window=100, min_count=10)
+            scores = detector.score(self.data)
+            self.assertGreater(scores[500], 3.0, mode)
+            self.assertLessEqual(len(detector.state['database'].get('values', [])), 100)
+
+    def test_snapshot_restore(self):
+        """Test that a restored detector continues exactly where the original stopped"""
+        for mode in ('welford', 'ewma', 'window'):
+            detector = OnlineStatisticalDetector(mode=mode, window=50, min_count=10)
+            detector.score(self.data.iloc[:300])
+            restored = OnlineStatisticalDetector.restore(detector.snapshot())
+            np.testing.assert_allclose(
+                restored.score(self.data.iloc[300:]),
+                detector.score(self.data.iloc[300:])
+            )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+import unittest
+from collections import deque
+import pandas as pd
+from src.data_generator import SyntheticDataGenerator
+from src.sqs_handler import SQSHandler
+from src import payload
+from config import settings
+
+
+class TestPayload(unittest.TestCase):
+
+    def setUp(self):
+        generator = SyntheticDataGenerator(seed=3)
+        generator.size = 500
+        self.df = generator.generate_data()
+
+    def _fallback_sqs(self):
+        sqs = SQSHandler()
+        sqs.queue_url, sqs.messages = None, deque()
+        return sqs
+
+    def test_packed_round_trip(self):
+        """Test that packed messages stay under the size limit and decode to the same records"""
+        sqs = self._fallback_sqs()
+        saved = settings.SQS_PAYLOAD_FORMAT, settings.SQS_MESSAGE_GROUP_KEY, settings.SQS_RECORDS_PER_MESSAGE
+        settings.SQS_PAYLOAD_FORMAT, settings.SQS_MESSAGE_GROUP_KEY, settings.SQS_RECORDS_PER_MESSAGE = 'arrow', 'service', 60
+        try:
+            response = sqs.send_frame(self.df)
+        finally:
+            settings.SQS_PAYLOAD_FORMAT, settings.SQS_MESSAGE_GROUP_KEY, settings.SQS_RECORDS_PER_MESSAGE = saved
+
+        # Far fewer messages than records, each holding a single service
+        self.assertLess(len(response['Successful']), len(self.df) // 10)
+        messages = sqs.receive_messages(max_messages=len(self.df))
+        self.assertTrue(all(len(m['Body']) <= payload.MAX_MESSAGE_BYTES for m in messages))
+        for message in messages:
+            self.assertEqual(len(set(payload.unpack([message['Body']])['service'])), 1)
+
+        # Grouping reorders records across services, so compare in trace and time order
+        order = ['trace_id', 'timestamp', 'cpu_usage', 'latency']
+        received = sqs.to_frame(messages).sort_values(order).reset_index(drop=True)
+        pd.testing.assert_frame_equal(received, self.df.sort_values(order).reset_index(drop=True))
+
+    def test_pack_respects_size_limit(self):
+        """Test that pack() splits a frame that does not fit into one message"""
+        bodies = list(payload.pack(self.df, max_bytes=4096))
+        self.assertGreater(len(bodies), 1)
+        self.assertTrue(all(len(body) <= 4096 for body in bodies))
+        pd.testing.assert_frame_equal(payload.unpack(bodies), self.df.reset_index(drop=True))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+import json
+import os
+import queue
+import tempfile
+import threading
+import time
+import unittest
+from src.pipeline import Stage, JsonArraySink, run_stages
+
+
+class TestPipeline(unittest.TestCase):
+
+    def test_stages_overlap_with_backpressure(self):
+        """Test that a slow consumer bounds how far the producer can run ahead"""
+        produced = []
+        consumed = []
+        lead = []
+        inbox = queue.Queue(maxsize=2)
+
+        def produce():
+            for i in range(10):
+                produced.append(i)
+                lead.append(len(produced) - len(consumed))
+                yield i
+
+        def consume(item):
+            time.sleep(0.01)
+            consumed.append(item)
+
+        run_stages([Stage('produce', produce, outbox=inbox), Stage('consume', consume, inbox=inbox)])
+
+        self.assertEqual(consumed, list(range(10)))
+        self.assertLessEqual(max(lead), 4)
+
+    def test_failure_stops_pipeline(self):
+        """Test that a failing stage stops its neighbours and re-raises"""
+        stop_event = threading.Event()
+        inbox = queue.Queue(maxsize=1)
+
+        def produce():
+            while True:
+                yield 1
+
+        def fail(item):
+            raise ValueError("boom")
+
+        with self.assertRaises(ValueError):
+            run_stages([
+                Stage('produce', produce, outbox=inbox, stop_event=stop_event),
+                Stage('fail', fail, inbox=inbox, stop_event=stop_event)
+            ])
+
+    def test_json_array_sink(self):
+        """Test that incremental writes produce a valid JSON array"""
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'anomalies.json')
+            sink = JsonArraySink(path)
+            sink.write([{'anomaly_id': 1}])
+            sink.write([])
+            sink.write([{'anomaly_id': 2}, {'anomaly_id': 3}])
+            sink.close()
+            with open(path) as f:
+                self.assertEqual([c['anomaly_id'] for c in json.load(f)], [1, 2, 3])
+
+            empty = JsonArraySink(path)
+            empty.close()
+            with open(path) as f:
+                self.assertEqual(json.load(f), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+import json
+import unittest
+from collections import deque
+import pandas as pd
+from src.data_generator import SyntheticDataGenerator
+from src.sqs_handler import SQSHandler
+from src import schema
+from config import settings
+
+
+class TestSchema(unittest.TestCase):
+
+    def setUp(self):
+        generator = SyntheticDataGenerator(seed=3)
+        generator.size = 500
+        self.df = generator.generate_data()
+
+    def _fallback_sqs(self):
+        sqs = SQSHandler()
+        sqs.queue_url, sqs.messages = None, deque()
+        return sqs
+
+    def test_sqs_round_trip(self):
+        """Test that records keep their values and compact dtypes through SQS serialization"""
+        sqs = self._fallback_sqs()
+        payload_format = settings.SQS_PAYLOAD_FORMAT
+        settings.SQS_PAYLOAD_FORMAT = 'json'
+        try:
+            sqs.send_frame(self.df)
+        finally:
+            settings.SQS_PAYLOAD_FORMAT = payload_format
+
+        messages = sqs.receive_messages(max_messages=len(self.df))
+        body = json.loads(messages[0]['Body'])
+        self.assertIsInstance(body['trace_id'], int)
+        self.assertIsInstance(body['service'], str)
+
+        received = sqs.to_frame(messages)
+        pd.testing.assert_frame_equal(received, self.df.reset_index(drop=True))
+
+    def test_missing_spans_serialize_as_null(self):
+        """Test that masked span ids become JSON nulls"""
+        records = schema.to_records(self.df)
+        missing = self.df['span_id'].isna().to_numpy()
+        self.assertTrue(all(r['span_id'] is None for r, m in zip(records, missing) if m))
+        self.assertTrue(all(isinstance(r['span_id'], int) for r, m in zip(records, missing) if not m))
+
+    def test_render_messages(self):
+        """Test that message templates expand to the per-record text"""
+        messages = schema.render_messages(self.df)
+        row = self.df.iloc[0]
+        expected = schema.MESSAGE_TEMPLATES[row['message_id']].format(service=row['service'], timestamp=row['timestamp'].isoformat())
+        self.assertEqual(messages.iloc[0], expected)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,112 @@
+import os
+import json
+import unittest
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+from src.anomaly_detector import AnomalyDetector, ModelVersionError
+from src.data_generator import SyntheticDataGenerator
+from src.sharding import SHARDS_MANIFEST, ShardedDetector, shard_ids
+
+class TestSharding(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        generator = SyntheticDataGenerator(seed=7)
+        generator.size = 2000
+        cls.data = generator.generate_data()
+        cls.detector = ShardedDetector(n_shards=2, key='service', ensemble=['statistical'], min_votes=1)
+        cls.detector.fit(cls.data)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.detector.close()
+
+    def test_shard_ids_are_stable(self):
+        """Every record of a service lands on the same shard, whatever the category order"""
+        ids = shard_ids(self.data, 4, 'service')
+        shuffled = self.data.assign(service=self.data['service'].astype(str))
+        np.testing.assert_array_equal(ids, shard_ids(shuffled, 4, 'service'))
+        for _, shards in pd.Series(ids).groupby(self.data['service'].astype(str).to_numpy()):
+            self.assertEqual(shards.nunique(), 1)
+
+        trace_ids = shard_ids(self.data, 4, 'trace_id')
+        self.assertTrue(set(np.unique(trace_ids)) <= {0, 1, 2, 3})
+        np.testing.assert_array_equal(trace_ids, shard_ids(self.data, 4, 'trace_id'))
+
+    def test_flags_match_per_shard_detectors(self):
+        """Merged flags are in record order and equal fitting one detector per shard"""
+        result = self.detector.score(self.data)
+        self.assertEqual(len(result), len(self.data))
+
+        ids = shard_ids(self.data, 2, 'service')
+        expected = np.zeros(len(self.data), dtype=np.int8)
+        for shard in np.unique(ids):
+            rows = ids == shard
+            # Shards receive the features as float64, so the reference fit does too
+            subset = self.data.loc[rows, AnomalyDetector.FEATURES].astype(np.float64).reset_index(drop=True)
+            detector = AnomalyDetector(ensemble=['statistical'], min_votes=1).fit(subset)
+            expected[rows] = detector.score(subset)['combined']
+        np.testing.assert_array_equal(result['combined'], expected)
+
+    def test_concurrent_scoring(self):
+        """Consumer threads scoring at the same time each get the result for their own batch"""
+        batches = [self.data.iloc[start:start + 250].reset_index(drop=True) for start in range(0, len(self.data), 250)]
+        expected = [self.detector.score(batch)['combined'] for batch in batches]
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            for _ in range(3):
+                results = list(pool.map(self.detector.score, batches))
+                for result, combined in zip(results, expected):
+                    np.testing.assert_array_equal(result['combined'], combined)
+
+    def test_shard_without_reference_records(self):
+        """A shard whose key is missing from the reference window falls back to a model of the whole window"""
+        ids = shard_ids(self.data, 2, 'service')
+        reference = self.data[ids == 0].reset_index(drop=True)
+        detector = ShardedDetector(n_shards=2, key='service', ensemble=['statistical'], min_votes=1)
+        try:
+            detector.fit(reference)
+            self.assertEqual(detector.fitted_shards, {0, 1})
+
+            later = self.data[ids == 1].reset_index(drop=True)
+            whole = AnomalyDetector(ensemble=['statistical'], min_votes=1).fit(
+                reference[AnomalyDetector.FEATURES].astype(np.float64)
+            )
+            np.testing.assert_array_equal(
+                detector.score(later)['combined'],
+                whole.score(later[AnomalyDetector.FEATURES].astype(np.float64))['combined']
+            )
+        finally:
+            detector.close()
+
+    def test_save_and_load(self):
+        """A loaded sharded detector scores like the one that was saved"""
+        with tempfile.TemporaryDirectory() as model_dir:
+            self.detector.save(model_dir)
+            loaded = ShardedDetector.load(model_dir, ensemble=['statistical'])
+            try:
+                np.testing.assert_array_equal(
+                    loaded.score(self.data)['combined'], self.detector.score(self.data)['combined']
+                )
+            finally:
+                loaded.close()
+
+    def test_partially_fitted_save_is_refitted(self):
+        """A save with unfitted shards (from before every shard was fitted) has to be refitted"""
+        with tempfile.TemporaryDirectory() as model_dir:
+            self.detector.save(model_dir)
+            path = os.path.join(model_dir, SHARDS_MANIFEST)
+            with open(path) as f:
+                manifest = json.load(f)
+            with open(path, 'w') as f:
+                json.dump(dict(manifest, fitted=[0]), f)
+            with self.assertRaises(ModelVersionError):
+                ShardedDetector.load(model_dir, ensemble=['statistical'])
+
+    def test_unknown_key(self):
+        with self.assertRaises(ValueError):
+            ShardedDetector(n_shards=2, key='host')
+
+if __name__ == '__main__':
+    unittest.main()
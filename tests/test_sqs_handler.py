@@ -0,0 +1,144 @@
+import os
+import unittest
+import tempfile
+from src.local_queue import LocalQueueClient
+from src.sqs_handler import SQSHandler
+from config import settings
+
+
+class FlakySQSClient:
+    """Records batch calls and fails the first entry of the first call, unless fail_first is False"""
+
+    def __init__(self, fail_first=True):
+        self.calls = []
+        self.fail_first = fail_first
+
+    def _batch(self, QueueUrl, Entries):
+        self.calls.append(list(Entries))
+        if self.fail_first and len(self.calls) == 1:
+            return {
+                'Successful': [{'Id': entry['Id']} for entry in Entries[1:]],
+                'Failed': [{'Id': Entries[0]['Id'], 'SenderFault': False}]
+            }
+        return {'Successful': [{'Id': entry['Id']} for entry in Entries], 'Failed': []}
+
+    send_message_batch = _batch
+    delete_message_batch = _batch
+
+
+class UnreachableSQSClient:
+    """Fails every call, like a client without credentials or network"""
+
+    def create_queue(self, **kwargs):
+        raise ConnectionError('SQS is unreachable')
+
+
+class TestSQSHandler(unittest.TestCase):
+
+    def setUp(self):
+        self.sqs = SQSHandler()
+        self.backoff = settings.SQS_BATCH_RETRY_BACKOFF
+        settings.SQS_BATCH_RETRY_BACKOFF = 0
+
+    def tearDown(self):
+        settings.SQS_BATCH_RETRY_BACKOFF = self.backoff
+
+    def test_groups_share_calls(self):
+        """Test that consecutive entries of one message group go out ten to a call"""
+        self.sqs.queue_url = 'queue'
+        key = settings.SQS_MESSAGE_GROUP_KEY
+        try:
+            settings.SQS_MESSAGE_GROUP_KEY = 'service'
+            for services in (1, 2):
+                self.sqs.sqs = FlakySQSClient(fail_first=False)
+                self.sqs.send_messages_batch([{'id': i, 'service': f'service-{i % services}'} for i in range(40)])
+                self.assertEqual([len(entries) for entries in self.sqs.sqs.calls], [10, 10, 10, 10], services)
+        finally:
+            settings.SQS_MESSAGE_GROUP_KEY = key
+
+    def test_in_memory_fallback(self):
+        """Test that the fallback queue delivers batches in order"""
+        self.sqs.sqs = UnreachableSQSClient()
+        self.sqs.create_queue('unused')
+        self.assertIsNone(self.sqs.queue_url)
+        response = self.sqs.send_messages_batch([{'id': i} for i in range(25)])
+        self.assertEqual(len(response['Successful']), 25)
+
+        received = []
+        while True:
+            messages = self.sqs.receive_messages(max_messages=10)
+            if not messages:
+                break
+            received.extend(messages)
+            self.sqs.delete_messages_batch(messages)
+        self.assertEqual([m['Body'] for m in received], [f'{{"id": {i}}}' for i in range(25)])
+
+    def test_batches_of_ten_with_retry(self):
+        """Test that calls carry at most 10 entries and failed entries are retried"""
+        self.sqs.sqs = FlakySQSClient()
+        self.sqs.queue_url = 'queue'
+
+        response = self.sqs.delete_messages_batch([{'ReceiptHandle': str(i)} for i in range(23)])
+
+        self.assertEqual(len(response['Successful']), 23)
+        self.assertEqual(response['Failed'], [])
+        # The failed entry goes out again with the next call
+        self.assertEqual([len(entries) for entries in self.sqs.sqs.calls], [10, 10, 4])
+        self.assertEqual(self.sqs.sqs.calls[1][0]['Id'], '0')
+
+    def test_retries_keep_group_order(self):
+        """Test that a failed entry is resent before the rest of its message group"""
+        self.sqs.sqs = FlakySQSClient()
+        self.sqs.queue_url = 'queue'
+        key = settings.SQS_MESSAGE_GROUP_KEY
+        try:
+            settings.SQS_MESSAGE_GROUP_KEY = 'service'
+            response = self.sqs.send_messages_batch([{'id': i, 'service': f'service-{i % 3}'} for i in range(12)])
+        finally:
+            settings.SQS_MESSAGE_GROUP_KEY = key
+
+        self.assertEqual(len(response['Successful']), 12)
+        # Entry 0 failed, so the rest of its group (3, 6, 9) goes out again behind it; the
+        # other groups are not resent
+        self.assertEqual(
+            [[int(entry['Id']) for entry in entries] for entries in self.sqs.sqs.calls],
+            [list(range(10)), [0, 3, 6, 9, 10, 11]]
+        )
+        accepted = [int(entry['Id']) for entry in response['Successful']]
+        for service in range(3):
+            ids = [i for i in accepted if i % 3 == service]
+            self.assertEqual(ids, sorted(ids))
+
+    def test_local_backend(self):
+        """Test the SQLite backend behind the SQSHandler interface, including redelivery"""
+        with tempfile.TemporaryDirectory() as tmp:
+            self.sqs.sqs = LocalQueueClient(os.path.join(tmp, 'queue.db'))
+            self.sqs.create_queue('local-queue')
+            self.assertTrue(self.sqs.queue_url.startswith('local://'))
+            self.sqs.send_messages_batch([{'id': i} for i in range(15)])
+
+            received = self.sqs.receive_messages(max_messages=10, wait_time_seconds=0)
+            self.assertEqual([m['Body'] for m in received], [f'{{"id": {i}}}' for i in range(10)])
+            response = self.sqs.delete_messages_batch(received)
+            self.assertEqual(len(response['Successful']), 10)
+
+            # Same message group, so the rest is delivered once the first batch is deleted
+            rest = self.sqs.receive_messages(max_messages=10, wait_time_seconds=0)
+            self.assertEqual(len(rest), 5)
+
+    def test_message_groups(self):
+        """Test that records are grouped by service or trace hash instead of one FIFO group"""
+        key = settings.SQS_MESSAGE_GROUP_KEY
+        try:
+            settings.SQS_MESSAGE_GROUP_KEY = 'service'
+            self.assertEqual(self.sqs._group_id({'service': 'database', 'trace_id': 3}), 'service-database')
+            settings.SQS_MESSAGE_GROUP_KEY = 'trace_id'
+            self.assertEqual(self.sqs._group_id({'service': 'database', 'trace_id': 35}), 'trace-3')
+            settings.SQS_MESSAGE_GROUP_KEY = None
+            self.assertEqual(self.sqs._group_id({'service': 'database'}), 'anomaly-detection')
+        finally:
+            settings.SQS_MESSAGE_GROUP_KEY = key
+
+
+if __name__ == '__main__':
+    unittest.main()
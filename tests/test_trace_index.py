@@ -0,0 +1,114 @@
+import unittest
+import tempfile
+import numpy as np
+import pandas as pd
+from src.anomaly_detector import AnomalyDetector
+from src.data_generator import SyntheticDataGenerator
+from src.sharding import ShardedDetector
+from src.trace_index import TraceIndex
+from config import settings
+
+
+def spans(trace_ids, span_ids, seconds):
+    return pd.DataFrame({
+        'timestamp': pd.Timestamp('2024-01-01') + pd.to_timedelta(seconds, unit='s'),
+        'trace_id': np.array(trace_ids, dtype=np.int64),
+        'span_id': pd.array(span_ids, dtype='Int64')
+    })
+
+
+class TestTraceIndex(unittest.TestCase):
+
+    def test_missing_span_breaks_its_trace(self):
+        """Test that a missing span flags every record of its trace, also in later batches"""
+        index = TraceIndex(ttl=60, max_traces=100)
+        first = index.score(spans([1, 1, 2, 3], [10, None, 20, 30], [0, 1, 2, 3]))
+        self.assertEqual(first.tolist(), [1, 1, 0, 0])
+
+        later = index.score(spans([1, 2], [11, 21], [4, 5]))
+        self.assertEqual(later.tolist(), [1, 0])
+        self.assertEqual(index.broken_traces(), [1])
+
+    def test_ttl_and_lru_eviction(self):
+        """Test that idle traces expire and the index never holds more than max_traces"""
+        index = TraceIndex(ttl=10, max_traces=3)
+        index.score(spans([1, 2], [10, None], [0, 0]))
+        index.score(spans([3], [30], [20]))
+        # Traces 1 and 2 were idle for 20s > ttl, so trace 2 is no longer known as broken
+        self.assertEqual(list(index.traces), [3])
+        self.assertEqual(index.score(spans([2], [21], [21])).tolist(), [0])
+
+        index.score(spans([4, 5, 6], [40, 50, 60], [22, 22, 22]))
+        self.assertEqual(len(index.traces), 3)
+        self.assertEqual(list(index.traces), [4, 5, 6])
+
+    def test_votes_in_ensemble(self):
+        """Test that the trace detector flags exactly the records of traces with a dropped span"""
+        generator = SyntheticDataGenerator(seed=5)
+        generator.size = 1000
+        data = generator.generate_data()
+        detector = AnomalyDetector(ensemble=['statistical', 'trace_index'], min_votes=1).fit(data)
+        result = detector.score(data)
+        missing = data['span_id'].isna()
+        broken = data['trace_id'].isin(data.loc[missing, 'trace_id']).to_numpy()
+        self.assertGreater(broken.sum(), missing.sum())
+        np.testing.assert_array_equal(result['trace_index'], broken.astype(np.int8))
+        self.assertTrue(np.all(result.combined[broken] == 1))
+
+    def test_missing_span_flags_without_second_vote(self):
+        """Test that a trace detector flag marks the record even below DETECTOR_MIN_VOTES"""
+        generator = SyntheticDataGenerator(seed=5)
+        generator.size = 1000
+        data = generator.generate_data()
+        detector = AnomalyDetector(ensemble=['statistical', 'trace_index'], min_votes=2).fit(data)
+        result = detector.score(data)
+        missing = data['span_id'].isna().to_numpy()
+        self.assertTrue(np.all(result.combined[missing] == 1))
+        # Without the decisive path, only rows with both votes would be flagged
+        both = (result['statistical'] == 1) & (result['trace_index'] == 1)
+        self.assertGreater(missing.sum(), both.sum())
+        np.testing.assert_array_equal(result.with_thresholds().combined, result.combined)
+
+        saved = settings.DECISIVE_DETECTORS
+        settings.DECISIVE_DETECTORS = []
+        try:
+            voted = detector.score(data)
+        finally:
+            settings.DECISIVE_DETECTORS = saved
+        np.testing.assert_array_equal(voted.combined, voted.votes >= 2)
+
+    def test_cascade_keeps_decisive_flags(self):
+        """Test that the cascade settles trace-flagged rows in the first stage"""
+        generator = SyntheticDataGenerator(seed=5)
+        generator.size = 300
+        data = generator.generate_data()
+        ensemble = ['statistical', 'isolation_forest', 'one_class_svm', 'trace_index']
+        saved = settings.DETECTOR_CASCADE
+        try:
+            settings.DETECTOR_CASCADE = False
+            expected = AnomalyDetector(ensemble=ensemble, min_votes=2).fit(data).score(data)
+            settings.DETECTOR_CASCADE = True
+            result = AnomalyDetector(ensemble=ensemble, min_votes=2).fit(data).score(data)
+        finally:
+            settings.DETECTOR_CASCADE = saved
+        np.testing.assert_array_equal(result.combined, expected.combined)
+        self.assertIn('trace_index', list(result.stage_fractions)[0])
+
+    def test_sharding_requires_trace_key(self):
+        """Test that sharding by service is refused while the trace detector is enabled"""
+        with self.assertRaises(ValueError):
+            ShardedDetector(n_shards=2, key='service', ensemble=['statistical', 'trace_index'])
+
+    def test_loads_from_version_saved_without_it(self):
+        """Test that enabling the trace detector does not invalidate versions saved before"""
+        generator = SyntheticDataGenerator(seed=5)
+        generator.size = 200
+        data = generator.generate_data()
+        with tempfile.TemporaryDirectory() as model_dir:
+            AnomalyDetector(ensemble=['statistical'], min_votes=1).fit(data).save(model_dir)
+            detector = AnomalyDetector.load(model_dir, ensemble=['statistical', 'trace_index'])
+            self.assertEqual(list(detector.detectors), ['statistical', 'trace_index'])
+            self.assertEqual(len(detector.score(data)), len(data))
+
+if __name__ == '__main__':
+    unittest.main()